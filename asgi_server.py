@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+import anyio
+import filetype
+import uvicorn
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from starlette.responses import Response, FileResponse, StreamingResponse
+from starlette.routing import Route, Mount
+from python_multipart.multipart import MultipartParser, parse_options_header
+from werkzeug.http import parse_etags
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # Starlette's own version is deprecated but still there
+    from starlette.middleware.wsgi import WSGIMiddleware
+
+import server as core
+from transfer import file_etag
+from metrics import request_seconds, bytes_in, bytes_out
+from config import ip_address, retry_after, long_poll_timeout, lease_ttl, async_blocking_threads, work_poll_interval
+
+# Asyncio serving mode: python asgi_server.py instead of python server.py (needs starlette, uvicorn and
+# python-multipart). Worker routes run on the event loop, so a slow download or upload is a coroutine
+# waiting for its socket instead of a thread. Files are sent and received in chunks with backpressure,
+# SQLite, Blender and zip work goes to the thread pool. Everything else (dashboard, logs, chunked uploads,
+# metrics) is the Flask app from server.py mounted behind it
+UPLOAD_CHUNK_SIZE = 2 ** 20
+
+
+def json_response(body, status=200, headers=None):
+    return Response(json.dumps(body), status, headers=headers, media_type="application/json")
+
+
+def request_token(request):
+    return request.headers.get("lease_token") or request.query_params.get("token")
+
+
+class WorkSignal:
+    # Wakes long polling requests whenever server.notify_workers() runs. A thread waits on the
+    # condition the Flask routes use and sets an asyncio event, waiters take the event before claiming
+    def __init__(self):
+        self.loop = None
+        self.event = None
+
+    def start(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            with core.work_available:
+                core.work_available.wait(work_poll_interval)  # Also rechecks for work from other servers
+            self.loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        self.event.set()
+        self.event = asyncio.Event()
+
+
+work_signal = WorkSignal()
+
+
+class UploadWriter:
+    # Streams the "file" field of a multipart body to output_dir, nothing but the current chunk is kept in memory.
+    # rename(uploaded file name) gives the name it's saved under
+    def __init__(self, output_dir, rename=os.path.basename):
+        self.output_dir = output_dir
+        self.rename = rename
+        self.header_field = b""
+        self.header_value = b""
+        self.headers = dict()
+        self.in_file = False
+        self.file_name = None
+        self.file = None
+        self.pending = bytearray()
+
+    def on_part_begin(self):
+        self.headers = dict()
+        self.header_field = self.header_value = b""
+
+    def on_header_field(self, data, start, end):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = self.header_value = b""
+
+    def on_headers_finished(self):
+        disposition, options = parse_options_header(self.headers.get(b"content-disposition", b""))
+        self.in_file = options.get(b"name") == b"file" and self.file_name is None
+        if self.in_file:
+            self.file_name = self.rename(options.get(b"filename", b"file").decode())
+
+    def on_part_data(self, data, start, end):
+        if self.in_file:
+            self.pending += data[start:end]
+
+    def on_part_end(self):
+        self.in_file = False
+
+    def flush(self):  # Runs in the thread pool
+        if self.file is None:
+            self.file = open(os.path.join(self.output_dir, self.file_name), "wb")
+        self.file.write(self.pending)
+        self.pending = bytearray()
+
+    async def receive(self, request, name):  # Path of the saved file, None when the body has no file field
+        boundary = parse_options_header(request.headers.get("content-type", ""))[1].get(b"boundary")
+        if boundary is None:
+            return None
+
+        parser = MultipartParser(boundary, {callback: getattr(self, callback) for callback in
+                                            ["on_part_begin", "on_header_field", "on_header_value", "on_header_end",
+                                             "on_headers_finished", "on_part_data", "on_part_end"]})
+        try:
+            async for chunk in request.stream():
+                bytes_in.inc(len(chunk), name)
+                parser.write(chunk)
+                if len(self.pending) >= UPLOAD_CHUNK_SIZE:
+                    await run_in_threadpool(self.flush)
+            parser.finalize()
+            if self.file_name is not None:
+                await run_in_threadpool(self.flush)
+        finally:
+            if self.file is not None:
+                await run_in_threadpool(self.file.close)
+
+        return os.path.join(self.output_dir, self.file_name) if self.file_name is not None else None
+
+
+async def claim_task(name, can_do_images, can_do_models, wait):
+    deadline = time.monotonic() + wait
+    while True:
+        event = work_signal.event  # Taken before claiming, so a notification in between isn't missed
+        task = await run_in_threadpool(core.claim_task, name, can_do_images, can_do_models)
+        remaining = deadline - time.monotonic()
+        if task is not None or remaining <= 0:
+            return task
+
+        try:
+            await asyncio.wait_for(event.wait(), min(remaining, work_poll_interval))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def send_task(request, name, task, token):
+    archive_format = request.query_params.get("format", "zip")
+    headers = core.task_headers(task, token)
+    if task.type == "render":
+        path = await run_in_threadpool(core.prepared_model, name, task)
+        mimetype = await run_in_threadpool(filetype.guess_mime, path)
+    else:
+        files, path = await run_in_threadpool(core.render_archive_source, task, archive_format)
+        headers["archive_format"] = "pack" if files and archive_format == "pack" else "zip"
+        if files:
+            core.log_sent(name, task)
+            chunks, mimetype, file_name = core.render_stream(files, archive_format)
+            headers["Content-Disposition"] = f"attachment; filename={file_name}"
+            return StreamingResponse(iterate_in_threadpool(chunks), headers=headers, media_type=mimetype)
+        mimetype = "application/zip"
+
+    if not os.path.exists(path):
+        return json_response({'success': False}, 404)
+
+    etag = await run_in_threadpool(file_etag, path)
+    headers["etag"] = f'"{etag}"'
+    core.log_sent(name, task)
+    if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):  # Worker has the file already
+        return Response(status_code=304, headers=headers)
+
+    bytes_out.inc(os.path.getsize(path), name)
+    return FileResponse(path, headers=headers, media_type=mimetype, filename=os.path.basename(path))
+
+
+async def get_task(request):
+    start = time.perf_counter()
+    name = request.path_params["name"]
+    can_do_images = request.path_params["can_do_images"] == "true"
+    can_do_models = request.path_params["can_do_models"] == "true"
+
+    lease = await run_in_threadpool(core.leases.renew, name)
+    if lease is not None:
+        print("Job for this client already found, restoring last request")
+    else:
+        try:
+            wait = min(max(float(request.query_params.get("wait", 0)), 0), long_poll_timeout)
+        except ValueError:
+            wait = 0
+        if await claim_task(name, can_do_images, can_do_models, wait) is None:
+            return json_response({'success': False, 'retry_after': retry_after}, 503, {'Retry-After': str(retry_after)})
+        lease = await run_in_threadpool(core.leases.get, name)
+
+    response = await send_task(request, name, lease.task, lease.token)
+    # Observed once the body is sent, so the file transfer counts in the request time
+    response.background = BackgroundTask(lambda: request_seconds.observe(time.perf_counter() - start, "get_task"))
+    return response
+
+
+async def submit_task(request):
+    start = time.perf_counter()
+    name, task_type = request.path_params["name"], request.path_params["task_type"]
+    if request.method == "POST":
+        token = request_token(request)
+        task = await run_in_threadpool(core.leased_task, name, token)
+        if task is None:  # No task or the lease expired and the task went to someone else
+            return json_response({'success': False}, 409)
+        if task.type != task_type:  # The lease decides the stage, a result for the other one would be filed wrongly
+            return json_response({'success': False, 'error': f"Leased task is {task.type}"}, 400)
+
+        output_dir = core.task_output_dir(task.id)
+        await run_in_threadpool(os.makedirs, output_dir, exist_ok=True)
+        writer = UploadWriter(output_dir, lambda file_name: core.upload_name(task, file_name))
+        full_file_path = await writer.receive(request, name)
+        if full_file_path is None:
+            return json_response({'success': False}, 400)
+
+        await run_in_threadpool(core.start_extraction, name, task, full_file_path, token)
+
+    request_seconds.observe(time.perf_counter() - start, "submit_task")
+    return json_response({'success': True})
+
+
+async def heartbeat(request):
+    lease = await run_in_threadpool(core.leases.renew, request.path_params["name"], request_token(request))
+    if lease is None:
+        return json_response({'success': False}, 409)
+
+    return json_response({'success': True, 'task_id': lease.task.id, 'expires_in': lease_ttl})
+
+
+async def skip(request):
+    skipped = await run_in_threadpool(core.skip_task, request.path_params["name"], request_token(request))
+    return json_response({'success': skipped}, 200 if skipped else 400)
+
+
+async def disconnect(request):
+    requeued = await run_in_threadpool(core.requeue_task, request.path_params["name"], request_token(request))
+    return json_response({'success': requeued}, 200 if requeued else 400)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = async_blocking_threads
+    work_signal.start(asyncio.get_running_loop())
+    yield
+
+
+app = Starlette(routes=[
+    Route('/get_task/{name}/{can_do_images}/{can_do_models}', get_task),
+    Route('/submit_task/{name}/{task_type}', submit_task, methods=['GET', 'POST']),
+    Route('/heartbeat/{name}', heartbeat, methods=['GET', 'POST']),
+    Route('/skip/{name}', skip),
+    Route('/disconnect/{name}', disconnect),
+    Mount('/', WSGIMiddleware(core.app)),
+], lifespan=lifespan)
+
+
+if __name__ == "__main__":
+    args = core.parse_args()
+    for needed_dir in ["done/", "input/", "output/", "temp/"]:
+        os.makedirs(needed_dir, exist_ok=True)
+
+    core.load_tasks(args.node, args.port)
+    core.app.secret_key = 'token'
+
+    uvicorn.run(app, host=ip_address, port=args.port)
@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from blender_pool import BlenderPool
+from cache import file_sha256
+import config
+
+# Exports every scanned model in output/ to export/<model>_input.obj (scene.gltf through Blender) and
+# export/<model>_output.obj (copy of export.obj), on a pool of bpy processes. export/manifest.json remembers
+# the input hashes and output mtimes of every exported model, so models that didn't change are skipped and
+# an interrupted run continues where it stopped. Timings and failures end up in export/summary.json
+#   python batch_export.py [--workers N] [--force] [--output output/] [--export export/]
+MANIFEST_FILE = "manifest.json"
+SUMMARY_FILE = "summary.json"
+INPUT_FILES = ["scene.gltf", "scene.bin", "export.obj"]
+
+
+def input_hash(output_dir):  # Hash over all inputs of one model, files that don't exist count as empty
+    sha256 = hashlib.sha256()
+    for file_name in INPUT_FILES:
+        path = os.path.join(output_dir, file_name)
+        sha256.update(f"{file_name}:{file_sha256(path) if os.path.exists(path) else ''};".encode())
+
+    return sha256.hexdigest()
+
+
+def output_mtimes(paths):  # {path: mtime in ns}, None when an output is missing
+    try:
+        return {path: os.stat(path).st_mtime_ns for path in paths}
+    except FileNotFoundError:
+        return None
+
+
+def export_paths(export_dir, dir_name):
+    prefix = dir_name.split('_')[0]
+    return os.path.join(export_dir, prefix + "_input.obj"), os.path.join(export_dir, prefix + "_output.obj")
+
+
+class Manifest:
+    # {dir name: {"input_hash", "outputs": {path: mtime}}}, rewritten after every model so a killed run loses nothing
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as file:
+                self.entries = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.entries = dict()
+
+    def up_to_date(self, dir_name, content_hash, outputs):
+        entry = self.entries.get(dir_name)
+        return entry is not None and entry["input_hash"] == content_hash and entry["outputs"] == output_mtimes(outputs)
+
+    def record(self, dir_name, content_hash, outputs):
+        with self.lock:
+            self.entries[dir_name] = {"input_hash": content_hash, "outputs": output_mtimes(outputs)}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as file:
+                json.dump(self.entries, file, indent=1)
+            os.replace(temp_path, self.path)
+
+
+def export_model(pool, manifest, output_root, export_dir, dir_name, force):
+    output_dir = os.path.join(output_root, dir_name)
+    in_path = os.path.join(output_dir, "scene.gltf")
+    input_obj, output_obj = export_paths(export_dir, dir_name)
+    result = {"model": dir_name, "outputs": [input_obj, output_obj]}
+    start = time.perf_counter()
+
+    try:
+        content_hash = input_hash(output_dir)
+        result["timings"] = {"hash": time.perf_counter() - start}
+        if not force and manifest.up_to_date(dir_name, content_hash, [input_obj, output_obj]):
+            result["status"] = "skipped"
+            return result
+
+        print(f"Started processing file {dir_name}")
+        result["timings"].update(pool.export(os.path.abspath(in_path), os.path.abspath(input_obj))["timings"])
+
+        copy_start = time.perf_counter()
+        shutil.copy(os.path.join(output_dir, "export.obj"), output_obj)
+        result["timings"]["copy"] = time.perf_counter() - copy_start
+
+        manifest.record(dir_name, content_hash, [input_obj, output_obj])
+        result["status"] = "exported"
+    except Exception as e:
+        print(f"Export of {dir_name} failed: {e}")
+        result["status"] = "failed"
+        result["error"] = str(e)
+    finally:
+        result["seconds"] = time.perf_counter() - start
+
+    return result
+
+
+def exportable(output_root):  # Models the scan finished for, same check as the old export loop
+    return sorted(dir_name for dir_name in os.listdir(output_root)
+                  if os.path.exists(os.path.join(output_root, dir_name, "export.gltf"))
+                  and os.path.exists(os.path.join(output_root, dir_name, "scene.gltf")))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export scanned models to OBJ")
+    parser.add_argument("--workers", type=int, default=config.blender_pool_size, help="bpy processes")
+    parser.add_argument("--force", action="store_true", help="Export again even when nothing changed")
+    parser.add_argument("--output", default="output/", help="Directory with the scanned models")
+    parser.add_argument("--export", default="export/", help="Directory the OBJ files are written to")
+    args = parser.parse_args()
+
+    os.makedirs(args.export, exist_ok=True)
+    manifest = Manifest(os.path.join(args.export, MANIFEST_FILE))
+    pool = BlenderPool(config.python_call, args.workers, config.blender_pool_max_jobs, config.blender_pool_max_rss_mb)
+    dir_names = exportable(args.output)
+
+    start = time.perf_counter()
+    results = []
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(export_model, pool, manifest, args.output, args.export, dir_name, args.force)
+                       for dir_name in dir_names]
+            for future in as_completed(futures):
+                results.append(future.result())
+    finally:
+        pool.close()
+
+    results.sort(key=lambda result: result["model"])
+    counts = {status: sum(result["status"] == status for result in results) for status in ["exported", "skipped", "failed"]}
+    summary = {"models": len(dir_names), **counts, "seconds": time.perf_counter() - start, "results": results}
+    with open(os.path.join(args.export, SUMMARY_FILE), "w") as file:
+        json.dump(summary, file, indent=1)
+
+    print(json.dumps({key: value for key, value in summary.items() if key != "results"}))
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
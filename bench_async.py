@@ -0,0 +1,169 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import Counter
+
+from bench_dispatch import render_archive, post_file, free_port, percentile
+
+# Load test of the threaded Flask server against asgi_server.py with many slow workers: every worker
+# downloads its task file at a limited speed, like workers behind a slow link, while a probe measures
+# how fast a short request is answered. The server runs in a child process, its thread count and memory
+# are sampled from /proc. Blender preprocessing is replaced by writing a BLEND_MB file
+#   python bench_async.py [workers] [models]
+WORKERS = 200
+MODELS = 200
+BLEND_MB = 2
+READ_SIZE = 64 * 1024
+READ_DELAY = 0.01  # Seconds between reads, about 6 MB/s per worker
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve(mode, port, models):  # Child process
+    sys.path.insert(0, repo_dir)
+    for needed_dir in ["input/", "output/", "temp/"]:
+        os.mkdir(needed_dir)
+    for i in range(models):  # Distinct content, identical files would be served from the content cache
+        with open(os.path.join("input/", f"model_{i}.zip"), "wb") as model_file:
+            model_file.write(f"model_{i}".encode())
+
+    import server
+
+    def fake_prepare_model(task, output_blend_file, temp_dir):
+        with open(output_blend_file, "wb") as blend_file:
+            blend_file.write(os.urandom(BLEND_MB * 2 ** 20))
+
+    server.prepare_model = fake_prepare_model
+    server.load_tasks()
+
+    if mode == "flask":
+        from werkzeug.serving import make_server
+        make_server("127.0.0.1", port, server.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        import asgi_server
+        uvicorn.run(asgi_server.app, host="127.0.0.1", port=port, log_level="warning", backlog=2048)
+
+
+def slow_get(port, path):  # (status, headers), body read in small pieces with pauses
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        connection.request("GET", path)
+        response = connection.getresponse()
+        while response.read(READ_SIZE):
+            time.sleep(READ_DELAY)
+        return response.status, response.headers
+    finally:
+        connection.close()
+
+
+def worker(port, name, models, results, stop):
+    archive = render_archive()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            status, headers = slow_get(port, f"/get_task/{name}/true/true?wait=1")
+        except OSError:
+            with results["lock"]:
+                results["errors"] += 1
+            continue
+        if status == 503:
+            continue
+        if status != 200:
+            with results["lock"]:
+                results["errors"] += 1
+            continue
+        results["task_seconds"].append(time.perf_counter() - start)
+
+        stage = "render" if headers["task_type"] == "render" else "scan"
+        results["claims"].append((stage, headers["task_id"]))
+        post_file(f"http://127.0.0.1:{port}/submit_task/{name}/{stage}",
+                  "render.zip" if stage == "render" else "model.zip", archive)
+
+        with results["lock"]:
+            results["done"] += 1
+            if results["done"] >= 2 * models:
+                stop.set()
+
+
+def probe(port, latencies, stop):  # Short request answered between the transfers
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            connection.request("GET", "/heartbeat/probe")
+            connection.getresponse().read()
+            connection.close()
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            pass
+        time.sleep(0.05)
+
+
+def sample(pid, samples, stop):  # Threads and RSS of the server process
+    while not stop.is_set():
+        try:
+            with open(f"/proc/{pid}/status") as status:
+                fields = dict(line.split(":", 1) for line in status)
+            samples.append((int(fields["Threads"]), int(fields["VmRSS"].split()[0]) / 1024))
+        except OSError:
+            pass
+        time.sleep(0.1)
+
+
+def run(mode, workers=WORKERS, models=MODELS):
+    work_dir = tempfile.mkdtemp()
+    port = free_port()
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode, str(port), str(models)],
+                             cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(300):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        results = {"task_seconds": [], "claims": [], "done": 0, "errors": 0, "lock": threading.Lock()}
+        probe_latencies, samples = [], []
+        stop = threading.Event()
+        threads = [threading.Thread(target=worker, args=(port, f"worker_{i}", models, results, stop))
+                   for i in range(workers)]
+        monitors = [threading.Thread(target=probe, args=(port, probe_latencies, stop), daemon=True),
+                    threading.Thread(target=sample, args=(child.pid, samples, stop), daemon=True)]
+
+        start = time.perf_counter()
+        for thread in monitors + threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        child.kill()
+        child.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    duplicates = [claim for claim, count in Counter(results["claims"]).items() if count > 1]
+    return {"tasks": results["done"], "seconds": elapsed, "tasks_per_sec": results["done"] / elapsed,
+            "task_p50_ms": percentile(results["task_seconds"], 0.5), "task_p99_ms": percentile(results["task_seconds"], 0.99),
+            "probe_p50_ms": percentile(probe_latencies, 0.5), "probe_p99_ms": percentile(probe_latencies, 0.99),
+            "max_server_threads": max((threads for threads, rss in samples), default=None),
+            "max_server_rss_mb": max((rss for threads, rss in samples), default=None),
+            "errors": results["errors"], "duplicate_claims": len(duplicates)}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+        models = int(sys.argv[2]) if len(sys.argv) > 2 else MODELS
+        print(json.dumps({"workers": workers, "models": models, "blend_mb": BLEND_MB,
+                          "flask": run("flask", workers, models), "asgi": run("asgi", workers, models)}, indent=4))
@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import subprocess
+import http.client
+from collections import Counter
+
+from bench_dispatch import render_archive, fake_prepare_model, multipart, free_port, percentile
+
+# Several server processes sharing one tasks.db, input/ and output/, like servers on one host or on hosts
+# with a shared file system. Every request of a worker goes to a random server: a task is claimed on one,
+# kept alive with a heartbeat on another and submitted to a third. Checks that no task is held by two
+# workers at once, heartbeats are accepted by every server and all models end up rendered and scanned.
+# With --kill the first server is killed halfway, its leases expire and the others requeue its tasks
+#   python bench_cluster.py [servers] [workers] [models] [--kill]
+SERVERS = 3
+WORKERS = 30
+MODELS = 200
+LEASE_TTL = 10  # Short, so tasks of a killed server come back quickly
+TIMEOUT = 300
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve(port, node):  # Child process, the working directory is shared with the other servers
+    sys.path.insert(0, repo_dir)
+    import server
+    from werkzeug.serving import make_server
+
+    server.prepare_model = fake_prepare_model
+    server.lease_ttl = LEASE_TTL
+    server.load_tasks(node, port)
+    make_server("127.0.0.1", port, server.app, threaded=True).serve_forever()
+
+
+def call(port, method, path, body=None, headers=None):  # (status, headers), raises OSError when the server is gone
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        response.read()
+        return response.status, response.headers
+    finally:
+        connection.close()
+
+
+def count(results, key, amount=1):
+    with results["lock"]:
+        results[key] += amount
+
+
+def worker(ports, name, results, stop):
+    archive = render_archive()
+    while not stop.is_set():
+        port = random.choice(ports)
+        start = time.perf_counter()
+        try:
+            status, headers = call(port, "GET", f"/get_task/{name}/true/true?wait=1")
+        except (OSError, http.client.HTTPException):
+            count(results, "connection_errors")
+            continue
+        if status == 503:
+            continue
+        if status != 200:
+            count(results, "errors")
+            continue
+
+        results["latencies"].append(time.perf_counter() - start)
+        stage = "render" if headers["task_type"] == "render" else "scan"
+        key, token = (stage, headers["task_id"], headers.get("shard")), {"lease_token": headers["lease_token"]}
+        with results["lock"]:
+            results["overlaps"] += key in results["held"]  # Another worker holds the same task right now
+            results["held"][key] = name
+            results["claims"][port] += 1
+
+        try:
+            status, _ = call(random.choice(ports), "POST", f"/heartbeat/{name}", headers=token)
+            count(results, "heartbeat_failures", status != 200)
+
+            body, content_type = multipart("render.zip" if stage == "render" else "model.zip", archive)
+            status, _ = call(random.choice(ports), "POST", f"/submit_task/{name}/{stage}", body,
+                             {**token, "Content-Type": content_type})
+            count(results, "errors", status != 200)
+        except (OSError, http.client.HTTPException):  # Server was killed, the next get_task restores the leased task
+            count(results, "connection_errors")
+        finally:
+            with results["lock"]:
+                results["held"].pop(key, None)
+
+
+def unfinished(db_path):
+    try:
+        with sqlite3.connect(db_path, timeout=30) as conn:
+            return conn.execute("SELECT COUNT(*) FROM tasks WHERE scan_status != 'completed'").fetchone()[0]
+    except sqlite3.Error:  # Not created yet
+        return None
+
+
+def run(servers=SERVERS, workers=WORKERS, models=MODELS, kill=False):
+    work_dir = tempfile.mkdtemp()
+    for needed_dir in ["done/", "input/", "output/", "temp/"]:
+        os.mkdir(os.path.join(work_dir, needed_dir))
+    for i in range(models):  # Distinct content, identical files would be served from the content cache
+        with open(os.path.join(work_dir, "input/", f"model_{i}.zip"), "wb") as model_file:
+            model_file.write(f"model_{i}".encode())
+
+    ports = [free_port() for _ in range(servers)]
+    children = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port), f"node_{i}"],
+                                 cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                for i, port in enumerate(ports)]
+    try:
+        for port in ports:
+            for _ in range(300):
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+
+        results = {"latencies": [], "claims": Counter(), "held": dict(), "overlaps": 0, "heartbeat_failures": 0,
+                   "errors": 0, "connection_errors": 0, "lock": threading.Lock()}
+        alive = list(ports)  # Workers only pick from servers in this list, the killed one is removed
+        stop = threading.Event()
+        threads = [threading.Thread(target=worker, args=(alive, f"worker_{i}", results, stop)) for i in range(workers)]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        killed = None
+        left = unfinished(os.path.join(work_dir, "tasks.db"))
+        while left != 0 and time.perf_counter() - start < TIMEOUT:
+            time.sleep(0.2)
+            left = unfinished(os.path.join(work_dir, "tasks.db"))
+            if kill and killed is None and left is not None and left <= models // 2:
+                killed = time.perf_counter() - start
+                alive.remove(ports[0])
+                children[0].kill()
+        elapsed = time.perf_counter() - start
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        for child in children:
+            child.kill()
+            child.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    claims = sum(results["claims"].values())
+    return {"servers": servers, "workers": workers, "models": models, "seconds": elapsed,
+            "models_per_sec": (models - (left if left is not None else models)) / elapsed, "killed_after_seconds": killed,
+            "unfinished_models": left, "claims": claims, "claims_per_server": list(results["claims"][port] for port in ports),
+            "repeated_claims": claims - 2 * models, "overlapping_claims": results["overlaps"],
+            "heartbeat_failures": results["heartbeat_failures"], "errors": results["errors"],
+            "connection_errors": results["connection_errors"],
+            "p50_ms": percentile(results["latencies"], 0.5), "p99_ms": percentile(results["latencies"], 0.99)}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(int(sys.argv[2]), sys.argv[3])
+    else:
+        args = [int(arg) for arg in sys.argv[1:] if arg != "--kill"]
+        print(json.dumps(run(*args, kill="--kill" in sys.argv), indent=4))
@@ -0,0 +1,136 @@
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import shutil
+import socket
+import zipfile
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+
+from werkzeug.serving import make_server
+
+# Load test for /get_task and /submit_task: N simulated workers hammer a real threaded server.
+# Blender preprocessing is replaced by a short sleep, so the numbers show dispatch overhead only
+WORKERS = 50
+MODELS = 500
+PREPARE_SECONDS = 0.05
+FRAMES = 3
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, repo_dir)
+
+
+def fake_prepare_model(task, output_blend_file, temp_dir):
+    time.sleep(PREPARE_SECONDS)
+    with open(output_blend_file, "wb") as blend_file:
+        blend_file.write(b"BLENDER" + str(task.id).encode())
+
+
+def render_archive():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zip_file:
+        for frame in range(1, FRAMES + 1):
+            zip_file.writestr(f"{str(frame).zfill(3)}.png", os.urandom(1024))
+
+    return buffer.getvalue()
+
+
+# Helpers shared by the bench_*.py scripts
+def multipart(file_name, data):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{file_name}\"\r\n"
+            f"Content-Type: application/zip\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] * 1000 if values else None
+
+
+def post_file(url, file_name, data):
+    body, content_type = multipart(file_name, data)
+    request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": content_type})
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def worker(base_url, name, models, results, stop):
+    archive = render_archive()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{base_url}/get_task/{name}/true/true?wait=1") as response:
+                response.read()
+                task_type, task_id = response.headers["task_type"], response.headers["task_id"]
+        except urllib.error.HTTPError as error:
+            error.read()
+            if error.code != 503:
+                with results["lock"]:
+                    results["errors"] += 1
+                urllib.request.urlopen(f"{base_url}/disconnect/{name}").read()
+            continue
+        results["latencies"].append(time.perf_counter() - start)  # Dispatch latency, including the stubbed preparation
+
+        stage = "render" if task_type == "render" else "scan"
+        results["claims"].append((stage, task_id))
+        post_file(f"{base_url}/submit_task/{name}/{stage}", "render.zip" if stage == "render" else "model.zip", archive)
+
+        with results["lock"]:
+            results["done"] += 1
+            if results["done"] >= 2 * models:
+                stop.set()
+
+
+def run(workers=WORKERS, models=MODELS):
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    for needed_dir in ["input/", "output/", "temp/"]:
+        os.mkdir(needed_dir)
+    for i in range(models):  # Distinct content, identical files would be served from the content cache
+        with open(os.path.join("input/", f"model_{i}.zip"), "wb") as model_file:
+            model_file.write(f"model_{i}".encode())
+
+    import server
+    server.prepare_model = fake_prepare_model  # Before load_tasks() starts the prefetcher
+    server.load_tasks()
+
+    http_server = make_server("127.0.0.1", 0, server.app, threaded=True)
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{http_server.server_port}"
+
+    results = {"latencies": [], "claims": [], "done": 0, "errors": 0, "lock": threading.Lock()}
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker, args=(base_url, f"worker_{i}", models, results, stop)) for i in range(workers)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    http_server.shutdown()
+    os.chdir(repo_dir)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    latencies = results["latencies"]
+    duplicates = [claim for claim, count in Counter(results["claims"]).items() if count > 1]
+    return {"workers": workers, "tasks": results["done"], "seconds": elapsed, "tasks_per_sec": results["done"] / elapsed,
+            "p50_ms": percentile(latencies, 0.5), "p99_ms": percentile(latencies, 0.99), "max_ms": max(latencies) * 1000, "errors": results["errors"], "duplicate_claims": len(duplicates)}
+
+
+if __name__ == "__main__":
+    print(json.dumps(run(), indent=4))
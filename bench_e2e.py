@@ -0,0 +1,359 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime
+from collections import Counter
+
+from bench_dispatch import multipart, free_port, percentile
+
+# End to end benchmark of the dispatch server: get_task, send_model, send_images and submit_task under
+# simulated render and scan workers. Input archives are generated from a seed, Blender preparation is a
+# stub writing a blend file, workers "render" and "scan" by sleeping and uploading generated results.
+# The server runs in a child process, so its CPU time, memory and disk I/O can be read from /proc.
+# Results are written as JSON with the settings and git revision, --compare shows the change against an
+# earlier result. --replay takes render and scan durations from a real tasks.db instead of fixed ones
+#   python bench_e2e.py [--models N] [--render-workers N] [--scan-workers N] [--both-workers N] [--asgi]
+#                       [--replay tasks.db] [--time-scale F] [--seed N] [--output file] [--compare file]
+MODELS = 100
+RENDER_WORKERS = 8
+SCAN_WORKERS = 4
+BOTH_WORKERS = 0
+RENDER_SECONDS = 0.2  # Mean simulated work per task, every task varies around it
+SCAN_SECONDS = 0.1
+PREPARE_SECONDS = 0.05  # Stubbed Blender preparation
+BLEND_KB = 512
+MODEL_KB = 256  # Mean size of a generated input archive
+FRAMES = 30
+FRAME_KB = 64
+TIMEOUT = 600
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve(mode, port):  # Child process, the working directory holds the generated input/
+    sys.path.insert(0, repo_dir)
+    import server
+
+    def stub_prepare_model(task, output_blend_file, temp_dir):
+        time.sleep(PREPARE_SECONDS)
+        with open(output_blend_file, "wb") as blend_file:
+            blend_file.write(random.Random(task.id).randbytes(BLEND_KB * 1024))
+
+    server.prepare_model = stub_prepare_model
+    server.load_tasks()
+
+    if mode == "flask":
+        from werkzeug.serving import make_server
+        make_server("127.0.0.1", port, server.app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        import asgi_server
+        uvicorn.run(asgi_server.app, host="127.0.0.1", port=port, log_level="warning", backlog=2048)
+
+
+def make_inputs(input_dir, models, rng):  # model_<i>.zip with a glTF scene of random size, returns total bytes
+    total = 0
+    for i in range(models):
+        path = os.path.join(input_dir, f"model_{i}.zip")
+        size = int(MODEL_KB * 1024 * rng.lognormvariate(0, 0.5))
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as zip_file:
+            zip_file.writestr("scene.gltf", json.dumps({"asset": {"version": "2.0"}, "buffers": [
+                {"uri": "scene.bin", "byteLength": size}]}))
+            zip_file.writestr("scene.bin", rng.randbytes(size))
+        total += os.path.getsize(path)
+
+    return total
+
+
+def result_archive(names, size, rng):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zip_file:
+        for name in names:
+            zip_file.writestr(name, rng.randbytes(size))
+
+    return buffer.getvalue()
+
+
+def recorded_durations(db_path):  # {task type: [seconds]} of finished tasks in a tasks.db
+    sys.path.insert(0, repo_dir)
+    from task_store import SqliteTaskStore, TASK_TYPES
+    from scheduler import task_seconds
+
+    store = SqliteTaskStore(db_path)
+    return {task_type: [task_seconds(timing["start_time"], timing["end_time"]) for timing in
+                        store.timings(task_type, limit=100000)] for task_type in TASK_TYPES}
+
+
+class Durations:
+    # Simulated work per task, the same for a task id and seed in every run: recorded durations of a real
+    # farm when replaying, otherwise the mean of its type varied by a lognormal factor
+    def __init__(self, seed, recorded=None, time_scale=1.0):
+        self.seed = seed
+        self.recorded = recorded
+        self.time_scale = time_scale
+
+    def get(self, task_type, task_id):
+        if self.recorded and self.recorded.get(task_type):
+            values = self.recorded[task_type]
+            return values[task_id % len(values)] * self.time_scale
+
+        mean = RENDER_SECONDS if task_type == "render" else SCAN_SECONDS
+        return mean * random.Random(f"{self.seed}-{task_type}-{task_id}").lognormvariate(0, 0.25) * self.time_scale
+
+
+def count(results, key, label, amount=1):
+    with results["lock"]:
+        results[key][label] += amount
+
+
+def worker(port, name, can_render, can_scan, durations, seed, results, stop):
+    rng = random.Random(f"{seed}-{name}")
+    uploads = {"render": multipart("render.zip", result_archive([f"{str(frame).zfill(3)}.png" for frame in
+                                                                 range(1, FRAMES + 1)], FRAME_KB * 1024, rng)),
+               "scan": multipart("model.zip", result_archive(["model.obj"], FRAME_KB * 1024, rng))}
+    path = f"/get_task/{name}/{'true' if can_render else 'false'}/{'true' if can_scan else 'false'}?wait=1"
+
+    while not stop.is_set():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        try:
+            start = time.perf_counter()
+            connection.request("GET", path)
+            response = connection.getresponse()
+            dispatched = time.perf_counter()
+            received = len(response.read())
+            downloaded = time.perf_counter()
+        except (OSError, http.client.HTTPException):
+            count(results, "errors", "get_task")
+            continue
+        finally:
+            connection.close()
+
+        if response.status == 503:
+            continue
+        if response.status != 200:
+            count(results, "errors", "get_task")
+            continue
+
+        task_type = "render" if response.headers["task_type"] == "render" else "scan"
+        results["dispatch_seconds"][task_type].append(dispatched - start)
+        results["download_seconds"][task_type].append(downloaded - dispatched)
+        count(results, "bytes_downloaded", task_type, received)
+        time.sleep(durations.get(task_type, int(response.headers["task_id"])))
+
+        body, content_type = uploads[task_type]
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        try:
+            start = time.perf_counter()
+            connection.request("POST", f"/submit_task/{name}/{task_type}", body,
+                               {"Content-Type": content_type, "lease_token": response.headers["lease_token"]})
+            status = connection.getresponse().status
+            results["submit_seconds"][task_type].append(time.perf_counter() - start)
+        except (OSError, http.client.HTTPException):
+            status = None
+        finally:
+            connection.close()
+
+        if status == 200:
+            count(results, "submitted", task_type)
+            count(results, "bytes_uploaded", task_type, len(body))
+        else:
+            count(results, "errors", "submit_task")
+
+
+def completed(port):  # {task type: completed tasks} as the server counts them, after extraction
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    try:
+        connection.request("GET", "/api/stats")
+        current = json.loads(connection.getresponse().read())
+        return {task_type: current[task_type]["counts"].get("completed", 0) for task_type in ["render", "scan"]}
+    except (OSError, http.client.HTTPException, ValueError, KeyError):
+        return None
+    finally:
+        connection.close()
+
+
+def proc_counters(pid):  # CPU seconds, peak RSS, and bytes read and written to storage by the server process
+    with open(f"/proc/{pid}/stat") as stat_file:
+        fields = stat_file.read().rsplit(")", 1)[1].split()
+    counters = {"cpu_seconds": (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")}
+
+    with open(f"/proc/{pid}/status") as status_file:
+        status = dict(line.split(":", 1) for line in status_file)
+    counters["rss_mb"] = int(status["VmRSS"].split()[0]) / 1024
+    counters["peak_rss_mb"] = int(status["VmHWM"].split()[0]) / 1024
+
+    try:
+        with open(f"/proc/{pid}/io") as io_file:
+            io_fields = dict(line.split(":", 1) for line in io_file)
+        counters.update({key: int(io_fields[key]) for key in ["read_bytes", "write_bytes", "rchar", "wchar"]})
+    except OSError:  # Not readable in some containers
+        pass
+
+    return counters
+
+
+def sample(pid, samples, stop):
+    while not stop.is_set():
+        try:
+            samples.append(proc_counters(pid)["rss_mb"])
+        except OSError:
+            pass
+        time.sleep(0.2)
+
+
+def latency_stats(values):
+    return {"count": len(values), "p50_ms": percentile(values, 0.5), "p99_ms": percentile(values, 0.99),
+            "max_ms": max(values) * 1000 if values else None}
+
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, names in os.walk(path) for name in names)
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    recorded = recorded_durations(args.replay) if args.replay else None
+    durations = Durations(args.seed, recorded, args.time_scale)
+
+    work_dir = tempfile.mkdtemp()
+    for needed_dir in ["done/", "input/", "output/", "temp/"]:
+        os.mkdir(os.path.join(work_dir, needed_dir))
+    input_bytes = make_inputs(os.path.join(work_dir, "input"), args.models, rng)
+
+    port = free_port()
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", "asgi" if args.asgi else "flask",
+                              str(port)], cwd=work_dir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(600):  # Ready once tasks are imported
+            if completed(port) is not None:
+                break
+            time.sleep(0.1)
+
+        results = {"dispatch_seconds": {"render": [], "scan": []}, "download_seconds": {"render": [], "scan": []},
+                   "submit_seconds": {"render": [], "scan": []}, "submitted": Counter(), "errors": Counter(),
+                   "bytes_downloaded": Counter(), "bytes_uploaded": Counter(), "lock": threading.Lock()}
+        stop = threading.Event()
+        roles = [(True, False)] * args.render_workers + [(False, True)] * args.scan_workers + \
+                [(True, True)] * args.both_workers
+        threads = [threading.Thread(target=worker, args=(port, f"worker_{i}", can_render, can_scan, durations,
+                                                         args.seed, results, stop))
+                   for i, (can_render, can_scan) in enumerate(roles)]
+        rss_samples = []
+        sampler = threading.Thread(target=sample, args=(child.pid, rss_samples, stop), daemon=True)
+
+        before = proc_counters(child.pid)
+        start = time.perf_counter()
+        sampler.start()
+        for thread in threads:
+            thread.start()
+
+        done = completed(port)
+        while (done is None or done["scan"] < args.models) and time.perf_counter() - start < TIMEOUT:
+            time.sleep(0.5)
+            done = completed(port) or done
+        elapsed = time.perf_counter() - start
+        after = proc_counters(child.pid)
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        output_bytes = directory_bytes(os.path.join(work_dir, "output"))
+    finally:
+        child.kill()
+        child.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    done = done or {"render": 0, "scan": 0}
+    io_keys = [key for key in ["read_bytes", "write_bytes", "rchar", "wchar"] if key in before and key in after]
+    return {"tasks_completed": done, "seconds": elapsed, "timed_out": done["scan"] < args.models,
+            "tasks_per_hour": {task_type: count / elapsed * 3600 for task_type, count in done.items()},
+            "models_per_hour": done["scan"] / elapsed * 3600,
+            "dispatch_latency": {task_type: latency_stats(values) for task_type, values in results["dispatch_seconds"].items()},
+            "download_seconds": {task_type: latency_stats(values) for task_type, values in results["download_seconds"].items()},
+            "submit_latency": {task_type: latency_stats(values) for task_type, values in results["submit_seconds"].items()},
+            "server": {"cpu_seconds": after["cpu_seconds"] - before["cpu_seconds"],
+                       "cpu_percent": (after["cpu_seconds"] - before["cpu_seconds"]) / elapsed * 100,
+                       "rss_mb_mean": sum(rss_samples) / len(rss_samples) if rss_samples else None,
+                       "peak_rss_mb": after["peak_rss_mb"],
+                       "disk_io": {key: after[key] - before[key] for key in io_keys} or None},
+            "transfer_bytes": {"input": input_bytes, "downloaded": dict(results["bytes_downloaded"]),
+                               "uploaded": dict(results["bytes_uploaded"]), "output_dir": output_bytes},
+            "submitted": dict(results["submitted"]), "errors": dict(results["errors"])}
+
+
+def flatten(value, prefix=""):  # {"a.b": number} of the numbers in nested results
+    if isinstance(value, dict):
+        return {key: number for name, item in value.items() for key, number in flatten(item, f"{prefix}{name}.").items()}
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix[:-1]: value}
+    return {}
+
+
+def compare(current, previous):  # {metric: [previous, current, change]} for every number in both results
+    now, before = flatten(current), flatten(previous)
+    return {key: [before[key], now[key], (now[key] - before[key]) / before[key] if before[key] else None]
+            for key in sorted(now) if key in before}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="End to end benchmark of the dispatch server with simulated workers")
+    parser.add_argument("--models", type=int, default=MODELS)
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS)
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS)
+    parser.add_argument("--both-workers", type=int, default=BOTH_WORKERS, help="Workers doing render and scan")
+    parser.add_argument("--asgi", action="store_true", help="Serve with asgi_server.py instead of Flask")
+    parser.add_argument("--replay", help="tasks.db whose recorded render and scan durations are replayed")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Factor for every simulated duration")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Result file, default bench_results/e2e_<time>.json")
+    parser.add_argument("--compare", help="Earlier result file to compare with")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    started = datetime.now()
+    report = {"benchmark": "e2e", "started": started.isoformat(timespec="seconds"), "git_revision": git_revision(),
+              "settings": {**vars(args), "render_seconds": RENDER_SECONDS, "scan_seconds": SCAN_SECONDS,
+                           "prepare_seconds": PREPARE_SECONDS, "blend_kb": BLEND_KB, "model_kb": MODEL_KB,
+                           "frames": FRAMES, "frame_kb": FRAME_KB},
+              "results": run(args)}
+
+    if args.compare:
+        with open(args.compare) as previous_file:
+            report["compared_to"] = {"file": args.compare,
+                                     "metrics": compare(report["results"], json.load(previous_file)["results"])}
+
+    output = args.output or os.path.join(repo_dir, "bench_results", f"e2e_{started.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as output_file:
+        json.dump(report, output_file, indent=4)
+
+    print(json.dumps(report, indent=4))
+    print(f"Written to {output}")
+    return 1 if report["results"]["timed_out"] or report["results"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(sys.argv[2], int(sys.argv[3]))
+    else:
+        sys.exit(main(sys.argv[1:]))
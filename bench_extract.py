@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+import subprocess
+from pathlib import Path
+
+from extract import extract_archive
+
+# Synthetic nested model archives: every level holds meshes, textures, files orbit_render ignores
+# and NESTED archives of the next level, like asset store downloads do
+DEPTH = 3
+NESTED = 3
+MESHES = 4
+TEXTURES = 6
+JUNK = 10
+FILE_SIZE = 256 * 1024
+
+
+def build_archive(path, depth):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for i in range(MESHES):
+            zip_file.writestr(f"mesh_{i}.obj", ("v 0.1 0.2 0.3\n" * (FILE_SIZE // 14)).encode())
+        for i in range(TEXTURES):
+            zip_file.writestr(f"textures/texture_{i}.png", os.urandom(FILE_SIZE))
+        for i in range(JUNK):
+            zip_file.writestr(f"docs/readme_{i}.txt", os.urandom(FILE_SIZE))
+
+        if depth > 0:
+            for i in range(NESTED):
+                nested_path = f"{path}.{i}.zip"
+                build_archive(nested_path, depth - 1)
+                zip_file.write(nested_path, f"parts/{os.path.basename(nested_path)}")  # Unique names, unzip can't merge
+                os.remove(nested_path)
+
+
+def unzip_recursively(zip_path):  # Previous implementation from main.py, for comparison
+    if zip_path.suffix == ".zip" and zip_path.exists():  # Old version crashed on sibling archives without this check
+        extract_dir = zip_path.parent
+        subprocess.run(["unzip", "-q", "-o", str(zip_path), "-d", str(extract_dir)])
+        os.remove(zip_path)
+
+        for root, dirs, files in os.walk(extract_dir):
+            for filename in files:
+                unzip_recursively(Path(os.path.join(root, filename)))
+
+
+def bench_legacy(archive_path, temp_dir):
+    start = time.perf_counter()
+    os.makedirs(temp_dir)
+    shutil.copy(archive_path, temp_dir)
+    unzip_recursively(Path(os.path.join(temp_dir, os.path.basename(archive_path))))
+    return time.perf_counter() - start
+
+
+def bench_extract(archive_path, temp_dir, workers):
+    start = time.perf_counter()
+    extracted = extract_archive(archive_path, temp_dir, workers=workers)
+    return time.perf_counter() - start, len(extracted)
+
+
+if __name__ == "__main__":
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else DEPTH
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive_path = os.path.join(tmp_dir, "model.zip")
+        build_archive(archive_path, depth)
+        results = {"depth": depth, "archive_mb": os.path.getsize(archive_path) / 2 ** 20}
+
+        if shutil.which("unzip"):
+            results["legacy_unzip_s"] = bench_legacy(archive_path, os.path.join(tmp_dir, "legacy"))
+
+        for workers in [1, 4, 8]:
+            seconds, files = bench_extract(archive_path, os.path.join(tmp_dir, f"extract_{workers}"), workers)
+            results[f"extract_{workers}_workers_s"] = seconds
+            results["extracted_files"] = files
+
+        print(json.dumps(results, indent=4))
@@ -0,0 +1,115 @@
+import os
+import io
+import sys
+import json
+import time
+import zlib
+import shutil
+import struct
+import zipfile
+import tempfile
+
+import numpy as np
+
+from frame_pack import pack, unpack, split_png, codec_available
+from render_archive import frame_file_name, stream_archive
+
+# Size and encode/decode speed of render.zip (store only, what the server sends now, and deflated) against
+# frame_pack with different codecs and levels. Uses the PNG frames of a directory, or renders a synthetic
+# orbit: a striped, shaded object turning in front of a static background
+#   python bench_frame_pack.py [frames dir]
+FRAMES = 300
+WIDTH, HEIGHT = 640, 360
+CANDIDATES = [("pack", "zlib", 6, False), ("pack", "zlib", 6, True), ("pack", "lzma", 1, False),
+              ("pack", "lzma", 6, False), ("pack", "zstd", 3, False), ("pack", "zstd", 3, True),
+              ("pack", "zstd", 19, False)]
+
+
+def write_png(path, pixels):  # RGBA uint8 pixels, every row with the Sub filter like libpng picks for smooth images
+    height, width, channels = pixels.shape
+    rows = pixels.reshape(height, width * channels).astype(np.int16)
+    filtered = np.concatenate([rows[:, :channels], rows[:, channels:] - rows[:, :-channels]], axis=1).astype(np.uint8)
+    raw = np.concatenate([np.ones((height, 1), np.uint8), filtered], axis=1).tobytes()
+
+    def chunk(chunk_type, data):
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+                   + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b""))
+
+
+def synthetic_frames(frames_dir, frames=FRAMES):
+    y, x = np.mgrid[0:HEIGHT, 0:WIDTH].astype(np.float32)
+    x, y = (x - WIDTH / 2) / (HEIGHT / 2), (y - HEIGHT / 2) / (HEIGHT / 2)
+    background = np.stack([40 + 30 * (1 - y), 45 + 30 * (1 - y), 55 + 30 * (1 - y), np.full_like(x, 255)], axis=-1)
+
+    for frame in range(1, frames + 1):
+        angle = 2 * np.pi * frame / frames
+        half_width = 0.35 + 0.25 * abs(np.cos(angle))  # Silhouette of a box turning around the vertical axis
+        inside = (np.abs(x) < half_width) & (np.abs(y) < 0.6)
+        u = (x / half_width + angle) * 6
+        shade = 0.6 + 0.4 * np.cos(angle + x)
+        colour = np.stack([150 + 80 * np.sin(u), 120 + 60 * np.cos(u * 0.5), 90 + 40 * np.sin(y * 8), 255 + 0 * u], axis=-1)
+        pixels = np.where(inside[..., None], colour * np.stack([shade] * 3 + [np.ones_like(shade)], axis=-1), background)
+        write_png(os.path.join(frames_dir, frame_file_name(frame)), np.clip(pixels, 0, 255).astype(np.uint8))
+
+
+def same_pixels(original, unpacked):  # Same chunks and image data, the deflated bytes may differ
+    with open(original, "rb") as first, open(unpacked, "rb") as second:
+        return split_png(first.read()) == split_png(second.read())
+
+
+def measure(files, method, codec, level, use_delta, out_dir):
+    input_bytes = sum(os.path.getsize(path) for path in files)
+    buffer = io.BytesIO()
+
+    start = time.perf_counter()
+    if method == "zip":
+        if codec == "stored":
+            for data in stream_archive(files):
+                buffer.write(data)
+        else:
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=level) as zip_file:
+                for path in files:
+                    zip_file.write(path, os.path.basename(path))
+    else:
+        for data in pack(files, codec, level, use_delta):
+            buffer.write(data)
+    encode_seconds = time.perf_counter() - start
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    buffer.seek(0)
+    start = time.perf_counter()
+    if method == "zip":
+        with zipfile.ZipFile(buffer) as zip_file:
+            zip_file.extractall(out_dir)
+    else:
+        unpack(buffer, out_dir)
+    decode_seconds = time.perf_counter() - start
+
+    mismatches = sum(not same_pixels(path, os.path.join(out_dir, os.path.basename(path))) for path in files)
+    return {"format": method, "codec": codec, "level": level, "delta": use_delta, "bytes": buffer.getbuffer().nbytes,
+            "ratio": buffer.getbuffer().nbytes / input_bytes,
+            "encode_mb_per_sec": input_bytes / 2 ** 20 / encode_seconds, "encode_frames_per_sec": len(files) / encode_seconds,
+            "decode_mb_per_sec": input_bytes / 2 ** 20 / decode_seconds, "decode_frames_per_sec": len(files) / decode_seconds,
+            "pixel_mismatches": mismatches}
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp()
+    try:
+        frames_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(work_dir, "frames")
+        if len(sys.argv) == 1:
+            os.mkdir(frames_dir)
+            synthetic_frames(frames_dir)
+        files = sorted(os.path.join(frames_dir, name) for name in os.listdir(frames_dir) if name.endswith(".png"))
+
+        results = {"frames": len(files), "input_bytes": sum(os.path.getsize(path) for path in files), "runs": []}
+        for method, codec, level, use_delta in [("zip", "stored", 0, False), ("zip", "deflate", 6, False)] + CANDIDATES:
+            if method == "pack" and not codec_available(codec):
+                continue
+            results["runs"].append(measure(files, method, codec, level, use_delta, os.path.join(work_dir, "out")))
+        print(json.dumps(results, indent=4))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,73 @@
+import sys
+import json
+import time
+
+import numpy as np
+
+from geometry import normalise_matrix, transform_points
+
+# Normalisation math of a split OBJ import: many small objects. The legacy path is the loop
+# normalise_objects used over every bound_box corner and axis, on synthetic data so no Blender is needed.
+# Legacy moves vertices in a Python loop where Blender ran one operator call per object, so it's only a rough bound
+OBJECTS = [100, 1_000, 10_000]
+VERTICES_PER_OBJECT = 200
+MAX_DIMENSION = 12
+
+
+def make_objects(objects, vertices, rng):
+    counts = np.full(objects, vertices)
+    offsets = rng.uniform(-50, 50, (objects, 3)).repeat(vertices, axis=0)
+    return rng.uniform(-1, 1, (objects * vertices, 3)) * rng.uniform(0.1, 3) + offsets, counts
+
+
+def legacy(points, counts):
+    start = 0
+    boxes = []
+    for count in counts:  # bound_box: 8 corners of every object
+        mins, maxs = points[start:start + count].min(axis=0), points[start:start + count].max(axis=0)
+        boxes.append([[(mins, maxs)[(corner >> axis) & 1][axis] for axis in range(3)] for corner in range(8)])
+        start += count
+
+    max_scale = -1000
+    for box in boxes:
+        max_scale = max(max_scale, max(max(point[i] for point in box) - min(point[i] for point in box) for i in range(3)))
+    scale_factor = MAX_DIMENSION / max_scale
+
+    bound_box_max, bound_box_min = [-1e7, -1e7, -1e7], [1e7, 1e7, 1e7]
+    for box in boxes:
+        for point in box:
+            for i in range(3):
+                bound_box_max[i] = max(bound_box_max[i], point[i] * scale_factor)
+            for i in range(3):
+                bound_box_min[i] = min(bound_box_min[i], point[i] * scale_factor)
+
+    center = [(bound_box_max[i] + bound_box_min[i]) / 2 for i in range(3)]
+    return [[(x * scale_factor - center[0], y * scale_factor - center[1], z * scale_factor - center[2])
+             for x, y, z in points]]
+
+
+def vectorised(points, counts):
+    matrix, max_scale = normalise_matrix(points, counts, MAX_DIMENSION)
+    return transform_points(points, matrix)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or OBJECTS
+    rng = np.random.default_rng(0)
+
+    results = []
+    for objects in sizes:
+        points, counts = make_objects(objects, VERTICES_PER_OBJECT, rng)
+        expected, legacy_ms = timed(legacy, points, counts)
+        normalised, vectorised_ms = timed(vectorised, points, counts)
+        results.append({"objects": objects, "vertices": len(points), "legacy_ms": legacy_ms,
+                        "vectorised_ms": vectorised_ms,
+                        "max_error": float(np.abs(np.array(expected[0]) - normalised).max())})
+
+    print(json.dumps(results, indent=4))
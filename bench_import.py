@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import tempfile
+
+from task_store import SqliteTaskStore
+from watcher import InputWatcher, bulk_import
+
+# Startup import of large ./input directories: first start on an empty database, a restart with
+# nothing new, a restart after 1% new archives, and how fast the watcher notices a copied archive
+SIZES = [1_000, 10_000, 100_000]
+LEGACY_LIMIT = 10_000  # Old list rebuild per file is quadratic, bigger directories take hours
+
+
+def make_input(input_dir, start, count):
+    for i in range(start, start + count):
+        open(os.path.join(input_dir, f"model_{i}.zip"), "wb").close()
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def legacy_import(input_dir):  # What server.py did with tasks.csv: list(df_tasks["filename"]) for every file
+    known = []
+    for filename in os.listdir(input_dir):
+        name = '.'.join(filename.split('.')[:-1])
+        if name not in list(known):
+            known.append(name)
+    return len(known)
+
+
+def watcher_latency(store, input_dir, size, poll_interval):
+    added = []
+    watcher = InputWatcher(store, input_dir, on_added=lambda count: added.append(time.perf_counter()),
+                           poll_interval=poll_interval)
+    watcher.start()
+
+    start = time.perf_counter()
+    make_input(input_dir, size * 2, 1)
+    while not added and time.perf_counter() - start < poll_interval * 5:
+        time.sleep(0.01)
+    watcher.stop()
+
+    return (added[0] - start) * 1000 if added else None
+
+
+def bench_size(size, tmp_dir, poll_interval):
+    input_dir = os.path.join(tmp_dir, f"input_{size}")
+    os.mkdir(input_dir)
+    make_input(input_dir, 0, size)
+    store = SqliteTaskStore(os.path.join(tmp_dir, f"tasks_{size}.db"))
+
+    result = {"size": size}
+    if size <= LEGACY_LIMIT:
+        result["legacy_ms"] = timed(legacy_import, input_dir)[1]
+
+    result["first_start_added"], result["first_start_ms"] = timed(bulk_import, store, input_dir)
+    result["restart_added"], result["restart_ms"] = timed(bulk_import, store, input_dir)
+
+    make_input(input_dir, size, max(1, size // 100))
+    result["restart_new_added"], result["restart_new_ms"] = timed(bulk_import, store, input_dir)
+
+    result["watcher_ms"] = watcher_latency(store, input_dir, size, poll_interval)
+    return result
+
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or SIZES
+    poll_interval = 0.2  # Only used without inotify_simple
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results = [bench_size(size, tmp_dir, poll_interval) for size in sizes]
+
+    print(json.dumps(results, indent=4))
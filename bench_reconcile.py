@@ -0,0 +1,85 @@
+import sys
+import json
+import time
+import random
+import string
+
+from reconcile import reconcile, normalise, NameIndex
+
+# 50k archives in done/ against output directories whose names are exact, differently written
+# (case, separators), slightly misspelled, or duplicated. Legacy is the full DP over every pair,
+# timed on a sample of directories and extrapolated. Fuzzy matches are checked against the distance limits first
+NAMES = 50_000
+LEGACY_SAMPLE = 5
+WORDS = ["chair", "table", "lamp", "sofa", "vase", "car", "truck", "tree", "rock", "house", "statue", "robot",
+         "shoe", "bottle", "helmet", "skull", "dragon", "bunny", "teapot", "plane"]
+
+
+def legacy_distance(first, second):  # Same DP as the old move.py, without numpy allocation per pair
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i]
+        for j in range(1, len(second) + 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first[i - 1] != second[j - 1])))
+        previous = current
+    return previous[-1]
+
+
+def typo(name, rng, edits):
+    chars = list(name)
+    for _ in range(edits):
+        position = rng.randrange(len(chars))
+        chars[position] = rng.choice(string.ascii_lowercase)
+    return ''.join(chars)
+
+
+def make_names(count, rng):
+    done = [f"{rng.choice(WORDS)}_{rng.choice(WORDS)}_{i:06d}_{rng.randrange(16 ** 6):06x}.zip" for i in range(count)]
+    queries = []
+    for name in done:
+        kind = rng.random()
+        stem = name[:-4]
+        if kind < 0.4:
+            queries.append(name)
+        elif kind < 0.6:
+            queries.append(stem.replace("_", "-").upper() + ".zip")
+        elif kind < 0.9:
+            queries.append(typo(stem, rng, rng.randint(1, 3)) + ".zip")
+        else:
+            queries.append(f"unknown_{rng.randrange(10 ** 9)}.zip")
+    done.append(done[0].replace(".zip", ".ZIP"))  # Same model uploaded twice
+    return queries, done
+
+
+def check_limits(matches, max_distance=10):
+    # Names one edit past max_distance, or past a third of the name, must stay unmatched
+    index = NameIndex(["chair_wooden.zip", "abcdefghijkl.zip"])
+    assert index.match("chair_woodeXX", 2)[:2] == ("fuzzy", 2)
+    assert index.match("chair_woodXXX", 2)[0] is None
+    assert index.match("abcdefghXXXX.zip", max_distance)[:2] == ("fuzzy", 4)
+    assert index.match("abcdefgXXXXX.zip", max_distance)[0] is None
+
+    over = [match for match in matches if match[3] > min(max_distance, len(normalise(match[0])) // 3)]
+    assert not over, f"{len(over)} matches beyond the distance limit, e.g. {over[0]}"
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else NAMES
+    rng = random.Random(0)
+    queries, done = make_names(count, rng)
+
+    results = {"names": count}
+    for processes in [1, None]:
+        start = time.perf_counter()
+        matches, ambiguous, unmatched = reconcile(queries, done, processes=processes)
+        results[f"processes_{processes or 'all'}_s"] = time.perf_counter() - start
+    check_limits(matches)
+    results.update({"matched": len(matches), "ambiguous": len(ambiguous), "unmatched": len(unmatched),
+                    "fuzzy": sum(1 for match in matches if match[2] == "fuzzy")})
+
+    start = time.perf_counter()
+    for query in queries[:LEGACY_SAMPLE]:
+        min(done, key=lambda name: legacy_distance(query, name))
+    results["legacy_estimated_s"] = (time.perf_counter() - start) / LEGACY_SAMPLE * len(queries)
+
+    print(json.dumps(results, indent=4))
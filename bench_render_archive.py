@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+import tracemalloc
+
+from render_archive import frame_files, build_cached_archive, stream_archive
+
+# Render -> scan handoff: archive uploaded by the render worker (extracted on submit, sent as is)
+# against archives built by the server from loose frames. Peak memory is Python heap measured by tracemalloc
+FRAMES = 300
+FRAME_SIZE = 200 * 1024
+READ_SIZE = 2 ** 20
+
+
+def make_frames(frames_dir, frames, frame_size):
+    os.makedirs(frames_dir)
+    for frame in range(1, frames + 1):
+        with open(os.path.join(frames_dir, f"{str(frame).zfill(3)}.png"), "wb") as frame_file:
+            frame_file.write(os.urandom(frame_size))  # PNG data doesn't compress any further either
+
+
+def read_file(path):  # What send_file does with the body, first chunk marks time to first byte
+    first_byte = None
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(READ_SIZE), b""):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+    return first_byte
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    ttfb = function(*args)
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"ttfb_ms": ttfb * 1000, "total_ms": total * 1000, "peak_mb": peak / 2 ** 20}
+
+
+def legacy(work_dir, frames_dir):  # Worker zipped the frames, server extracts on submit and sends the upload
+    output_dir = os.path.join(work_dir, "legacy")
+    os.makedirs(output_dir)
+    archive_path = os.path.join(output_dir, "render.zip")
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for path in frame_files(frames_dir):
+            zip_file.write(path, os.path.basename(path))
+
+    def submit_and_send():
+        start = time.perf_counter()
+        with zipfile.ZipFile(archive_path) as zip_file:
+            zip_file.extractall(output_dir)
+        return time.perf_counter() - start + read_file(archive_path)
+
+    return measure(submit_and_send)
+
+
+def cached(work_dir, frames_dir):
+    output_dir = os.path.join(work_dir, "cached")
+    shutil.copytree(frames_dir, output_dir)
+
+    def build_and_send():
+        start = time.perf_counter()
+        archive_path = build_cached_archive(output_dir)
+        return time.perf_counter() - start + read_file(archive_path)
+
+    first = measure(build_and_send)
+    again = measure(build_and_send)  # Frame set unchanged, archive comes from cache
+    return first, again
+
+
+def streamed(work_dir, frames_dir):
+    def stream():
+        first_byte = None
+        start = time.perf_counter()
+        for data in stream_archive(frame_files(frames_dir)):
+            if first_byte is None and data:
+                first_byte = time.perf_counter() - start
+        return first_byte
+
+    return measure(stream)
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        frames_dir = os.path.join(work_dir, "frames")
+        make_frames(frames_dir, frames, FRAME_SIZE)
+
+        first, again = cached(work_dir, frames_dir)
+        results = {"frames": frames, "frame_kb": FRAME_SIZE // 1024,
+                   "legacy_upload_extract_send": legacy(work_dir, frames_dir),
+                   "cached_first_request": first, "cached_next_requests": again,
+                   "streamed": streamed(work_dir, frames_dir)}
+
+        print(json.dumps(results, indent=4))
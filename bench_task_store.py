@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import tempfile
+import statistics
+
+from task_store import SqliteTaskStore
+
+# Claim latency while the table grows. Half of every table is already rendered,
+# so the next free task sits in the middle of the table like on a long running farm.
+# Scan claims run against a table where only the first few models are rendered: the claim has to skip
+# every model still waiting for its render, and an empty claim (long polling scan workers) finds nothing
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+CLAIMS = 1000
+RENDERED = 100  # Models ready for scan in the scan benchmark
+
+
+def summary(size, latencies):
+    latencies = sorted(latencies)
+    return {"size": size, "mean_ms": statistics.mean(latencies) * 1000,
+            "p50_ms": latencies[len(latencies) // 2] * 1000, "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000}
+
+
+def bench_size(size, tmp_dir):
+    db_path = os.path.join(tmp_dir, f"tasks_{size}.db")
+    store = SqliteTaskStore(db_path)
+    store.add_tasks(f"model_{i}" for i in range(size))
+    store.connection().execute("UPDATE tasks SET render_status = 'completed' WHERE id <= ?", (size // 2,))
+
+    latencies = []
+    for i in range(min(CLAIMS, size // 4)):
+        start = time.perf_counter()
+        task = store.claim("render", "bench")
+        store.complete(task.id, "render")
+        latencies.append(time.perf_counter() - start)
+
+    return summary(size, latencies)
+
+
+def bench_scan(size, tmp_dir):  # Claims until the rendered models are used up, then empty claims
+    db_path = os.path.join(tmp_dir, f"tasks_scan_{size}.db")
+    store = SqliteTaskStore(db_path)
+    store.add_tasks(f"model_{i}" for i in range(size))
+    store.connection().execute("UPDATE tasks SET render_status = 'completed' WHERE id < ?", (RENDERED,))
+
+    latencies, empty_latencies = [], []
+    for i in range(min(CLAIMS, size)):
+        start = time.perf_counter()
+        task = store.claim("scan", "bench")
+        if task is not None:
+            store.complete(task.id, "scan")
+        (latencies if task is not None else empty_latencies).append(time.perf_counter() - start)
+
+    return summary(size, latencies), summary(size, empty_latencies)
+
+
+def bench_pandas(size, tmp_dir):  # Old tasks.csv approach, only for comparison on small tables
+    import pandas as pd
+
+    csv_path = os.path.join(tmp_dir, f"tasks_{size}.csv")
+    df = pd.DataFrame({"id": range(size), "filename": [f"model_{i}" for i in range(size)],
+                       "render_status": ["completed"] * (size // 2 + 1) + ["none"] * (size - size // 2 - 1)})
+
+    latencies = []
+    for i in range(min(CLAIMS, 50)):
+        start = time.perf_counter()
+        task = df[df["render_status"] == "none"].iloc[0]
+        df.iloc[task.id, 2] = "completed"
+        df.to_csv(csv_path, index=False)
+        latencies.append(time.perf_counter() - start)
+
+    latencies.sort()
+    return {"size": size, "mean_ms": statistics.mean(latencies) * 1000,
+            "p50_ms": latencies[len(latencies) // 2] * 1000, "p99_ms": latencies[-1] * 1000}
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or SIZES
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print("sqlite claim + complete")
+        for size in sizes:
+            result = bench_size(size, tmp_dir)
+            print(f"{result['size']:>9} rows: mean {result['mean_ms']:.3f} ms, p50 {result['p50_ms']:.3f} ms, "
+                  f"p99 {result['p99_ms']:.3f} ms")
+
+        print(f"sqlite scan claim + complete, {RENDERED} rendered models, then empty claims")
+        for size in sizes:
+            for kind, result in zip(["claim", "empty"], bench_scan(size, tmp_dir)):
+                print(f"{result['size']:>9} rows {kind:>5}: mean {result['mean_ms']:.3f} ms, "
+                      f"p50 {result['p50_ms']:.3f} ms, p99 {result['p99_ms']:.3f} ms")
+
+        try:
+            import pandas
+        except ImportError:
+            pandas = None
+
+        if pandas is not None:
+            print("pandas tasks.csv claim + to_csv")
+            for size in sizes:
+                if size > 100_000:
+                    break
+                result = bench_pandas(size, tmp_dir)
+                print(f"{result['size']:>9} rows: mean {result['mean_ms']:.3f} ms, p50 {result['p50_ms']:.3f} ms, "
+                      f"p99 {result['p99_ms']:.3f} ms")
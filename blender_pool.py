@@ -0,0 +1,89 @@
+import json
+import queue
+import subprocess
+
+RESULT_MARKER = "@@blender_worker_result "
+
+
+class BlenderProcess:
+    def __init__(self, python_call):
+        self.popen = subprocess.Popen([python_call, "blender_worker.py"], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                      universal_newlines=True, bufsize=1)
+        self.jobs_done = 0
+        self.rss_mb = self.read_result()["rss_mb"]  # Waits until template.blend is loaded
+
+    def read_result(self):
+        for stdout_line in iter(self.popen.stdout.readline, ""):
+            if stdout_line.startswith(RESULT_MARKER):
+                return json.loads(stdout_line[len(RESULT_MARKER):])
+            print(stdout_line, end='')
+
+        raise RuntimeError(f"Blender worker exited with code {self.popen.wait()}")
+
+    def run(self, job):
+        self.popen.stdin.write(json.dumps(job) + "\n")
+        self.popen.stdin.flush()
+
+        result = self.read_result()
+        self.jobs_done += 1
+        self.rss_mb = result["rss_mb"]
+        return result
+
+    def close(self):
+        try:
+            self.popen.stdin.close()
+            self.popen.wait(timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            self.popen.kill()
+
+
+class BlenderPool:
+    # Long lived bpy processes (blender_worker.py) that keep template.blend loaded between jobs.
+    # Processes are started lazily and replaced after max_jobs jobs, when their memory goes over
+    # max_rss_mb, or when a job broke the scene
+
+    def __init__(self, python_call, size=2, max_jobs=50, max_rss_mb=4096):
+        self.python_call = python_call
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+
+        self.slots = queue.Queue()
+        for i in range(size):
+            self.slots.put(None)  # Empty slot, process gets started on first use
+
+    def run(self, job):
+        process = self.slots.get()
+        try:
+            if process is None:
+                process = BlenderProcess(self.python_call)
+
+            result = process.run(job)
+
+            if process.jobs_done >= self.max_jobs or process.rss_mb > self.max_rss_mb or "reset_error" in result:
+                print(f"Recycling Blender worker after {process.jobs_done} jobs, {process.rss_mb:.0f} MB")
+                process.close()
+                process = None
+        except Exception:
+            if process is not None:
+                process.popen.kill()
+            process = None
+            raise
+        finally:
+            self.slots.put(process)
+
+        if not result["success"]:
+            raise RuntimeError(f"Blender job {job} failed:\n{result['error']}")
+
+        return result
+
+    def prepare(self, file_name, output_file, temp_dir):
+        return self.run({"op": "prepare", "file_name": file_name, "output_file": output_file, "temp_dir": temp_dir})
+
+    def export(self, input_file, output_file):
+        return self.run({"op": "export", "input_file": input_file, "output_file": output_file})
+
+    def close(self):
+        while not self.slots.empty():
+            process = self.slots.get_nowait()
+            if process is not None:
+                process.close()
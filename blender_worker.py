@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+import time
+import resource
+import traceback
+
+import bpy
+
+from main import extract_model, import_models, template_objects, new_scene_objects, normalise_objects
+from export import import_gltf, export_obj
+from blender_pool import RESULT_MARKER
+
+# Long lived bpy process used by blender_pool.BlenderPool. Opens template.blend once and then takes
+# one JSON job per stdin line. Everything else printed to stdout is Blender/importer output,
+# the answer for a job is the single line starting with RESULT_MARKER
+
+DATA_COLLECTIONS = ["meshes", "materials", "images", "textures", "node_groups", "armatures", "actions", "curves",
+                    "cameras", "lights", "collections"]
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Peak instead of current outside Linux
+
+
+class TemplateScene:
+    def __init__(self, template_file="template.blend"):
+        bpy.ops.wm.open_mainfile(filepath=template_file)  # Open template project (moving camera and lights)
+        self.system_objects = template_objects()
+
+        # Remember template state, so reset() can bring the scene back without reopening the file
+        self.selection = {obj.name: obj.select_get() for obj in bpy.context.scene.objects}
+        self.matrices = {obj.name: obj.matrix_world.copy() for obj in bpy.context.scene.objects}
+        self.data_names = {collection: set(item.name for item in getattr(bpy.data, collection))
+                           for collection in DATA_COLLECTIONS}
+
+    def reset(self):
+        for obj in new_scene_objects(self.system_objects):
+            bpy.data.objects.remove(obj, do_unlink=True)
+
+        # Importers leave meshes, materials and images behind, drop everything that wasn't in the template
+        for collection in DATA_COLLECTIONS:
+            data = getattr(bpy.data, collection)
+            for item in list(data):
+                if item.name not in self.data_names[collection]:
+                    data.remove(item)
+
+        for obj in bpy.context.scene.objects:
+            obj.select_set(self.selection[obj.name])
+            obj.matrix_world = self.matrices[obj.name]
+        bpy.context.scene.cursor.location = (0, 0, 0)
+
+    def prepare(self, file_name, output_file, temp_dir):
+        timings = dict()
+
+        start = time.perf_counter()
+        extract_model(file_name, temp_dir)
+        timings["extract"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        import_models(temp_dir)
+        timings["import"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        normalise_objects(new_scene_objects(self.system_objects))
+        timings["normalise"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(output_file), copy=True)  # Keep template as current file
+        timings["save"] = time.perf_counter() - start
+
+        return timings
+
+    def export(self, input_file, output_file):  # Scanned scene.gltf to OBJ, on top of the template like before
+        timings = dict()
+
+        start = time.perf_counter()
+        import_gltf(input_file)
+        timings["import"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        export_obj(output_file)
+        timings["export"] = time.perf_counter() - start
+
+        return timings
+
+
+def main():
+    scene = TemplateScene()
+    print(RESULT_MARKER + json.dumps({"ready": True, "rss_mb": rss_mb()}), flush=True)
+
+    for line in sys.stdin:
+        job = json.loads(line)
+        result = {"success": True}
+        start = time.perf_counter()
+
+        try:
+            if job["op"] == "prepare":
+                result["timings"] = scene.prepare(job["file_name"], job["output_file"], job["temp_dir"])
+            elif job["op"] == "export":
+                result["timings"] = scene.export(job["input_file"], job["output_file"])
+            else:
+                raise ValueError(f"Unknown job {job['op']}")
+        except Exception:
+            result = {"success": False, "error": traceback.format_exc()}
+
+        reset_start = time.perf_counter()
+        try:
+            scene.reset()
+        except Exception:
+            result["reset_error"] = traceback.format_exc()  # Pool recycles the process, scene can't be trusted anymore
+
+        result.setdefault("timings", dict())
+        result["timings"]["reset"] = time.perf_counter() - reset_start
+        result["timings"]["total"] = time.perf_counter() - start
+        result["rss_mb"] = rss_mb()
+        print(RESULT_MARKER + json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    main()
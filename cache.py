@@ -0,0 +1,191 @@
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+HASH_READ_SIZE = 4 * 2 ** 20
+MISSING_HASH = ""  # Stored for tasks whose input archive is gone, so they aren't hashed over and over
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(HASH_READ_SIZE), b""):
+            sha256.update(data)
+
+    return sha256.hexdigest()
+
+
+def link_or_copy(src, dst):  # Hard links cost no space and survive eviction of the other name
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def directory_size(path):
+    size = 0
+    for dir_path, dir_names, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                size += os.path.getsize(os.path.join(dir_path, file_name))
+            except OSError:
+                pass
+
+    return size
+
+
+class ContentCache:
+    # Content addressed results under root/<hash>/<kind>/, kind is "blend" (prepared project.blend),
+    # "render" (frames) or "scan" (uploaded scan archive). Entries are evicted least recently used first
+    # once the cache is bigger than budget_bytes. Files are hard linked in and out when possible
+
+    def __init__(self, root, budget_bytes):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()  # {hash: size in bytes}, least recently used first
+        self.lock = threading.Lock()
+        self.lookups = dict()  # {kind: lookups}
+        self.hits = dict()  # {kind: hits}
+        self.bytes_saved = 0
+
+        os.makedirs(root, exist_ok=True)
+        found = []
+        for entry in os.scandir(root):
+            if entry.is_dir():
+                found.append((entry.stat().st_mtime, entry.name, directory_size(entry.path)))
+        for mtime, content_hash, size in sorted(found):
+            self.entries[content_hash] = size
+
+    def entry_dir(self, content_hash):
+        return os.path.join(self.root, content_hash)
+
+    def fetch(self, content_hash, kind, output_dir):
+        # Links the cached files of kind into output_dir, returns their paths there or None on a miss
+        kind_dir = os.path.join(self.entry_dir(content_hash), kind)
+        copied = []
+        with self.lock:
+            self.lookups[kind] = self.lookups.get(kind, 0) + 1
+            if content_hash in self.entries:
+                self.entries.move_to_end(content_hash)
+
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            size = 0
+            for entry in os.scandir(kind_dir):
+                dst = os.path.join(output_dir, entry.name)
+                if os.path.exists(dst):
+                    os.remove(dst)
+                link_or_copy(entry.path, dst)
+                copied.append(dst)
+                size += entry.stat().st_size
+        except FileNotFoundError:  # Not cached or evicted meanwhile
+            for path in copied:
+                os.remove(path)
+            copied = []
+
+        if not copied:
+            return None
+
+        os.utime(self.entry_dir(content_hash))  # Recency survives restarts
+        with self.lock:
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            self.bytes_saved += size
+
+        return copied
+
+    def put(self, content_hash, kind, paths):
+        # Stores files as kind of the entry, an existing kind is kept. Written to a temporary
+        # directory first, so fetch never sees half of the files
+        entry_dir = self.entry_dir(content_hash)
+        kind_dir = os.path.join(entry_dir, kind)
+        if os.path.exists(kind_dir) or not paths:
+            return
+
+        part_dir = f"{kind_dir}.{threading.get_ident()}.part"
+        os.makedirs(part_dir, exist_ok=True)
+        size = 0
+        try:
+            for path in paths:
+                link_or_copy(path, os.path.join(part_dir, os.path.basename(path)))
+                size += os.path.getsize(path)
+            os.rename(part_dir, kind_dir)
+        except OSError:  # Other thread stored the same kind first
+            shutil.rmtree(part_dir, ignore_errors=True)
+            return
+
+        with self.lock:
+            self.entries[content_hash] = self.entries.get(content_hash, 0) + size
+            self.entries.move_to_end(content_hash)
+        self.evict()
+
+    def evict(self):
+        while True:
+            with self.lock:
+                if sum(self.entries.values()) <= self.budget_bytes or len(self.entries) <= 1:
+                    return
+                content_hash, size = self.entries.popitem(last=False)
+
+            shutil.rmtree(self.entry_dir(content_hash), ignore_errors=True)
+            print(f"Evicted {content_hash} ({size / 2 ** 20:.1f} MB) from content cache")
+
+    def stats(self):
+        with self.lock:
+            lookups = sum(self.lookups.values())
+            hits = sum(self.hits.values())
+            return {"entries": len(self.entries), "size_bytes": sum(self.entries.values()),
+                    "budget_bytes": self.budget_bytes, "lookups": lookups, "hits": hits,
+                    "hit_rate": hits / lookups if lookups else 0.0, "bytes_saved": self.bytes_saved,
+                    "hits_by_kind": dict(self.hits)}
+
+
+class InputHasher:
+    # Hashes input archives of newly imported tasks in background. on_hashed(task, content_hash) is called
+    # for every task, with MISSING_HASH when its archive isn't in input_dir anymore
+
+    def __init__(self, store, input_dir, on_hashed=None, poll_interval=30, batch_size=100):
+        self.store = store
+        self.input_dir = input_dir
+        self.on_hashed = on_hashed
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.wakeup = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self.loop, name="input-hasher", daemon=True).start()
+
+    def notify(self):  # Called after new tasks were imported
+        self.wakeup.set()
+
+    def loop(self):
+        while True:
+            try:
+                while self.hash_batch() == self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Hashing input archives failed: {e}")
+
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def hash_batch(self):
+        tasks = self.store.unhashed(self.batch_size)
+        for task in tasks:
+            self.hash_task(task)
+
+        return len(tasks)
+
+    def hash_task(self, task):  # Also used directly when a task is prepared before the hasher got to it
+        path = os.path.join(self.input_dir, f"{task.name}.zip")
+        try:
+            content_hash = file_sha256(path)
+            weight = max(os.path.getsize(path) / 2 ** 20, 0.01)  # Bigger archives take longer to render and scan
+        except FileNotFoundError:
+            content_hash, weight = MISSING_HASH, None
+
+        self.store.set_content_hash(task.id, content_hash, weight)
+        if self.on_hashed is not None:
+            self.on_hashed(task, content_hash)
+
+        return content_hash
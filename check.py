@@ -1,9 +1,7 @@
-import os
-
-for dir_name in os.listdir("output/"):
-    path = os.path.join("output/", dir_name)
-
-    if not os.path.exists(os.path.join(path, "input.zip")):
-        print(dir_name)
+import sys
 
+from postprocess import main
 
+# Lists output directories without input.zip or with incomplete extractions, see postprocess.py --verify
+if __name__ == "__main__":
+    sys.exit(main(["--verify"] + sys.argv[1:]))
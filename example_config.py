@@ -2,3 +2,53 @@ ip_address = "127.0.0.1"
 port = 1303
 python_call = "python3"
 
+retry_after = 30  # Seconds a worker should wait before asking again when there is no work
+long_poll_timeout = 60  # Upper bound for ?wait=<seconds> on /get_task
+
+prefetch_depth = 4  # Render tasks kept prepared as output/<id>/project.blend ahead of worker requests
+prefetch_workers = 2  # Blender processes preparing them in parallel
+
+blender_pool_size = 3  # Long lived bpy processes with template.blend loaded, shared by prefetch and on demand preparation
+blender_pool_max_jobs = 50  # Restart a bpy process after this many models
+blender_pool_max_rss_mb = 4096  # or when it uses more memory than this
+
+upload_workers = 2  # Threads extracting and verifying submitted results in background
+
+use_x_sendfile = False  # Let a front proxy (nginx X-Accel / apache mod_xsendfile) send task files
+
+render_archive_mode = "cache"  # "cache": build render.zip from frames once and serve it with ranges, "stream": zip on the fly
+frame_pack_codec = "zstd"  # Workers asking for ?format=pack get frames as frame_pack stream, zlib when zstandard is missing
+frame_pack_level = 3
+frame_pack_delta = False  # Store rows as difference to the previous frame where that looks smaller
+
+render_frames = 300  # Frames in template.blend animation
+render_shards = 1  # Split every render task into this many frame ranges handed to different workers
+
+lease_ttl = 600  # Seconds a worker may stay silent (no heartbeat, upload or get_task) before its task is requeued
+max_retries = 3  # Expired leases per task and type before it's marked failed
+
+# Several servers can share tasks.db, input/ and output/ (python server.py --port <port> --node <name>)
+node_name = None  # Name of this server in leases and preparation claims, defaults to host:port
+work_poll_interval = 5  # Seconds a long polling worker waits before tasks.db is checked for work other servers made available
+task_db_journal_mode = "WAL"  # WAL works for servers on one host, "DELETE" for tasks.db on a network file system with locking
+
+input_poll_interval = 5  # Seconds between ./input scans when inotify_simple isn't installed
+
+cache_dir = "cache/"  # Prepared blends (and results) of identical input archives, keyed by sha256
+cache_budget_gb = 50  # Least recently used models are evicted above this size
+cache_reuse_outputs = False  # Also reuse render frames and scan results of identical archives
+
+log_buffer_lines = 10000  # Log lines kept in memory for /logs
+log_tail_timeout = 300  # Seconds a /logs/tail stream stays open, clients reconnect after that
+stats_max_age = 2  # Seconds /api/stats and the dashboard reuse computed stats
+throughput_window = 3600  # Seconds of finished tasks the throughput and ETA are based on
+api_page_size = 100  # Default tasks per page of /api/tasks and the dashboard, at most 1000
+
+scheduler_policy = "balanced"  # "balanced": by backlog and measured worker speed, "oldest": oldest unfinished stage first
+max_scan_backlog = 50  # Rendered models waiting for scan before workers that can do both are sent to scan
+
+slow_request_seconds = 10  # Requests slower than this are logged with the time of every stage they went through
+profile_requests = False  # Allow ?profile=1 on any request, its cProfile stats are written to profile_dir
+profile_dir = "profiles/"
+
+async_blocking_threads = 40  # asgi_server.py: threads for SQLite, Blender and zip work, connections themselves need none
@@ -0,0 +1,111 @@
+import os
+import io
+import shutil
+import tempfile
+import threading
+import zipfile
+from pathlib import PurePosixPath
+from concurrent.futures import ThreadPoolExecutor
+
+MODEL_EXTENSIONS = {".obj", ".mtl", ".gltf", ".glb", ".bin", ".fbx"}  # .bin holds gltf buffers
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".tga", ".bmp", ".tif", ".tiff", ".dds", ".exr", ".hdr", ".webp"}
+EXTRACT_EXTENSIONS = MODEL_EXTENSIONS | IMAGE_EXTENSIONS
+
+EXTRACT_WORKERS = min(8, os.cpu_count() or 1)
+IN_MEMORY_ARCHIVE_SIZE = 256 * 2 ** 20  # Bigger nested archives are spooled to a temp file instead of RAM
+COPY_BUFFER_SIZE = 2 ** 20
+
+
+def safe_member_path(name):  # Relative path inside the archive, None for entries escaping the target directory
+    parts = [part for part in PurePosixPath(name.replace('\\', '/')).parts if part not in ('', '.')]
+    if not parts or parts[0] == '/' or '..' in parts or ':' in parts[0]:
+        return None
+
+    return os.path.join(*parts)
+
+
+class ArchiveSource:
+    # Zip archive that can be opened by several threads at once. Outer archives are reopened from disk,
+    # nested ones are kept in memory (or a spooled temp file) so they never have to be written next to the model
+
+    def __init__(self, path=None, data=None, spool_file=None):
+        self.path = path
+        self.data = data
+        self.spool_file = spool_file
+        self.local = threading.local()
+        self.opened = []
+        self.lock = threading.Lock()
+
+    def open(self):
+        zip_file = getattr(self.local, "zip_file", None)
+        if zip_file is None:
+            if self.data is not None:
+                zip_file = zipfile.ZipFile(io.BytesIO(self.data))
+            else:
+                zip_file = zipfile.ZipFile(self.path or self.spool_file)
+            self.local.zip_file = zip_file
+            with self.lock:
+                self.opened.append(zip_file)
+
+        return zip_file
+
+    def close(self):
+        for zip_file in self.opened:
+            zip_file.close()
+        if self.spool_file is not None:
+            os.remove(self.spool_file)
+
+
+def read_nested(source, info, spool_dir):
+    with source.open().open(info) as member:
+        if info.file_size <= IN_MEMORY_ARCHIVE_SIZE:
+            return ArchiveSource(data=member.read())
+
+        spool_fd, spool_file = tempfile.mkstemp(suffix=".zip", dir=spool_dir)
+        with os.fdopen(spool_fd, "wb") as out:
+            shutil.copyfileobj(member, out, COPY_BUFFER_SIZE)
+        return ArchiveSource(spool_file=spool_file)
+
+
+def extract_member(source, info, target_path):
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with source.open().open(info) as member, open(target_path, "wb") as out:
+        shutil.copyfileobj(member, out, COPY_BUFFER_SIZE)
+
+    return target_path
+
+
+def extract_archive(archive_path, extract_dir, extensions=EXTRACT_EXTENSIONS, workers=EXTRACT_WORKERS):
+    # Extracts archive_path and every zip nested inside it into extract_dir, keeping only files with
+    # the given extensions. Nested archives are unpacked into the directory they were found in,
+    # like unzip did before. Returns paths of extracted files
+    os.makedirs(extract_dir, exist_ok=True)
+    extracted = []
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract") as executor:
+        level = [(ArchiveSource(path=str(archive_path)), extract_dir)]
+
+        while level:  # One nesting level at a time, members of every archive on the level go to the pool together
+            file_jobs, nested_jobs = [], []
+            for source, target_dir in level:
+                for info in source.open().infolist():
+                    relative_path = safe_member_path(info.filename)
+                    if info.is_dir() or relative_path is None:
+                        continue
+
+                    target_path = os.path.join(target_dir, relative_path)
+                    suffix = os.path.splitext(relative_path)[1].lower()
+                    if suffix == ".zip":
+                        nested_jobs.append((executor.submit(read_nested, source, info, extract_dir),
+                                            os.path.dirname(target_path)))
+                    elif suffix in extensions:
+                        file_jobs.append(executor.submit(extract_member, source, info, target_path))
+
+            extracted += [job.result() for job in file_jobs]
+            next_level = [(job.result(), target_dir) for job, target_dir in nested_jobs]
+
+            for source, target_dir in level:
+                source.close()
+            level = next_level
+
+    return extracted
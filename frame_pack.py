@@ -0,0 +1,297 @@
+import os
+import sys
+import lzma
+import zlib
+import struct
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # Optional, zlib is used instead
+    zstandard = None
+
+# Transport format for rendered frames, an alternative to render.zip for the render -> scan handoff.
+# Frames of an orbit differ little from their neighbours, but every PNG is deflated on its own with a
+# 32 KB window, so that's lost. Here PNG frames are stored with their image data inflated, and all files
+# go through one zstd, lzma or zlib stream whose window spans several frames. With use_delta, rows that
+# get closer to zero that way are stored as difference to the same row of the previous frame (off by
+# default, the codec window finds more on orbits than pixel differences, see bench_frame_pack.py).
+# Unpacked frames are deflated again: same pixels and chunks, not the same bytes. Other files are stored
+# as they are. Packing and unpacking stream, only the current and previous frame and the codec window
+# are in memory:
+#   "FPK1", codec (u8), then compressed: records of mode (u8), name length (u16), crc32 (u32),
+#   payload length (u64), name, payload; a record with mode 255 ends the stream
+#   PNG payload: head length (u32), head, tail length (u32), tail, image data (head is the signature and
+#   chunks before IDAT, tail the chunks after it), delta records start the image data with a row bitmap
+MAGIC = b"FPK1"
+PACK_EXTENSION = ".fpk"
+PACK_MIMETYPE = "application/x-frame-pack"
+CODECS = {"none": 0, "zlib": 1, "lzma": 2, "zstd": 3}
+MODE_FILE, MODE_PNG, MODE_PNG_DELTA, MODE_END = 0, 1, 2, 255
+RECORD = struct.Struct(">BHIQ")
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+IDAT_LEVEL = 6  # Deflate level of unpacked frames, what Blender and most encoders use
+WINDOW_LOG = 24  # 16 MB lzma/zstd window, two 1080p RGBA frames
+READ_SIZE = 2 ** 16
+
+
+def codec_available(codec):
+    return codec != "zstd" or zstandard is not None
+
+
+class Compressor:  # compress() and flush() for every codec
+    def __init__(self, codec, level):
+        if codec == "zlib":
+            self.compressor = zlib.compressobj(level)
+        elif codec == "lzma":
+            self.compressor = lzma.LZMACompressor(filters=[{"id": lzma.FILTER_LZMA2, "preset": level,
+                                                            "dict_size": 2 ** WINDOW_LOG}])
+        elif codec == "zstd":
+            params = zstandard.ZstdCompressionParameters.from_level(level, window_log=WINDOW_LOG)
+            self.compressor = zstandard.ZstdCompressor(compression_params=params).compressobj()
+        else:
+            self.compressor = None
+
+    def compress(self, data):
+        return self.compressor.compress(data) if self.compressor is not None else data
+
+    def flush(self):
+        return self.compressor.flush() if self.compressor is not None else b""
+
+
+class DecompressingReader:
+    # File like read() over the decompressed stream, output of a single step is bounded by max_output
+    def __init__(self, stream, codec, max_output=READ_SIZE * 16):
+        self.stream = stream
+        self.codec = codec
+        self.max_output = max_output
+        self.buffer = bytearray()
+        self.pending = b""  # zlib input not decompressed yet
+        if codec == "zlib":
+            self.decompressor = zlib.decompressobj()
+        elif codec == "lzma":
+            self.decompressor = lzma.LZMADecompressor()
+        elif codec == "zstd":
+            self.decompressor = zstandard.ZstdDecompressor().stream_reader(stream, read_size=READ_SIZE)
+
+    def fill(self):  # False at the end of the stream
+        if self.codec == "zstd":
+            data = self.decompressor.read(self.max_output)
+            self.buffer += data
+            return bool(data)
+
+        if self.codec == "zlib":
+            if not self.pending:
+                self.pending = self.stream.read(READ_SIZE)
+                if not self.pending and not self.decompressor.unconsumed_tail:
+                    return False
+            self.buffer += self.decompressor.decompress(self.pending, self.max_output)
+            self.pending = self.decompressor.unconsumed_tail
+            return True
+
+        data = b""
+        if self.decompressor.needs_input:
+            data = self.stream.read(READ_SIZE)
+            if not data:
+                return False
+        self.buffer += self.decompressor.decompress(data, self.max_output)
+        return True
+
+    def read(self, size):
+        while len(self.buffer) < size and self.fill():
+            pass
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def split_png(data):  # (head, inflated image data, tail), None when it isn't a PNG with one run of IDAT chunks
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+
+    position, idat_start, idat_end, idat = len(PNG_SIGNATURE), None, None, []
+    while position + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[position:position + 8])
+        if chunk_type == b"IDAT":
+            if idat_end is not None:  # IDAT chunks have to be consecutive
+                return None
+            idat_start = position if idat_start is None else idat_start
+            idat.append(data[position + 8:position + 8 + length])
+        elif idat_start is not None and idat_end is None:
+            idat_end = position
+        position += 12 + length
+
+    if idat_start is None or idat_end is None:
+        return None
+    try:
+        return data[:idat_start], zlib.decompress(b"".join(idat)), data[idat_end:]
+    except zlib.error:
+        return None
+
+
+def join_png(head, image_data, tail):
+    compressed = zlib.compress(image_data, IDAT_LEVEL)
+    chunk = struct.pack(">I", len(compressed)) + b"IDAT" + compressed
+    return head + chunk + struct.pack(">I", zlib.crc32(chunk[4:])) + tail
+
+
+def row_size(head):  # Bytes per filtered row of a non interlaced PNG, None when rows can't be compared
+    width, height, bit_depth, colour_type, compression, filter_method, interlace = \
+        struct.unpack(">IIBBBBB", head[16:29])
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}.get(colour_type)
+    if interlace or channels is None:
+        return None
+    return 1 + (width * channels * bit_depth + 7) // 8
+
+
+def row_cost(rows):  # Sum of absolute values as signed bytes, the heuristic PNG encoders pick filters with
+    return np.abs(rows.view(np.int8).astype(np.int16)).sum(axis=1)
+
+
+def delta(current, previous, size):
+    # Row bitmap, then every row either as it is or as byte wise difference mod 256 to the previous frame
+    rows = np.frombuffer(current, np.uint8).reshape(-1, size)
+    difference = rows - np.frombuffer(previous, np.uint8).reshape(-1, size)
+    use_delta = row_cost(difference) < row_cost(rows)
+    return np.packbits(use_delta).tobytes() + np.where(use_delta[:, None], difference, rows).tobytes()
+
+
+def undelta(stored, previous, size):
+    row_count = len(previous) // size
+    bitmap_size = (row_count + 7) // 8
+    use_delta = np.unpackbits(np.frombuffer(stored[:bitmap_size], np.uint8), count=row_count).astype(bool)
+    rows = np.frombuffer(stored[bitmap_size:], np.uint8).reshape(-1, size)
+    return np.where(use_delta[:, None], rows + np.frombuffer(previous, np.uint8).reshape(-1, size), rows).tobytes()
+
+
+def png_checksum(head, image_data, tail):
+    return zlib.crc32(image_data, zlib.crc32(tail, zlib.crc32(head)))
+
+
+def pack(files, codec="zstd", level=3, use_delta=False):
+    # Generator of the packed stream for the given files, in this order. Frame order matters for the deltas
+    if not codec_available(codec):
+        codec = "zlib"
+    yield MAGIC + bytes([CODECS[codec]])
+
+    compressor = Compressor(codec, level)
+    previous = None
+    for path in files:
+        with open(path, "rb") as file:
+            data = file.read()
+
+        png = split_png(data) if path.lower().endswith(".png") else None
+        if png is None:
+            mode, checksum, payload = MODE_FILE, zlib.crc32(data), [data]
+        else:
+            head, image_data, tail = png
+            mode, size, stored = MODE_PNG, row_size(head), image_data
+            if use_delta and size is not None and previous is not None and len(previous) == len(image_data) \
+                    and len(image_data) % size == 0:
+                mode, stored = MODE_PNG_DELTA, delta(image_data, previous, size)
+            checksum = png_checksum(head, image_data, tail)
+            payload = [struct.pack(">I", len(head)), head, struct.pack(">I", len(tail)), tail, stored]
+            previous = image_data
+
+        name = os.path.basename(path).encode()
+        chunks = [RECORD.pack(mode, len(name), checksum, sum(len(part) for part in payload)), name] + payload
+        compressed = b"".join(compressor.compress(chunk) for chunk in chunks)
+        if compressed:
+            yield compressed
+
+    yield compressor.compress(RECORD.pack(MODE_END, 0, 0, 0)) + compressor.flush()
+
+
+def read_exact(stream, size):
+    chunks = []
+    while size > 0:
+        data = stream.read(size)
+        if not data:
+            raise ValueError("Frame pack ends early")
+        chunks.append(data)
+        size -= len(data)
+    return b"".join(chunks)
+
+
+def unpack(stream, output_dir, keep=None):
+    # Reads a packed stream from a file like object and writes its files to output_dir, returns their paths.
+    # Only files whose name keep(name) accepts are written, when given.
+    # Raises ValueError for a broken stream, files written before that stay
+    header = read_exact(stream, len(MAGIC) + 1)
+    codecs = {number: codec for codec, number in CODECS.items()}
+    if header[:len(MAGIC)] != MAGIC or header[-1] not in codecs:
+        raise ValueError("Not a frame pack")
+    codec = codecs[header[-1]]
+    if not codec_available(codec):
+        raise ValueError(f"Frame pack needs {codec}, which isn't installed")
+
+    reader = DecompressingReader(stream, codec) if codec != "none" else stream
+    os.makedirs(output_dir, exist_ok=True)
+    paths, previous = [], None
+    while True:
+        try:
+            mode, name_length, checksum, payload_length = RECORD.unpack(read_exact(reader, RECORD.size))
+        except (zlib.error, lzma.LZMAError, zstandard.ZstdError if zstandard else zlib.error) as e:
+            raise ValueError(f"Broken frame pack: {e}")
+        if mode == MODE_END:
+            return paths
+
+        name = os.path.basename(read_exact(reader, name_length).decode())
+        if not name:
+            raise ValueError("Frame pack record without file name")
+        payload = read_exact(reader, payload_length)
+
+        if mode == MODE_FILE:
+            data, crc = payload, zlib.crc32(payload)
+        elif mode in (MODE_PNG, MODE_PNG_DELTA):
+            head_length = struct.unpack(">I", payload[:4])[0]
+            head = payload[4:4 + head_length]
+            tail_length = struct.unpack(">I", payload[4 + head_length:8 + head_length])[0]
+            tail = payload[8 + head_length:8 + head_length + tail_length]
+            image_data = payload[8 + head_length + tail_length:]
+            if mode == MODE_PNG_DELTA:
+                size = row_size(head)
+                if previous is None or size is None or len(previous) % size:
+                    raise ValueError(f"Frame pack delta of {name} without matching previous frame")
+                image_data = undelta(image_data, previous, size)
+            previous = image_data
+            crc = png_checksum(head, image_data, tail)
+            data = join_png(head, image_data, tail)
+        else:
+            raise ValueError(f"Unknown frame pack record {mode}")
+
+        if crc != checksum:
+            raise ValueError(f"Checksum mismatch for {name} in frame pack")
+        if keep is not None and not keep(name):
+            continue
+
+        path = os.path.join(output_dir, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        paths.append(path)
+
+
+def pack_file(files, pack_path, codec="zstd", level=3, use_delta=False):
+    with open(pack_path + ".part", "wb") as file:
+        for data in pack(files, codec, level, use_delta):
+            file.write(data)
+    os.replace(pack_path + ".part", pack_path)
+
+
+def unpack_file(pack_path, output_dir, keep=None):
+    with open(pack_path, "rb") as file:
+        return unpack(file, output_dir, keep)
+
+
+if __name__ == "__main__":
+    # python frame_pack.py pack <frames dir> <file.fpk> [codec] [level]
+    # python frame_pack.py unpack <file.fpk> <output dir>
+    if len(sys.argv) >= 4 and sys.argv[1] == "pack":
+        frames = sorted(os.path.join(sys.argv[2], name) for name in os.listdir(sys.argv[2]) if name.endswith(".png"))
+        pack_file(frames, sys.argv[3], *sys.argv[4:5], *[int(level) for level in sys.argv[5:6]])
+    elif len(sys.argv) == 4 and sys.argv[1] == "unpack":
+        print(f"Unpacked {len(unpack_file(sys.argv[2], sys.argv[3]))} files")
+    else:
+        print("python frame_pack.py pack <frames dir> <file.fpk> [codec] [level] | unpack <file.fpk> <output dir>")
+        sys.exit(1)
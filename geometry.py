@@ -0,0 +1,59 @@
+import numpy as np
+
+# Geometry math of model normalisation on plain arrays, so it runs (and can be checked) without Blender.
+# Vertices of all objects are stacked into one (N, 3) array, counts[i] is the number of rows of object i
+
+
+def transform_points(points, matrix):  # (N, 3) points by a 4x4 matrix
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+def object_bounds(points, counts):
+    # Per object axis aligned bounds, (M, 3) mins and maxs. Objects without vertices are left out
+    counts = np.asarray(counts, dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    offsets = offsets[counts > 0]
+    if len(offsets) == 0:
+        empty = np.empty((0, 3))
+        return empty, empty
+
+    return np.minimum.reduceat(points, offsets, axis=0), np.maximum.reduceat(points, offsets, axis=0)
+
+
+def max_dimension(mins, maxs):  # Biggest side of any single object, what max(obj.dimensions) gave per object
+    return float(np.max(maxs - mins))
+
+
+def bounding_box(mins, maxs):
+    return mins.min(axis=0), maxs.max(axis=0)
+
+
+def scale_matrix(scale_factor):
+    matrix = np.eye(4)
+    matrix[:3, :3] *= scale_factor
+    return matrix
+
+
+def translation_matrix(offset):
+    matrix = np.eye(4)
+    matrix[:3, 3] = offset
+    return matrix
+
+
+def normalise_matrix(points, counts, target_dimension):
+    # Matrix that scales the model so its biggest object measures target_dimension and moves the center
+    # of the scaled bounding box to the origin. Returns (matrix, max dimension before scaling)
+    mins, maxs = object_bounds(points, counts)
+    if len(mins) == 0:
+        raise ValueError("Model has no vertices")
+
+    max_scale = max_dimension(mins, maxs)
+    if max_scale <= 0:
+        raise ValueError("Model has no extent")
+
+    scale_factor = target_dimension / max_scale
+    bbox_min, bbox_max = bounding_box(mins, maxs)
+    center = (bbox_min + bbox_max) / 2 * scale_factor
+
+    return translation_matrix(-center) @ scale_matrix(scale_factor), max_scale
@@ -0,0 +1,128 @@
+import time
+import uuid
+import threading
+from dataclasses import dataclass
+
+from task_store import Task
+
+
+@dataclass
+class Lease:
+    worker: str  # None once the result was uploaded and the task waits for its extraction
+    task: object
+    token: str
+    expires_at: float
+    node: str = None  # Server that granted the lease or is extracting the result
+
+
+def first_lease(cursor):  # Rows are fetched to the end, so the statement is finished and its write lock released
+    rows = cursor.fetchall()
+    return row_lease(rows[0]) if rows else None
+
+
+def row_lease(row):
+    shard = row["shard"] if row["shard"] >= 0 else None
+    task = Task(int(row["task_id"]), row["filename"], row["type"], row["start_time"], shard, row["frame_start"],
+                row["frame_end"], row["weight"])
+    return Lease(row["worker"], task, row["token"], row["expires_at"], row["node"])
+
+
+class LeaseManager:
+    # One lease per worker. A lease lives for ttl seconds after it was granted or last renewed,
+    # expired leases are collected by the reaper and their tasks go back to the queue.
+    # Leases are rows of the leases table in the task store, so every server sharing tasks.db sees the same
+    # workers: a worker may get its task from one server and send heartbeats and results to another
+
+    def __init__(self, store, ttl=600, node=None):
+        self.store = store
+        self.ttl = ttl
+        self.node = node
+
+    def grant(self, worker, task):
+        lease = Lease(worker, task, uuid.uuid4().hex, time.time() + self.ttl, self.node)
+        shard = task.shard if task.shard is not None else -1
+
+        conn = self.store.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM leases WHERE worker = ?", (worker,))
+            conn.execute("INSERT OR REPLACE INTO leases (worker, task_id, type, shard, filename, start_time, frame_start, "
+                         "frame_end, weight, token, expires_at, node) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (worker, task.id, task.type, shard, task.name, task.start_time, task.frame_start, task.frame_end,
+                          task.weight, lease.token, lease.expires_at, self.node))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return lease
+
+    def get(self, worker, token=None):  # None when the worker has no lease or the token belongs to an older one
+        return first_lease(self.store.connection().execute(
+            "SELECT * FROM leases WHERE worker = ? AND (? IS NULL OR token = ?)", (worker, token, token)))
+
+    def renew(self, worker, token=None):
+        return first_lease(self.store.connection().execute(
+            "UPDATE leases SET expires_at = ? WHERE worker = ? AND (? IS NULL OR token = ?) RETURNING *",
+            (time.time() + self.ttl, worker, token, token)))
+
+    def release(self, worker, token=None):
+        return first_lease(self.store.connection().execute(
+            "DELETE FROM leases WHERE worker = ? AND (? IS NULL OR token = ?) RETURNING *", (worker, token, token)))
+
+    def hand_over(self, worker, token=None):
+        # Frees the worker once its result is uploaded. The task keeps a lease without worker until finish(),
+        # so it's requeued if the server extracting the result stops before that
+        return first_lease(self.store.connection().execute(
+            "UPDATE leases SET worker = NULL, expires_at = ?, node = ? WHERE worker = ? AND (? IS NULL OR token = ?) "
+            "RETURNING *", (time.time() + self.ttl, self.node, worker, token, token)))
+
+    def renew_extractions(self):
+        # Extends the leases of results this server is extracting, they only run out when the server stops
+        self.store.connection().execute("UPDATE leases SET expires_at = ? WHERE worker IS NULL AND node = ?",
+                                        (time.time() + self.ttl, self.node))
+
+    def finish(self, task):  # Drops the lease left by hand_over()
+        self.store.connection().execute(
+            "DELETE FROM leases WHERE task_id = ? AND type = ? AND shard = ? AND worker IS NULL",
+            (task.id, task.type, task.shard if task.shard is not None else -1))
+
+    def workers(self):
+        return [row[0] for row in self.store.connection().execute("SELECT worker FROM leases WHERE worker IS NOT NULL")]
+
+    def expired(self):
+        # Removes and returns leases that ran out. One statement, so with several servers reaping every lease
+        # is returned to exactly one of them
+        return [row_lease(row) for row in self.store.connection().execute(
+            "DELETE FROM leases WHERE expires_at < ? RETURNING *", (time.time(),)).fetchall()]
+
+
+class LeaseReaper:
+    def __init__(self, leases, on_expired, interval=30, sweep=None):
+        self.leases = leases
+        self.on_expired = on_expired
+        self.interval = interval
+        self.sweep = sweep  # Called every round as well, for tasks that lost their lease some other way
+
+    def start(self):
+        threading.Thread(target=self.loop, name="lease-reaper", daemon=True).start()
+
+    def loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.leases.renew_extractions()
+            except Exception as e:
+                print(f"Failed to renew leases of extractions: {e}")
+
+            for lease in self.leases.expired():
+                try:
+                    self.on_expired(lease)
+                except Exception as e:
+                    print(f"Failed to requeue expired lease of {lease.worker}: {e}")
+
+            if self.sweep is not None:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f"Failed to requeue orphaned tasks: {e}")
@@ -0,0 +1,47 @@
+import time
+import threading
+from collections import deque
+
+
+class LogBuffer:
+    # Last max_lines log lines, numbered so readers can continue where they stopped
+
+    def __init__(self, max_lines=10000):
+        self.lines = deque(maxlen=max_lines)  # (sequence number, line)
+        self.seq = 0
+        self.changed = threading.Condition()
+
+    def append(self, line):
+        with self.changed:
+            self.seq += 1
+            self.lines.append((self.seq, line))
+            self.changed.notify_all()
+
+    def since(self, seq, limit=None):  # (last sequence number, lines after seq), only what is still buffered
+        with self.changed:
+            lines = [line for line_seq, line in self.lines if line_seq > seq]
+            last = self.seq
+
+        if limit is not None:
+            lines = lines[-limit:] if limit > 0 else []  # lines[-0:] would be all of them
+        return last, lines
+
+    def text(self):
+        return ''.join(line + '\n' for line in self.since(0)[1])
+
+    def wait(self, seq, timeout):  # Blocks until there are lines after seq or timeout passed
+        with self.changed:
+            return self.changed.wait_for(lambda: self.seq > seq, timeout)
+
+    def follow(self, lines=100, timeout=300):
+        # Generator for a streaming tail: the last lines, then new ones as they come, for at most timeout seconds
+        seq, backlog = self.since(0, lines)
+        for line in backlog:
+            yield line + '\n'
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.wait(seq, deadline - time.monotonic()):
+                seq, new_lines = self.since(seq)
+                for line in new_lines:
+                    yield line + '\n'
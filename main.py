@@ -4,6 +4,11 @@ import shutil
 from pathlib import Path, PurePath
 import bmesh
 import subprocess
+import numpy as np
+from mathutils import Matrix
+
+from extract import extract_archive
+from geometry import normalise_matrix, transform_points
 
 MAX_DIMENSION = 12
 
@@ -12,28 +17,6 @@ def download_model(link):
     pass
 
 
-def join_path_parts(path_parts):
-    ans = ""
-    for part in path_parts:
-        ans = os.path.join(ans, part)
-
-    return ans
-
-
-def unzip_recursively(zip_path):  # Unzip main archive if one exists
-    if zip_path.suffix == ".zip":
-        split_path = PurePath(zip_path).parts
-        extract_dir = os.path.join('./temp/', join_path_parts(split_path[1:-1]))
-        print(extract_dir)
-
-        os.system(f"unzip {zip_path} -d {extract_dir}")  # Unzip archive
-        os.remove(zip_path)
-
-        for root, dirs, files in os.walk(join_path_parts(split_path[:-1])):
-            for filename in files:
-                unzip_recursively(Path(os.path.join(root, filename)))
-
-
 def execute(cmd):
     popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
     for stdout_line in iter(popen.stdout.readline, ""):
@@ -44,25 +27,19 @@ def execute(cmd):
         raise subprocess.CalledProcessError(return_code, cmd)
 
 
-def orbit_render(file_name, output_file='project.blend'):
-    print(file_name, output_file)
+def extract_model(file_name, temp_dir='./temp'):
     input_path = Path(os.path.join('./input', file_name))
-    extract_path = Path(os.path.join('./temp', file_name))
 
     # Clear working directory
-    os.system(f"rm -rf ./temp/*")
-    os.system(f"cp -r {input_path} ./temp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
 
     print("Starting unzip")
-    unzip_recursively(extract_path)
-    print("Unzip successful")
+    extracted = extract_archive(input_path, temp_dir)  # Straight from ./input, nested archives included
+    print(f"Unzip successful, {len(extracted)} files")
 
-    bpy.ops.wm.open_mainfile(filepath="template.blend")  # Open template project (moving camera and lights)
-    system_objects = []
-    for name in bpy.context.scene.objects:  # Save all object names from template
-        system_objects.append(name.name)
 
-    for root, dirs, files in os.walk("./temp"):
+def import_models(temp_dir='./temp'):
+    for root, dirs, files in os.walk(temp_dir):
         for filename in files:
             if Path(filename).suffix == ".obj":
                 bpy.ops.import_scene.obj(filepath=os.path.join(root, filename), filter_glob="*.obj;*.mtl",
@@ -87,41 +64,77 @@ def orbit_render(file_name, output_file='project.blend'):
                                          automatic_bone_orientation=False, primary_bone_axis='Y',
                                          secondary_bone_axis='X', use_prepost_rot=True, axis_forward='-Z', axis_up='Y')
 
+
+def template_objects():  # Save all object names from template
+    system_objects = []
+    for name in bpy.context.scene.objects:
+        system_objects.append(name.name)
+
+    return system_objects
+
+
+def new_scene_objects(system_objects):
     all_objects = bpy.context.scene.objects  # Get all objects
-    new_objects = [all_objects[i] for i, elem in enumerate(all_objects) if elem.name not in system_objects]
+    return [all_objects[i] for i, elem in enumerate(all_objects) if elem.name not in system_objects]
 
-    max_scale = -1000
-    for obj in new_objects:  # Calculate max size of all objects
-        obj.select_set(True)
-        bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-        max_scale = max(max_scale, max(obj.dimensions))
 
-    scale_factor = MAX_DIMENSION / max_scale
-    print(f"Model max scale: {max_scale}, scaling to {scale_factor}x to normalise size")
+def mesh_points(meshes):  # World space vertices of all meshes stacked into one array, plus vertex count per mesh
+    counts = np.array([len(obj.data.vertices) for obj in meshes], dtype=np.int64)
+    points = np.empty(int(counts.sum()) * 3, dtype=np.float32)
 
-    bpy.ops.transform.resize(value=(scale_factor, scale_factor, scale_factor))  # Resize
-    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)  # Apple transforms to all objects
+    offset = 0
+    for obj, count in zip(meshes, counts):
+        obj.data.vertices.foreach_get("co", points[offset:offset + count * 3])
+        offset += count * 3
 
-    # Bounding box
-    bound_box_max, bound_box_min = [-1e7, -1e7, -1e7], [1e7, 1e7, 1e7]
+    return points.reshape(-1, 3).astype(np.float64), counts
 
-    for obj in new_objects:
-        for point in obj.bound_box:
-            for i in range(3):
-                bound_box_max[i] = max(bound_box_max[i], point[i] + obj.matrix_world.translation[i])
 
-            for i in range(3):
-                bound_box_min[i] = min(bound_box_min[i], point[i] + obj.matrix_world.translation[i])
+def normalise_objects(new_objects):
+    meshes = [obj for obj in new_objects if obj.type == 'MESH']
 
-    bpy.context.scene.cursor.location = ((bound_box_max[0] + bound_box_min[0]) / 2,
-                                         (bound_box_max[1] + bound_box_min[1]) / 2,
-                                         (bound_box_max[2] + bound_box_min[2]) / 2)
+    # Bake object transforms into mesh data, what transform_apply did. Parents are dropped first,
+    # so every object keeps its place when its own matrix becomes identity
+    world_matrices = [obj.matrix_world.copy() for obj in new_objects]
+    for obj, matrix in zip(new_objects, world_matrices):
+        obj.parent = None
+        obj.matrix_world = matrix
 
-    for obj in new_objects:  # Center by cursor position
-        bpy.ops.object.origin_set(type='ORIGIN_CURSOR')
-        obj.location = (0, 0, 0)
+    for obj in meshes:
+        if obj.data.users > 1:  # Linked duplicates would get the transform twice
+            obj.data = obj.data.copy()
+        obj.data.transform(obj.matrix_world)
+        obj.matrix_world = Matrix.Identity(4)
+
+    points, counts = mesh_points(meshes)
+    matrix, max_scale = normalise_matrix(points, counts, MAX_DIMENSION)
+    print(f"Model max scale: {max_scale}, scaling to {matrix[0][0]}x to normalise size")
+
+    # Uniform scale and translation only, normals keep their direction, so coordinates are written directly
+    points = transform_points(points, matrix).astype(np.float32).ravel()
+    offset = 0
+    for obj, count in zip(meshes, counts):
+        obj.data.vertices.foreach_set("co", points[offset:offset + count * 3])
+        obj.data.update()
+        offset += count * 3
+
+    for obj in new_objects:
+        if obj.type != 'MESH':  # Empties, cameras or lights from the archive move with the model
+            obj.matrix_world = Matrix(matrix.tolist()) @ obj.matrix_world
+        obj.select_set(True)
     bpy.context.scene.cursor.location = (0, 0, 0)
 
+
+def orbit_render(file_name, output_file='project.blend', temp_dir='./temp'):
+    print(file_name, output_file)
+    extract_model(file_name, temp_dir)
+
+    bpy.ops.wm.open_mainfile(filepath="template.blend")  # Open template project (moving camera and lights)
+    system_objects = template_objects()
+
+    import_models(temp_dir)
+    normalise_objects(new_scene_objects(system_objects))
+
     # Save project
     bpy.ops.wm.save_as_mainfile(filepath=os.path.abspath(output_file))
 
@@ -0,0 +1,170 @@
+import os
+import time
+import bisect
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Counters and histograms in Prometheus text format for /metrics. Recording is a lock and a few additions,
+# gauges are callbacks that only run while /metrics is scraped. Stages of the current request are also
+# collected as spans, so slow requests can be logged with where their time went
+
+SECONDS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+
+
+def label_text(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.values = dict()  # {label values: total}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{label_text(self.labels, label_values)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labels=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = list(buckets)
+        self.values = dict()  # {label values: [count per bucket..., count above last bucket, sum]}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            values = sorted((label_values, list(counts)) for label_values, counts in self.values.items())
+
+        for label_values, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                bucket_labels = label_text(self.labels + ("le",), label_values + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{label_text(self.labels, label_values)} {counts[-1]}")
+            lines.append(f"{self.name}_count{label_text(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    # Value read when scraped: callback returns a number, or {label values: number} when there are labels
+    def __init__(self, name, help_text, callback, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+        self.labels = labels
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        value = self.callback()
+        if not self.labels:
+            value = {(): value}
+        for label_values, number in sorted(value.items()):
+            lines.append(f"{self.name}{label_text(self.labels, label_values)} {number}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines += metric.render()
+            except Exception as e:  # A gauge whose source isn't there yet shouldn't break the whole scrape
+                lines.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+stage_seconds = registry.add(Histogram("dispatch_stage_seconds", "Time spent per stage of the pipeline", ("stage",)))
+request_seconds = registry.add(Histogram("dispatch_request_seconds", "Time per request by endpoint", ("endpoint",)))
+bytes_in = registry.add(Counter("dispatch_received_bytes_total", "Bytes uploaded by workers", ("worker",)))
+bytes_out = registry.add(Counter("dispatch_sent_bytes_total", "Bytes sent to workers, task files and answers", ("worker",)))
+
+spans = threading.local()  # Stages of the request handled by this thread, [(stage, start offset, seconds)]
+
+
+def start_spans():
+    spans.start = time.perf_counter()
+    spans.stages = []
+
+
+def take_spans():  # Stages since start_spans(), also stops collecting on this thread
+    stages = getattr(spans, "stages", None)
+    spans.stages = None
+    return stages or []
+
+
+@contextmanager
+def stage(name):
+    # Times a block into dispatch_stage_seconds, and into the span trace when a request is being handled
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        stage_seconds.observe(seconds, name)
+        stages = getattr(spans, "stages", None)
+        if stages is not None:
+            stages.append((name, start - spans.start, seconds))
+
+
+def format_spans(stages):
+    return ", ".join(f"{name} +{offset:.3f}s {seconds:.3f}s" for name, offset, seconds in stages)
+
+
+def counted(chunks, counter, *label_values):  # Passes a streamed body through, counting its bytes when sent
+    for chunk in chunks:
+        counter.inc(len(chunk), *label_values)
+        yield chunk
+
+
+class RequestProfiler:
+    # cProfile for single requests, dumped as <profile_dir>/<time>_<endpoint>.prof for snakeviz/pstats
+    def __init__(self, profile_dir="profiles/"):
+        self.profile_dir = profile_dir
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def stop(self, profile, endpoint):
+        profile.disable()
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{endpoint}_{threading.get_ident()}.prof")
+        profile.dump_stats(path)
+        return path
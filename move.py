@@ -1,53 +1,47 @@
 import os
-import numpy as np
-from glob import glob
+import sys
+import json
 import shutil
-
-
-def get_levenshtein_distance(first_word: str, second_word: str) -> int:
-    n, m = len(second_word), len(first_word)
-    dp = np.zeros((m + 1, n + 1))
-
-    dp[0][0] = 0
-    for j in range(1, n + 1):
-        dp[0][j] = dp[0][j - 1] + 1
-
-    for i in range(1, m + 1):
-        dp[i][0] = dp[i - 1][0] + 1
-        for j in range(1, n + 1):
-            if first_word[i - 1] != second_word[j - 1]:
-                dp[i][j] = min(dp[i - 1][j] + 1, dp[i][j - 1] + 1,
-                              dp[i - 1][j - 1] + 1)
-            else:
-                dp[i][j] = dp[i - 1][j - 1]
-
-    return int(dp[m][n])
-
-
-for dir_name in os.listdir("output/"):
-    zip_name = ''.join(dir_name.split("_")[1:]) + ".zip"
-
-    done_path = os.path.join("done/", zip_name)
-    target_zip = os.path.join("output/", dir_name, "input.zip")
-    
-    if os.path.exists(target_zip):
-        continue
-
-    if os.path.exists(done_path):
-        shutil.move(done_path, target_zip)
-    else:
-        minn = 1e9 + 7
-        best_file = ""
-
-        for done_file in os.listdir("done/"):
-            dist = get_levenshtein_distance(zip_name, done_file)
-
-            if dist < minn:
-                minn = dist
-                best_file = done_file
-
-        if best_file != "":
-            if minn <= 10:
-                print(minn, zip_name, best_file)
-                shutil.move(os.path.join("done/", best_file), target_zip)
-
+from collections import defaultdict
+
+from reconcile import reconcile
+
+# Moves archives from done/ into the output directory they belong to, as output/<dir>/input.zip.
+# Output directories are named <index>_<model name>. Names are matched exactly, after normalisation
+# or by edit distance up to MAX_DISTANCE. Ambiguous matches, also archives whose model name belongs to several
+# output directories, are left alone and written to the report
+MAX_DISTANCE = 10
+REPORT_FILE = "move_report.json"
+
+if __name__ == "__main__":
+    dry_run = "--dry-run" in sys.argv
+
+    targets = defaultdict(list)  # {model name: [output directories]}, 001_chair and 057_chair are both chair.zip
+    for dir_name in sorted(os.listdir("output/")):
+        if not os.path.exists(os.path.join("output/", dir_name, "input.zip")):
+            targets['_'.join(dir_name.split("_")[1:]) + ".zip"].append(dir_name)
+
+    matches, ambiguous, unmatched = reconcile(targets.keys(), os.listdir("done/"), MAX_DISTANCE)
+    ambiguous += [(zip_name, [done_file], distance) for zip_name, done_file, method, distance in matches
+                  if len(targets[zip_name]) > 1]
+    matches = [match for match in matches if len(targets[match[0]]) == 1]
+
+    for zip_name, done_file, method, distance in matches:
+        if method != "exact":
+            print(distance, zip_name, done_file)
+        if not dry_run:
+            shutil.move(os.path.join("done/", done_file), os.path.join("output/", targets[zip_name][0], "input.zip"))
+
+    for zip_name, candidates, distance in ambiguous:
+        print(f"Ambiguous: {', '.join(targets[zip_name])} match {', '.join(candidates)} at distance {distance}")
+
+    with open(REPORT_FILE, "w") as report_file:
+        json.dump({"moved": [{"dir": targets[zip_name][0], "file": done_file, "method": method, "distance": distance}
+                             for zip_name, done_file, method, distance in matches],
+                   "ambiguous": [{"dirs": targets[zip_name], "candidates": candidates, "distance": distance}
+                                 for zip_name, candidates, distance in ambiguous],
+                   "unmatched": [dir_name for zip_name in unmatched for dir_name in targets[zip_name]]},
+                  report_file, indent=4)
+
+    print(f"{'Would move' if dry_run else 'Moved'} {len(matches)} archives, {len(ambiguous)} ambiguous, "
+          f"{len(unmatched)} without match, see {REPORT_FILE}")
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import shutil
+import zipfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import file_sha256
+
+# Extracts the archives of every output directory (model.zip from the scan, input.zip moved there by move.py).
+# Archives are extracted into a temp directory next to the output and moved into place when complete, then
+# .<archive>.done is written with the archive checksum and the extracted files. Reruns only stat the archive
+# and its files, --verify lists outputs that are incomplete without extracting anything
+#   python postprocess.py [--workers N] [--verify] [--output output/]
+ARCHIVES = ["model.zip", "input.zip"]
+
+
+def marker_path(output_dir, archive):
+    return os.path.join(output_dir, f".{archive}.done")
+
+
+def temp_path(output_dir, archive):
+    return os.path.join(output_dir, f".{archive}.tmp")
+
+
+def read_marker(output_dir, archive):
+    try:
+        with open(marker_path(output_dir, archive)) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_marker(output_dir, archive, marker):
+    path = marker_path(output_dir, archive)
+    with open(path + ".tmp", "w") as file:
+        json.dump(marker, file)
+    os.replace(path + ".tmp", path)
+
+
+def archive_files(zip_file):  # {relative path: size} of the files in a zip
+    return {info.filename.rstrip("/"): info.file_size for info in zip_file.infolist() if not info.is_dir()}
+
+
+def files_present(output_dir, files):
+    for name, size in files.items():
+        try:
+            if os.path.getsize(os.path.join(output_dir, name)) != size:
+                return False
+        except OSError:
+            return False
+    return True
+
+
+def stat_matches(marker, archive_path):
+    stat = os.stat(archive_path)
+    return marker["size"] == stat.st_size and marker["mtime_ns"] == stat.st_mtime_ns
+
+
+def move_into_place(source_dir, output_dir):
+    # Files of the finished extraction are merged in one by one, each with a single rename. Directories are
+    # shared with the other archive (input.zip and model.zip both have textures/), so nothing else is removed
+    for root, _, files in os.walk(source_dir):
+        destination_dir = os.path.join(output_dir, os.path.relpath(root, source_dir))
+        os.makedirs(destination_dir, exist_ok=True)
+        for name in files:
+            os.replace(os.path.join(root, name), os.path.join(destination_dir, name))
+    shutil.rmtree(source_dir)
+
+
+def extract(output_dir, archive):  # "extracted", "adopted" or "skipped"
+    archive_path = os.path.join(output_dir, archive)
+    marker = read_marker(output_dir, archive)
+    shutil.rmtree(temp_path(output_dir, archive), ignore_errors=True)  # Left over from an interrupted run
+    if marker is not None and stat_matches(marker, archive_path) and files_present(output_dir, marker["files"]):
+        return "skipped"
+
+    checksum = file_sha256(archive_path)
+    stat = os.stat(archive_path)
+    if marker is not None and marker["sha256"] == checksum and files_present(output_dir, marker["files"]):
+        marker.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)  # Touched or copied, same content
+        write_marker(output_dir, archive, marker)
+        return "skipped"
+
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        files = archive_files(zip_ref)
+        marker = {"sha256": checksum, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "files": files}
+
+        if files_present(output_dir, files):  # Extracted before there were markers
+            write_marker(output_dir, archive, marker)
+            return "adopted"
+
+        temp_dir = temp_path(output_dir, archive)
+        zip_ref.extractall(temp_dir)
+
+    move_into_place(temp_dir, output_dir)
+    write_marker(output_dir, archive, marker)
+    return "extracted"
+
+
+def verify(output_dir):  # Reasons the output directory is incomplete, empty when it's fine
+    problems = []
+    if not os.path.exists(os.path.join(output_dir, "input.zip")):
+        problems.append("no input.zip")
+
+    for archive in ARCHIVES:
+        if not os.path.exists(os.path.join(output_dir, archive)):
+            continue
+        marker = read_marker(output_dir, archive)
+        if os.path.exists(temp_path(output_dir, archive)):
+            problems.append(f"{archive} extraction interrupted")
+        elif marker is None:
+            problems.append(f"{archive} not extracted")
+        elif not stat_matches(marker, os.path.join(output_dir, archive)):
+            problems.append(f"{archive} changed since extraction")
+        elif not files_present(output_dir, marker["files"]):
+            problems.append(f"{archive} files missing")
+
+    return problems
+
+
+def process(output_dir):
+    results = dict()
+    for archive in ARCHIVES:
+        if os.path.exists(os.path.join(output_dir, archive)):
+            try:
+                results[archive] = extract(output_dir, archive)
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f"Extracting {os.path.join(output_dir, archive)} failed: {e}")
+                results[archive] = "failed"
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract model.zip and input.zip of every output directory")
+    parser.add_argument("--workers", type=int, default=min(8, os.cpu_count() or 1) * 2, help="Extraction threads")
+    parser.add_argument("--verify", action="store_true", help="Only list incomplete output directories")
+    parser.add_argument("--output", default="output/", help="Directory with the output directories")
+    args = parser.parse_args(argv)
+
+    dir_names = sorted(dir_name for dir_name in os.listdir(args.output)
+                       if os.path.isdir(os.path.join(args.output, dir_name)))
+    output_dirs = [os.path.join(args.output, dir_name) for dir_name in dir_names]
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(verify if args.verify else process, output_dirs))
+
+    if args.verify:
+        incomplete = 0
+        for dir_name, problems in zip(dir_names, results):
+            if problems:
+                incomplete += 1
+                print(f"{dir_name}: {', '.join(problems)}")
+        print(json.dumps({"directories": len(dir_names), "incomplete": incomplete}))
+        return 1 if incomplete else 0
+
+    counts = dict()
+    for archive_results in results:
+        for status in archive_results.values():
+            counts[status] = counts.get(status, 0) + 1
+    print(json.dumps({"directories": len(dir_names), **counts}))
+    return 1 if counts.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class Prefetcher:
+    # Keeps the next `depth` pending render tasks prepared ahead of worker requests.
+    # prepare(task) does the Blender work and must be safe to run for different tasks in parallel,
+    # is_prepared(task) tells whether a finished project.blend is already on disk, preparing_elsewhere(task)
+    # whether another server sharing the task store is preparing it right now
+
+    def __init__(self, store, prepare, is_prepared, depth=4, workers=2, poll_interval=10, preparing_elsewhere=None):
+        self.store = store
+        self.prepare = prepare
+        self.is_prepared = is_prepared
+        self.preparing_elsewhere = preparing_elsewhere or (lambda task: False)
+        self.depth = depth
+        self.poll_interval = poll_interval
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.jobs = dict()  # {task id: Future} for preparations in flight
+        self.failed = set()  # Task ids that failed in background, only retried on demand
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+    def start(self):
+        threading.Thread(target=self.loop, name="prefetch-scheduler", daemon=True).start()
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def notify(self):  # Called after a render task was claimed, so the window moves forward
+        self.wakeup.set()
+
+    def loop(self):
+        while not self.stopped:
+            try:
+                self.fill()
+            except Exception as e:
+                print(f"Prefetch failed: {e}")
+
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+    def fill(self):
+        for task in self.store.pending("render", self.depth):
+            with self.lock:
+                if len(self.jobs) >= self.depth:  # Don't queue more than the pool can finish before it's needed
+                    return
+                if task.id in self.jobs or task.id in self.failed or self.is_prepared(task) or \
+                        self.preparing_elsewhere(task):
+                    continue
+                self.jobs[task.id] = self.executor.submit(self.run, task, True)
+
+    def run(self, task, background=False):
+        try:
+            self.prepare(task)
+        except Exception:
+            if background:
+                with self.lock:
+                    self.failed.add(task.id)
+            raise
+        finally:
+            with self.lock:
+                self.jobs.pop(task.id, None)
+
+    def prepared(self, task):  # Blocks until the task is prepared, preparing it in the caller thread if nobody did yet
+        with self.lock:
+            self.failed.discard(task.id)
+            future = self.jobs.get(task.id)
+            if future is not None and future.cancel():  # Still queued, faster to do it right here
+                future = None
+            if future is None:
+                if self.is_prepared(task):
+                    return
+                future = self.jobs[task.id] = Future()  # Claim the job so the background loop doesn't start it too
+                owner = True
+            else:
+                owner = False
+
+        if not owner:
+            try:
+                future.result()
+                return
+            except Exception as e:
+                print(f"Background preparation of {task.name} failed, retrying: {e}")
+                return self.prepared(task)
+
+        try:
+            self.prepare(task)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.jobs.pop(task.id, None)
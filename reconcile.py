@@ -0,0 +1,150 @@
+import os
+import re
+from collections import Counter, defaultdict
+from multiprocessing import Pool
+
+NGRAM = 3
+CHUNK_SIZE = 256
+
+# Matches names (output directories) to files (archives in done/). Exact names first, then names equal
+# after normalisation, then the closest name by edit distance. Fuzzy candidates come from an n-gram index,
+# edit distance is only computed for names sharing one of the query's rarest n-grams and stops early
+
+
+def strip_extension(name):
+    return os.path.splitext(name)[0]
+
+
+def normalise(name):  # Case, extension, separators and punctuation don't count
+    return re.sub(r"[^0-9a-z]", "", strip_extension(name).lower())
+
+
+def ngrams(text, n=NGRAM):
+    padded = f"{'^' * (n - 1)}{text}{'$' * (n - 1)}"  # Padding lets short strings and their ends take part
+    return set(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def bounded_levenshtein(first, second, max_distance):
+    # Edit distance, or max_distance + 1 as soon as it's clear the distance is bigger
+    if abs(len(first) - len(second)) > max_distance:
+        return max_distance + 1
+    if len(first) < len(second):
+        first, second = second, first
+
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first_char != second_char)))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+
+    return previous[-1]
+
+
+class NameIndex:
+    def __init__(self, names):
+        self.names = list(names)
+        self.exact = defaultdict(list)  # {name without extension: [ids]}
+        self.normalised = defaultdict(list)  # {normalised name: [ids]}
+        self.postings = defaultdict(list)  # {n-gram: [ids]}
+        self.keys = []  # Normalised name per id
+        self.grams = []  # N-gram set per id
+        self.by_length = defaultdict(list)  # {normalised length: [ids]}, for names too short for n-grams
+
+        for i, name in enumerate(self.names):
+            key = normalise(name)
+            self.keys.append(key)
+            self.grams.append(ngrams(key))
+            self.exact[strip_extension(name)].append(i)
+            self.normalised[key].append(i)
+            self.by_length[len(key)].append(i)
+            for gram in ngrams(key):
+                self.postings[gram].append(i)
+
+    def match(self, query, max_distance):
+        # (method, distance, [ids of equally good names]); method is None when nothing is close enough
+        for method, table, key in [("exact", self.exact, strip_extension(query)),
+                                   ("normalised", self.normalised, normalise(query))]:
+            if table.get(key):
+                return method, 0, table[key]
+
+        key = normalise(query)
+        limit = min(max_distance, len(key) // 3)  # A third of the name changed isn't the same model anymore
+        grams = ngrams(key)
+        rarest = sorted(grams, key=lambda gram: len(self.postings.get(gram, [])))
+        best, best_ids = limit + 1, []
+        checked = set()
+
+        # Widen the search step by step: a name within distance k shares at least one of the n * k + 1 rarest
+        # n-grams, so close matches only look at a few short posting lists
+        k = 1
+        while True:
+            k = min(k, limit)
+            if NGRAM * k + 1 <= len(rarest):
+                candidates = set(i for gram in rarest[:NGRAM * k + 1] for i in self.postings.get(gram, []))
+            else:  # Too short for the n-gram bound, compare with every name of a possible length
+                candidates = set(i for length in range(len(key) - k, len(key) + k + 1) for i in self.by_length.get(length, []))
+
+            # Every edit removes at most n of the query's n-grams: most shared first, so the bound tightens early
+            # and the rest can be dropped once they share too few
+            shared = sorted(((len(grams & self.grams[i]), i) for i in candidates - checked), reverse=True)
+            for count, i in shared:
+                bound = min(best, limit)  # Only names within bound are still interesting
+                if count < len(grams) - NGRAM * bound:
+                    break
+                distance = bounded_levenshtein(key, self.keys[i], best)
+                if distance < best:
+                    best, best_ids = distance, [i]
+                elif distance == best:
+                    best_ids.append(i)
+            checked |= candidates
+
+            if best <= k or k >= limit:
+                break
+            k += 1
+
+        if not best_ids or best > limit:  # best starts at limit + 1, names at exactly that distance are too far
+            return None, None, []
+        return "fuzzy", best, best_ids
+
+
+index = None  # Built once per worker process
+
+
+def init_worker(names):
+    global index
+    index = NameIndex(names)
+
+
+def match_chunk(queries, max_distance):
+    return [(query, *index.match(query, max_distance)) for query in queries]
+
+
+def reconcile(queries, names, max_distance=10, processes=None):
+    # Returns (matches, ambiguous, unmatched):
+    #   matches:   [(query, name, method, distance)], every name is used at most once
+    #   ambiguous: [(query, [names], distance)] several names fit equally well, or the name fits several queries
+    #   unmatched: [query]
+    queries, names = list(queries), list(names)
+    chunks = [queries[i:i + CHUNK_SIZE] for i in range(0, len(queries), CHUNK_SIZE)]
+    if processes == 1 or len(chunks) <= 1:
+        init_worker(names)
+        results = [result for chunk in chunks for result in match_chunk(chunk, max_distance)]
+    else:
+        with Pool(processes, initializer=init_worker, initargs=(names,)) as pool:
+            results = [result for chunk_results in pool.starmap(match_chunk, [(chunk, max_distance) for chunk in chunks])
+                       for result in chunk_results]
+
+    claimed = Counter(ids[0] for query, method, distance, ids in results if len(ids) == 1)
+    matches, ambiguous, unmatched = [], [], []
+    for query, method, distance, ids in results:
+        if not ids:
+            unmatched.append(query)
+        elif len(ids) > 1 or claimed[ids[0]] > 1:
+            ambiguous.append((query, [names[i] for i in ids], distance))
+        else:
+            matches.append((query, names[ids[0]], method, distance))
+
+    return matches, ambiguous, unmatched
@@ -0,0 +1,124 @@
+import os
+import hashlib
+import threading
+import zipfile
+from glob import glob
+
+from transfer import remember_etag
+
+COPY_BUFFER_SIZE = 2 ** 20
+ZIP64_LIMIT = 2 ** 31 - 1
+
+
+def frame_file_name(frame):  # Blender output pattern ### used by the render workers
+    return f"{str(frame).zfill(3)}.png"
+
+
+def frame_number(file_name):  # Frame of a file named like frame_file_name(), None for other files
+    name, extension = os.path.splitext(os.path.basename(file_name))
+    return int(name) if extension.lower() == ".png" and name.isdigit() else None
+
+
+def missing_frames(output_dir, frames):
+    return [frame for frame in range(1, frames + 1) if not os.path.exists(os.path.join(output_dir, frame_file_name(frame)))]
+
+
+def frame_files(output_dir):  # Rendered frames are kept as loose files, archives are built from them on demand
+    return sorted(glob(os.path.join(output_dir, "*.png")))
+
+
+def frame_set_key(files):
+    sha1 = hashlib.sha1()
+    for path in files:
+        stat = os.stat(path)
+        sha1.update(f"{os.path.basename(path)} {stat.st_size} {stat.st_mtime_ns}\n".encode())
+
+    return sha1.hexdigest()
+
+
+def stored_zip_info(path):
+    info = zipfile.ZipInfo.from_file(path, os.path.basename(path))
+    info.compress_type = zipfile.ZIP_STORED  # PNG is compressed already, deflating it again only costs CPU
+    return info
+
+
+class HashingWriter:  # File wrapper hashing everything written, so the archive ETag comes for free
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def build_cached_archive(output_dir, archive_name="render.zip"):
+    # Store only archive of the current frame set, rebuilt only when frames changed.
+    # Returns None when there are no frames
+    files = frame_files(output_dir)
+    if not files:
+        return None
+
+    archive_path = os.path.join(output_dir, archive_name)
+    key_path = archive_path + ".key"
+    key = frame_set_key(files)
+
+    try:
+        with open(key_path) as key_file:
+            if key_file.read() == key and os.path.exists(archive_path):
+                return archive_path
+    except OSError:
+        pass
+
+    part_path = f"{archive_path}.{threading.get_ident()}.part"  # Two requests may build the same archive at once
+    with open(part_path, "wb") as part_file:
+        writer = HashingWriter(part_file)
+        with zipfile.ZipFile(writer, "w", zipfile.ZIP_STORED) as zip_file:  # Writer can't seek, zipfile streams
+            for path in files:
+                info = stored_zip_info(path)
+                with open(path, "rb") as src, zip_file.open(info, "w", force_zip64=info.file_size > ZIP64_LIMIT) as dst:
+                    for data in iter(lambda: src.read(COPY_BUFFER_SIZE), b""):
+                        dst.write(data)
+
+    os.replace(part_path, archive_path)
+    remember_etag(archive_path, writer.sha256.hexdigest())
+    with open(key_path, "w") as key_file:
+        key_file.write(key)
+
+    return archive_path
+
+
+class StreamSink:  # Unseekable file zipfile writes into, emptied by the generator after every chunk
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_archive(files):
+    # Yields a store only zip of the given files chunk by chunk, nothing is written to disk
+    # and memory use is bounded by COPY_BUFFER_SIZE
+    sink = StreamSink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zip_file:
+        for path in files:
+            info = stored_zip_info(path)
+            with open(path, "rb") as src, zip_file.open(info, "w", force_zip64=info.file_size > ZIP64_LIMIT) as dst:
+                for data in iter(lambda: src.read(COPY_BUFFER_SIZE), b""):
+                    dst.write(data)
+                    yield sink.take()
+            yield sink.take()
+
+    yield sink.take()  # Central directory
@@ -0,0 +1,119 @@
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from task_store import DATETIME_FORMAT, TASK_TYPES
+
+
+def task_seconds(start_time, end_time):  # Duration between two task_store timestamps
+    return (datetime.strptime(end_time, DATETIME_FORMAT) - datetime.strptime(start_time, DATETIME_FORMAT)).total_seconds()
+
+
+class WorkerStats:
+    # Measured speed per worker and task type as seconds per unit of task weight,
+    # an exponential moving average, so workers that get faster or slower are noticed
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self.speeds = dict()  # {(worker, task type): seconds per weight}
+        self.weights = {task_type: 1.0 for task_type in TASK_TYPES}  # Moving average task weight per type
+        self.lock = threading.Lock()
+
+    def record(self, worker, task_type, seconds, weight=1.0):
+        weight = max(weight, 1e-6)
+        with self.lock:
+            key = (worker, task_type)
+            previous = self.speeds.get(key)
+            speed = seconds / weight
+            self.speeds[key] = speed if previous is None else previous + self.smoothing * (speed - previous)
+            self.weights[task_type] += self.smoothing * (weight - self.weights[task_type])
+
+    def seconds_per_weight(self, worker, task_type):  # None until the worker finished a task of this type
+        with self.lock:
+            return self.speeds.get((worker, task_type))
+
+    def fleet(self, task_type):  # (workers seen doing task type, their mean seconds per weight, mean task weight)
+        with self.lock:
+            speeds = [speed for (worker, speed_type), speed in self.speeds.items() if speed_type == task_type]
+            weight = self.weights[task_type]
+
+        return len(speeds), (sum(speeds) / len(speeds) if speeds else None), weight
+
+
+@dataclass
+class PipelineState:
+    backlog: dict  # {task type: tasks that could be claimed now}
+    processing: dict = field(default_factory=dict)  # {task type: tasks being worked on}
+
+
+class SchedulingPolicy:
+    # Decides which stage a worker gets. order() returns the task types to try, best first,
+    # the server falls back to the next one when a stage has nothing to claim
+
+    def order(self, worker, task_types, state, stats):
+        raise NotImplementedError
+
+
+class OldestFirstPolicy(SchedulingPolicy):
+    # Previous behaviour: render goes first when its oldest unfinished task is as new as or newer than (id >=) scan's,
+    # or scan has nothing left; scan goes first when render's oldest unfinished task is older or render has none
+    def __init__(self, store):
+        self.store = store
+
+    def order(self, worker, task_types, state, stats):
+        if len(task_types) < 2:
+            return task_types
+
+        min_render_id, min_scan_id = self.store.min_unfinished_id("render"), self.store.min_unfinished_id("scan")
+        if min_scan_id is None or (min_render_id is not None and min_render_id >= min_scan_id):
+            return ["render", "scan"]
+        return ["scan", "render"]
+
+
+class BalancedPolicy(SchedulingPolicy):
+    # Sends a worker that can do both stages where it helps the pipeline most: the stage whose backlog
+    # takes longest to drain with the current fleet, scaled by how fast this worker is at it compared
+    # to the fleet. Scan backlog above max_scan_backlog always goes first, so rendered models don't pile up
+
+    def __init__(self, max_scan_backlog=50):
+        self.max_scan_backlog = max_scan_backlog
+
+    def drain_seconds(self, task_type, state, stats):
+        workers, seconds_per_weight, weight = stats.fleet(task_type)
+        return state.backlog.get(task_type, 0) * weight * (seconds_per_weight or 1.0) / max(workers, 1)
+
+    def relative_speed(self, worker, task_type, stats):  # > 1 when the worker is faster than the fleet average
+        own = stats.seconds_per_weight(worker, task_type)
+        fleet = stats.fleet(task_type)[1]
+        if own is None or fleet is None or own <= 0:
+            return 1.0
+        return fleet / own
+
+    def order(self, worker, task_types, state, stats):
+        if len(task_types) < 2:
+            return task_types
+
+        if state.backlog.get("scan", 0) > self.max_scan_backlog and "scan" in task_types:
+            return ["scan"] + [task_type for task_type in task_types if task_type != "scan"]
+
+        scores = {task_type: self.drain_seconds(task_type, state, stats) * self.relative_speed(worker, task_type, stats)
+                  for task_type in task_types}
+        return sorted(task_types, key=lambda task_type: -scores[task_type])
+
+
+def pipeline_state(store):
+    # Claimable tasks per stage from the trigger maintained counts. Scan can only start once render
+    # is completed, so its backlog is completed renders minus scans that already left "none"
+    counts = store.status_counts()
+    scan_started = sum(count for status, count in counts["scan"].items() if status != "none")
+    return PipelineState(backlog={"render": counts["render"].get("none", 0),
+                                  "scan": max(counts["render"].get("completed", 0) - scan_started, 0)},
+                         processing={task_type: counts[task_type].get("processing", 0) for task_type in TASK_TYPES})
+
+
+def make_policy(name, store, max_scan_backlog=50):
+    if name == "oldest":
+        return OldestFirstPolicy(store)
+    if name == "balanced":
+        return BalancedPolicy(max_scan_backlog)
+    raise ValueError(f"Unknown scheduler policy {name}")
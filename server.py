@@ -1,214 +1,506 @@
 import os
-import pandas as pd
-from flask import Flask, send_from_directory, render_template, send_file, abort, request, flash, redirect, url_for
-from dataclasses import dataclass
+import socket
+import argparse
+from flask import Flask, Response, send_from_directory, render_template, abort, request, flash, redirect, url_for, g
+from markupsafe import escape
 import shutil
 from datetime import datetime
 import json
-import zipfile
 from glob import glob
-import subprocess
+import threading
 import time
 import filetype
 
-from main import orbit_render, execute
-from config import ip_address, port, python_call
+from task_store import open_task_store, columns_list, now_str, TASK_TYPES
+from prefetch import Prefetcher
+from leases import LeaseManager, LeaseReaper
+from watcher import InputWatcher, bulk_import
+from cache import ContentCache, InputHasher, MISSING_HASH
+from logs import LogBuffer
+from stats import Throughput, StatsCache
+from scheduler import WorkerStats, make_policy, pipeline_state, task_seconds
+from blender_pool import BlenderPool
+from uploads import Extractor, UploadError, extract_verified, append_chunk, finish_part, received_bytes
+from transfer import file_etag, send_task_file, call_when_sent
+from render_archive import frame_files, frame_file_name, frame_number, missing_frames, build_cached_archive, stream_archive
+from frame_pack import pack, PACK_MIMETYPE, PACK_EXTENSION
+from metrics import registry, stage, stage_seconds, request_seconds, bytes_in, bytes_out, Gauge, RequestProfiler, \
+    start_spans, take_spans, format_spans, counted
+from config import ip_address, port, python_call, retry_after, long_poll_timeout, prefetch_depth, prefetch_workers, \
+    blender_pool_size, blender_pool_max_jobs, blender_pool_max_rss_mb, upload_workers, use_x_sendfile, \
+    render_archive_mode, render_frames, render_shards, lease_ttl, max_retries, input_poll_interval, \
+    cache_dir, cache_budget_gb, cache_reuse_outputs, log_buffer_lines, log_tail_timeout, stats_max_age, \
+    throughput_window, api_page_size, scheduler_policy, max_scan_backlog, slow_request_seconds, profile_requests, \
+    profile_dir, frame_pack_codec, frame_pack_level, frame_pack_delta, node_name, work_poll_interval, task_db_journal_mode
 
 # Init app
 async_mode = None
 app = Flask(__name__, static_url_path='')
 
-log_str = ""
+log_buffer = LogBuffer(max_lines=log_buffer_lines)  # Only the newest lines are kept
+throughput = Throughput(window=throughput_window)
+worker_stats = WorkerStats()  # Measured speed of every worker, drives the scheduling policy
 
-# Handle task database
-last_task_id = -1
-columns_list = ["id", "filename", "import_datetime", "render_status", "render_start_time", "render_end_time", "render_servername",
-                "scan_status", "scan_start_time", "scan_start_time", "scan_servername"]
 
-if not os.path.isfile("tasks.csv"):
-    print("No task database found. Generating new")
-    df_tasks = pd.DataFrame(columns=columns_list)
+def log(info):
+    print(info)
+    log_buffer.append(info)
 
-    if not os.path.exists("./input/"):
-        print("No models to import. Put zip files to ./input or refer to documentation")
-        exit(0)
 
-    for filename in os.listdir("./input/"):
-        last_task_id += 1
-        new_df = pd.DataFrame.from_records([{"id": last_task_id, "filename": '.'.join(filename.split('.')[:-1]),
-                                             "import_datetime": datetime.now().strftime("%m.%d.%Y_%H:%M:%S"),
-                                             "render_status": "none", "scan_status": "none"}], columns=columns_list)
+# Handle task database. Several servers may share tasks.db, input/ and output/: claims, leases and
+# preparations are rows of tasks.db, files are addressed by task id, so any of them can serve any worker
+node = None  # Name of this server in leases and preparation claims
+store = None
+leases = None  # Lease per worker, one task each, never locked while sending files
+prefetcher = None
+cache = None
+hasher = None
+stats = None
+policy = None
 
-        # df_tasks.loc[last_task_id] = new_df
-        df_tasks = pd.concat([df_tasks.loc[:], new_df]).reset_index(drop=True)
 
-    df_tasks.to_csv("tasks.csv", index=False)
-    print(f"Imported {last_task_id + 1} 3D models\n")
+def load_tasks(node_id=None, serving_port=port):
+    global node, store, leases, prefetcher, cache, hasher, stats, policy
 
-else:
-    df_tasks = pd.read_csv("tasks.csv", index_col=False)
-    # print(df_tasks)
+    node = node_id or node_name or f"{socket.gethostname()}:{serving_port}"
+    store = open_task_store("tasks.db", "tasks.csv", frames=render_frames, shards=render_shards,
+                            journal_mode=task_db_journal_mode)
+    leases = LeaseManager(store, ttl=lease_ttl, node=node)
+    if store.count() == 0:
+        print("No task database found. Generating new")
+    else:
+        print("Loaded task database. Looking for new models")
+        requeue_orphans()  # Leases of other servers and from before a restart stay valid
+    stats = StatsCache(store, throughput, max_age=stats_max_age)
 
-    last_task_id = max(df_tasks["id"])
-    print("Loaded task database. Looking for new models")
-    df_tasks["render_status"] = df_tasks["render_status"].replace("processing", "none")
-    df_tasks["scan_status"] = df_tasks["scan_status"].replace("processing", "none")
+    policy = make_policy(scheduler_policy, store, max_scan_backlog)
+    for task_type in TASK_TYPES:  # Worker speeds from earlier runs
+        for timing in store.timings(task_type):
+            worker_stats.record(timing["worker"], task_type, task_seconds(timing["start_time"], timing["end_time"]),
+                                timing["weight"])
 
-    new_count = 0
-    for filename in os.listdir("./input/"):
-        if '.'.join(filename.split('.')[:-1]) not in list(df_tasks["filename"]):
-            last_task_id += 1
-            new_count += 1
-            new_df = pd.DataFrame({"id": last_task_id, "filename": '.'.join(filename.split('.')[:-1]),
-                                                 "import_datetime": datetime.now().strftime("%m.%d.%Y_%H:%M:%S"),
-                                                 "render_status": "none", "scan_status": "none"}, index=[0])
+    # Identical archives under different names share the prepared project.blend and optionally their results
+    cache = ContentCache(cache_dir, int(cache_budget_gb * 2 ** 30))
+    hasher = InputHasher(store, "./input/", on_hashed=model_hashed)
+    hasher.start()
 
-            df_tasks = pd.concat([df_tasks.loc[:], new_df]).reset_index(drop=True)
+    # Archives copied to ./input while running become tasks without a restart
+    InputWatcher(store, "./input/", on_added=models_added, poll_interval=input_poll_interval).start()
 
-    df_tasks.to_csv("tasks.csv", index=False)
+    new_count = bulk_import(store, "./input/")
     if new_count > 0:
         print(f"Imported {new_count} new 3D models\n")
+        hasher.notify()
+    elif store.count() == 0:
+        print("No models to import. Put zip files to ./input or refer to documentation")
+
+    # Prepare upcoming render tasks in background, so get_task only has to send a finished project.blend
+    prefetcher = Prefetcher(store, prepare_task, is_prepared, depth=prefetch_depth, workers=prefetch_workers,
+                            preparing_elsewhere=lambda task: store.preparation_node(task.id) not in (None, node))
+    prefetcher.start()
+
+    LeaseReaper(leases, lease_expired, interval=max(1, lease_ttl / 4), sweep=requeue_orphans).start()
 
 
-server_busy = False
-task_workers = dict()  # {server name: ImageTask, task start datetime}
+def models_added(count):
+    hasher.notify()
+    notify_workers()
+    if prefetcher is not None:  # Watcher starts before the prefetcher
+        prefetcher.notify()
 
 
-@dataclass
-class Task:
-    id: int
-    name: str
-    type: str
-    start_time: str
+work_available = threading.Condition()  # Wakes long polling workers when tasks get requeued or promoted to scan
+
+
+def notify_workers():
+    with work_available:
+        work_available.notify_all()
 
 
 def change_status(task, new_status):
-    df_tasks[df_tasks["id"] == task.id][task.type + "_status"] = new_status
-    df_tasks.to_csv("tasks.csv", index=False)
+    store.set_status(task.id, task.type, new_status, task.shard)
+    if new_status == "none":
+        notify_workers()
+
+
+def request_token():  # Lease token the worker got with its task, optional for older clients
+    return request.headers.get("lease_token") or request.args.get("token")
+
+
+def release_task(name, token=None):
+    lease = leases.release(name, token)
+    return lease.task if lease is not None else None
+
+
+def leased_task(name, token=None):  # Also extends the lease, any call from the worker means it's alive
+    lease = leases.renew(name, token)
+    return lease.task if lease is not None else None
+
+
+def lease_expired(lease):
+    task = lease.task
+    new_status = store.retry(task.id, task.type, task.shard, max_retries)
+    holder = lease.worker if lease.worker is not None else f"extraction on {lease.node}"
+    info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Lease of {holder} on {task.name} ({task.type}) " \
+           f"expired, task is {'requeued' if new_status == 'none' else 'failed after ' + str(max_retries) + ' retries'}"
+    log(info)
+    notify_workers()
+
+
+def requeue_orphans():
+    requeued = store.requeue_orphans(lease_ttl)
+    if requeued:
+        log(f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Requeued {requeued} tasks left in processing without lease")
+        notify_workers()
+
+
+def task_get(task_type, server_name):
+    with stage("claim"):
+        task = store.claim(task_type, server_name)
+    if task is not None:
+        leases.grant(server_name, task)
+        if task_type == "render":
+            prefetcher.notify()
 
+    return task
 
-def task_get(task_type, new_status, server_name):
-    task = df_tasks[df_tasks[task_type + "_status"] == "none"].iloc[0]
 
-    df_tasks.iloc[task.id, columns_list.index(task_type + "_start_time")] = datetime.now().strftime("%m.%d.%Y_%H:%M:%S")
-    df_tasks.iloc[task.id, columns_list.index(task_type + "_status")] = new_status
-    df_tasks.iloc[task.id, columns_list.index(task_type + "_servername")] = server_name
+def claim_task(name, can_do_images, can_do_models):
+    task_types = [task_type for task_type, able in [("render", can_do_images), ("scan", can_do_models)] if able]
+    if len(task_types) > 1:
+        task_types = policy.order(name, task_types, pipeline_state(store), worker_stats)
 
-    df_tasks.to_csv("tasks.csv", index=False)
-    return Task(int(task["id"]), task["filename"], task_type, task[task_type + "_start_time"])
+    for task_type in task_types:  # Fall back to the other stage instead of leaving the worker idle
+        task = task_get(task_type, name)
+        if task is not None:
+            return task
 
+    return None
 
-# Return main page
+
+def no_work_response():
+    return json.dumps({'success': False, 'retry_after': retry_after}), 503, {'ContentType': 'application/json',
+                                                                              'Retry-After': str(retry_after)}
+
+
+def tasks_html(rows):
+    header = ''.join(f"<th>{column}</th>" for column in columns_list)
+    body = ''.join("<tr>" + ''.join(f"<td>{escape(str(row[column] or ''))}</td>" for column in columns_list) + "</tr>"
+                   for row in rows)
+
+    return f'<table border="1"><thead><tr>{header}</tr></thead><tbody>{body}</tbody></table>'
+
+
+def stats_html():
+    current = stats.get()
+    lines = [f"<p>Tasks: {current['total']}</p>"]
+    for task_type in TASK_TYPES:
+        counts = ', '.join(f"{status} {count}" for status, count in sorted(current[task_type]['counts'].items()))
+        eta = current[task_type]['eta_seconds']
+        lines.append(f"<p>{task_type}: {escape(counts)}, {current[task_type]['per_hour']:.1f}/h, "
+                     f"ETA {f'{eta / 3600:.1f}h' if eta is not None else 'unknown'}</p>")
+
+    cache_stats = cache.stats()
+    lines.append(f"<p>Content cache: {cache_stats['hits']} hits of {cache_stats['lookups']} lookups "
+                 f"({cache_stats['hit_rate']:.0%}), {cache_stats['bytes_saved'] / 2 ** 30:.2f} GB saved, "
+                 f"{cache_stats['entries']} models, {cache_stats['size_bytes'] / 2 ** 30:.2f} of "
+                 f"{cache_stats['budget_bytes'] / 2 ** 30:.0f} GB used</p>")
+
+    return ''.join(lines)
+
+
+def page_args():  # ?after=<last id>&limit=<n>&render_status=<status>&scan_status=<status>
+    return dict(after_id=request.args.get("after", type=int),
+                limit=min(max(request.args.get("limit", api_page_size, type=int), 1), 1000),
+                render_status=request.args.get("render_status"), scan_status=request.args.get("scan_status"))
+
+
+# Return main page: stats and one page of tasks, filters and paging work like /api/tasks
 @app.route('/')
 def root():
-    return df_tasks.to_html()
+    args = page_args()
+    rows = store.page(**args)
+
+    next_link = ""
+    if len(rows) == args["limit"]:
+        query = ''.join(f"&{key}={escape(request.args[key])}" for key in ["limit", "render_status", "scan_status"]
+                        if key in request.args)
+        next_link = f'<p><a href="/?after={rows[-1]["id"]}{query}">Next</a></p>'
+
+    return stats_html() + tasks_html(rows) + next_link
+
+
+@app.route('/api/tasks')
+def api_tasks():
+    args = page_args()
+    rows = store.page(**args)
+    next_after = rows[-1]["id"] if len(rows) == args["limit"] else None  # None on the last page
+
+    return json.dumps({'success': True, 'tasks': rows, 'next_after': next_after}), 200, \
+        {'Content-Type': 'application/json'}
+
+
+@app.route('/api/stats')
+def api_stats():
+    return json.dumps({'success': True, **stats.get(), 'cache': cache.stats()}), 200, \
+        {'Content-Type': 'application/json'}
 
 
 @app.route('/logs')
 def logs():
-    return log_str
+    return Response(log_buffer.text(), mimetype="text/plain")
 
 
-@app.route('/disconnect/<name>')
-def disconnect(name):
-    if name not in task_workers.keys():
-        return json.dumps({'success': False}), 400, {'ContentType': 'application/json'}
+@app.route('/api/logs')  # ?since=<seq> returns only newer lines, pass the returned seq next time
+def api_logs():
+    seq, lines = log_buffer.since(request.args.get("since", 0, type=int), request.args.get("limit", type=int))
+    return json.dumps({'success': True, 'seq': seq, 'lines': lines}), 200, {'Content-Type': 'application/json'}
+
+
+@app.route('/logs/tail')  # Streams new log lines as they are written, ?lines=<n> of backlog first
+def logs_tail():
+    return Response(log_buffer.follow(request.args.get("lines", 100, type=int), log_tail_timeout),
+                    mimetype="text/plain")
+
 
-    task = task_workers[name]
+def requeue_task(name, token=None):  # False when the worker holds no task
+    task = release_task(name, token)
+    if task is None:
+        return False
 
     change_status(task, "none")
-    task_workers.pop(name, None)
+    return True
+
+
+def skip_task(name, token=None):
+    task = release_task(name, token)
+    if task is None:
+        return False
+
+    print(f"Skipping model {task.name} for server {name}")
+    change_status(task, "skip")
+    return True
+
+
+@app.route('/disconnect/<name>')
+def disconnect(name):
+    if not requeue_task(name, request_token()):
+        return json.dumps({'success': False}), 400, {'ContentType': 'application/json'}
 
     return json.dumps({'success': True}), 200, {'ContentType': 'application/json'}
 
 
 @app.route('/disconnect_all')
 def disconnect_all():
-    locked_tasks = task_workers
-    for name in locked_tasks:
-        disconnect(name)
+    for name in leases.workers():
+        task = release_task(name)
+        if task is not None:
+            change_status(task, "none")
+
+    return json.dumps({'success': True}), 200, {'ContentType': 'application/json'}
+
+
+@app.route('/priority/<int:task_id>/<int(signed=True):priority>')  # Higher goes first, default 0
+def set_priority(task_id, priority):
+    store.set_priority(task_id, priority)
+    prefetcher.notify()  # Prepared window follows the new order
 
     return json.dumps({'success': True}), 200, {'ContentType': 'application/json'}
 
 
 @app.route('/skip/<name>')
 def skip(name):
-    if name in task_workers.keys():
-        print(f"Skipping model {task_workers[name]['task'].name} for server {name}")
-        change_status(task_workers[name], "skip")
-        task_workers.pop(name, "none")
-
+    if skip_task(name, request_token()):
         return json.dumps({'success': True}), 200, {'ContentType': 'application/json'}
 
     else:
         return json.dumps({'success': False}), 400, {'ContentType': 'application/json'}
 
 
-def send_model(name, task=None):
-    global log_str, server_busy
+extractor = Extractor(workers=upload_workers)
+blender_pool = BlenderPool(python_call, size=blender_pool_size, max_jobs=blender_pool_max_jobs,
+                           max_rss_mb=blender_pool_max_rss_mb)
 
-    print("Starting model send")
-    if task is None:
-        task = task_get("render", "processing", name)
-        print(task)
 
-    task_workers[name] = task
+def prepare_model(task, output_blend_file, temp_dir):  # Unzip, import and normalise model in a pooled bpy process
+    with stage("prepare"):
+        result = blender_pool.prepare(f"{task.name}.zip", output_blend_file, temp_dir)
+    for blender_stage, seconds in result["timings"].items():  # extract, import, normalise, save, reset, total
+        stage_seconds.observe(seconds, "prepare_" + blender_stage)
+
+    timings = ', '.join(f"{stage} {seconds:.2f}s" for stage, seconds in result["timings"].items())
+    info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Prepared {task.name}: {timings}"
+    log(info)
+
+
+def task_output_dir(task_id):
+    return os.path.join("output/", str(task_id).zfill(5))
+
+
+def upload_name(task, file_name):  # Frame ranges of one model are uploaded side by side, render_<shard>.zip
+    file_name = os.path.basename(file_name)
+    if task.shard is None:
+        return file_name
+    stem, extension = os.path.splitext(file_name)
+    return f"{stem}_{task.shard}{extension}"
+
+
+def task_content_hash(task):  # None when the input archive is gone
+    content_hash = store.content_hash(task.id)
+    if content_hash is None:  # Not reached by the hasher yet
+        content_hash = hasher.hash_task(task)
+
+    return content_hash if content_hash != MISSING_HASH else None
+
+
+def reuse_result(task, content_hash, task_type):  # Completes a stage from the results of an identical model
+    output_dir = task_output_dir(task.id)
+    files = cache.fetch(content_hash, task_type, output_dir)
+    if not files:
+        return False
+
+    if task_type == "scan":
+        extract_verified(files[0], output_dir)
+
+    return store.complete_unclaimed(task.id, task_type)
+
+
+def model_hashed(task, content_hash):
+    # Completes stages of a new task whose identical twin was already rendered or scanned
+    if not cache_reuse_outputs or content_hash == MISSING_HASH or not reuse_result(task, content_hash, "render"):
+        return
+
+    reused = "render and scan" if reuse_result(task, content_hash, "scan") else "render"
+    info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Reused cached {reused} results for {task.name}"
+    log(info)
+    notify_workers()  # Render was skipped, scan can start right away
+
+
+def is_prepared(task):
+    return os.path.exists(os.path.join(task_output_dir(task.id), "project.blend"))
+
 
-    output_dir = os.path.join("output/", str(task.id).zfill(5))
+def prepare_task(task):
+    # Servers sharing output/ take turns, only the one holding the claim writes the task's directory
+    while not store.claim_preparation(task.id, node, lease_ttl):
+        if is_prepared(task):
+            return
+        time.sleep(1)
+
+    try:
+        if not is_prepared(task):  # Another server may have finished it while this one waited
+            prepare_files(task)
+    finally:
+        store.release_preparation(task.id, node)
+
+
+def prepare_files(task):
+    output_dir = task_output_dir(task.id)
     if not os.path.exists(output_dir):
         os.mkdir(output_dir)
     else:
         for file_name in glob(os.path.join(output_dir, "*")):
-            os.remove(file_name)
+            if not file_name.endswith(".png"):  # Frames already rendered from an earlier preparation stay valid
+                os.remove(file_name)
 
     output_blend_file = os.path.join(output_dir, "project.blend")
+    part_blend_file = output_blend_file + ".part"  # Renamed when done, so a half written file never counts as prepared
+    temp_dir = os.path.join("temp/", str(task.id).zfill(5))  # Own directory per model, several can be prepared at once
+
+    content_hash = task_content_hash(task)
+    if content_hash is not None and cache.fetch(content_hash, "blend", output_dir):
+        print(f"Prepared {task.name} from content cache")
+        file_etag(output_blend_file)
+        return
+
+    try:
+        prepare_model(task, part_blend_file, temp_dir)
+        os.replace(part_blend_file, output_blend_file)
+        file_etag(output_blend_file)  # Hash now, not while the worker waits for the download
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if content_hash is not None:
+        cache.put(content_hash, "blend", [output_blend_file])
+
+
+def task_headers(task, token):
+    headers = {"task_type": "render" if task.type == "render" else "model",  # Image or model
+               "task_id": str(task.id),
+               "lease_token": token}  # Sent back with heartbeats and results
+    if task.shard is not None:  # Only this frame range has to be rendered and submitted
+        headers.update(shard=str(task.shard), frame_start=str(task.frame_start), frame_end=str(task.frame_end))
 
-    # TODO: rewrite this function call via shell command
-    cmd = f'{python_call} -c "import bpy; from main import orbit_render; orbit_render(\'{task.name}.zip\')"'
-    popen = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, universal_newlines=True)
-    for stdout_line in iter(popen.stdout.readline, ""):
-        print(stdout_line, end='')
-    popen.stdout.close()
-    return_code = popen.wait()
-    if return_code:
-        raise subprocess.CalledProcessError(return_code, cmd)
+    return headers
 
+
+def prepared_model(name, task):  # Path of the prepared blend, waits for the prefetcher; blocks on Blender
+    output_blend_file = os.path.join(task_output_dir(task.id), "project.blend")
     try:
-        mimetype = filetype.guess_mime("project.blend")
-        response = send_file("project.blend", as_attachment=True, mimetype=mimetype)
-        response.headers["task_type"] = "render"  # Image
+        prefetcher.prepared(task)
+    except Exception:
+        release_task(name)
+        change_status(task, "none")
+        raise
+
+    return output_blend_file
+
+
+def render_archive_source(task, archive_format="zip"):
+    # (frame files to zip or pack while sending, None), or (None, archive path): the cached store only
+    # archive of the frames, or render.zip as uploaded by workers for older tasks. Building the archive blocks
+    output_dir = task_output_dir(task.id)
+    files = frame_files(output_dir)
+    if files and (archive_format == "pack" or render_archive_mode == "stream"):
+        return files, None
+
+    return None, build_cached_archive(output_dir) or os.path.join(output_dir, "render.zip")
+
+
+def render_stream(files, archive_format="zip"):  # (chunks, mimetype, file name) for frames sent as they are read
+    if archive_format == "pack":
+        return pack(files, frame_pack_codec, frame_pack_level, frame_pack_delta), PACK_MIMETYPE, "render" + PACK_EXTENSION
+    return stream_archive(files), "application/zip", "render.zip"
+
+
+def log_sent(name, task):
+    purpose = "render" if task.type == "render" else "modeling"
+    info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Gave task {task.name} for {purpose} to server: {name}"
+    log(info)
+
 
-        info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Gave task {task.name} for render to server: {name}"
-        print(info)
-        log_str += info + '\n'
+def send_model(name, task, token):
+    print("Starting model send")
 
-        shutil.move("project.blend", output_blend_file)
-        server_busy = False
+    output_blend_file = prepared_model(name, task)
+    try:
+        g.send_file_start = time.perf_counter()  # The send_file stage ends once the body is sent, see finish_request
+        mimetype = filetype.guess_mime(output_blend_file)
+        response = send_task_file(output_blend_file, mimetype=mimetype)
+        response.headers.update(task_headers(task, token))
+        log_sent(name, task)
 
         return response
     except FileNotFoundError:
         abort(404)
 
 
-def send_images(name, task=None):
-    global log_str, server_busy
-
+def send_images(name, task, token):
     print("Starting image send")
-    if task is None:
-        task = task_get("scan", "processing", name)
-    task_workers[name] = task
-
-    archive_path = os.path.join("./output/", str(task.id).zfill(5), "render.zip")
 
+    archive_format = request.args.get("format", "zip")  # ?format=pack for workers that can unpack frame_pack
     try:
-        mimetype = filetype.guess_mime(archive_path)
-        response = send_file(archive_path, as_attachment=True, mimetype=mimetype)
-        response.headers["task_type"] = "model"  # Model
-
-        info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Gave task {task.name} for modeling to server: {name}"
-        print(info)
-        log_str += info + '\n'
-        server_busy = False
+        g.send_file_start = time.perf_counter()
+        files, archive_path = render_archive_source(task, archive_format)
+        if files:
+            chunks, mimetype, file_name = render_stream(files, archive_format)
+            response = Response(chunks, mimetype=mimetype,
+                                headers={"Content-Disposition": f"attachment; filename={file_name}"})
+        else:
+            response = send_task_file(archive_path, mimetype="application/zip")
+        response.headers.update(task_headers(task, token))
+        response.headers["archive_format"] = "pack" if files and archive_format == "pack" else "zip"
+        log_sent(name, task)
 
         return response
     except FileNotFoundError:
@@ -217,70 +509,257 @@ def send_images(name, task=None):
 
 @app.route('/get_task/<name>/<can_do_images>/<can_do_models>')  # Client event to get new task
 def get_task(name, can_do_images, can_do_models):
-    global server_busy
-    while server_busy:
-        print("Archive in progress, waiting in line")
-        time.sleep(60)
-
-    server_busy = True
     can_do_images = can_do_images == "true"
     can_do_models = can_do_models == "true"
 
-    task = None
-    if name in task_workers.keys():
+    lease = leases.renew(name)
+    if lease is not None:
         print("Job for this client already found, restoring last request")
-        task = task_workers[name]
-
-    if can_do_images and can_do_models:
-        print(df_tasks[df_tasks["render_status"] != "completed"]["id"])
-        if min(df_tasks[df_tasks["render_status"] != "completed"]["id"]) >= min(
-                df_tasks[df_tasks["scan_status"] != "completed"]["id"]):
-            # Return model to client
-            return send_model(name, task)
-        else:
-            # Return images to client
-            return send_images(name, task)
+    else:
+        # Optional long polling: ?wait=<seconds>, bounded by long_poll_timeout
+        wait = min(max(request.args.get("wait", 0, type=float), 0), long_poll_timeout)
+        deadline = time.monotonic() + wait
+
+        task = claim_task(name, can_do_images, can_do_models)
+        while task is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return no_work_response()
+
+            with work_available:
+                work_available.wait(min(remaining, work_poll_interval))  # Also rechecks for work from other servers
+            task = claim_task(name, can_do_images, can_do_models)
+        lease = leases.get(name)
+
+    if lease.task.type == "render":
+        # Return model to client
+        return send_model(name, lease.task, lease.token)
+    else:
+        # Return images to client
+        return send_images(name, lease.task, lease.token)
+
+
+# Workers holding a task call this while rendering or scanning, the lease is lost after lease_ttl seconds of silence
+@app.route('/heartbeat/<name>', methods=['GET', 'POST'])
+def heartbeat(name):
+    lease = leases.renew(name, request_token())
+    if lease is None:  # Expired and requeued, or released, the worker should drop the task
+        return json.dumps({'success': False}), 409, {'ContentType': 'application/json'}
+
+    return json.dumps({'success': True, 'task_id': lease.task.id, 'expires_in': lease_ttl}), 200, \
+        {'ContentType': 'application/json'}
+
+
+def cache_results(task, archive_path):  # Stores finished results for identical models, queued or imported later
+    content_hash = task_content_hash(task)
+    if not cache_reuse_outputs or content_hash is None:
+        return
+
+    if task.type == "render":
+        cache.put(content_hash, "render", frame_files(task_output_dir(task.id)))
+    else:
+        cache.put(content_hash, "scan", [archive_path])
+
+    for twin in store.unclaimed_with_hash(content_hash, task.type):
+        if reuse_result(twin, content_hash, task.type):
+            info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Reused {task.type} results of {task.name} " \
+                   f"for {twin.name}"
+            log(info)
+            notify_workers()
+
+
+def extraction_done(task, error, archive_path=None):
+    if error is None and task.shard is not None:
+        info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Finished frames {task.frame_start}-{task.frame_end} " \
+               f"of {task.name}"
+        if store.complete_shard(task.id, task.shard) == 0:
+            # Last frame range is in, promote the model to scan once every frame is really on disk
+            missing = missing_frames(task_output_dir(task.id), render_frames)
+            if missing:
+                info += f", {len(missing)} frames missing, requeued {store.reopen_frames(task.id, missing)} ranges"
+                notify_workers()
+            else:
+                store.complete(task.id, task.type)
+                throughput.record(task.type)
+                cache_results(task, archive_path)
+                info += ", render finished"
+                notify_workers()  # Model is ready for scan now
+
+    elif error is None:
+        store.complete(task.id, task.type)
+        throughput.record(task.type)
+        cache_results(task, archive_path)
+        info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Finished {task.type} of {task.name}"
+        if task.type == "render":
+            notify_workers()  # Model is ready for scan now
+    else:
+        info = f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Result of {task.name} is broken, requeued: {error}"
+        change_status(task, "none")
 
-    elif can_do_images:
-        return send_model(name, task)
+    log(info)
 
-    elif can_do_models:
-        return send_images(name, task)
+
+def start_extraction(name, task, full_file_path, token=None):
+    # Worker is free to take new work right away, task itself stays "processing" until the archive is verified.
+    # The lease stays without worker until then, so the task is requeued if this server stops while extracting
+    leases.hand_over(name, token)
+    worker_stats.record(name, task.type, task_seconds(task.start_time, now_str()), task.weight)
+    output_dir = task_output_dir(task.id)
+
+    clear_files, keep = None, None
+    if task.type == "render" and task.shard is not None:  # Partial upload, other frame ranges stay untouched
+        clear_files = [os.path.join(output_dir, frame_file_name(frame)) for frame in range(task.frame_start, task.frame_end + 1)]
+
+        def keep(member):  # Frames outside the range belong to other workers
+            frame = frame_number(member)
+            return frame is not None and task.frame_start <= frame <= task.frame_end
+    elif task.type == "render":
+        clear_files = glob(os.path.join(output_dir, "*.png"))
+
+    # Rendered frames are kept as loose files, the archive for scan is built from them when it's needed
+    def done(done_task, error):
+        try:
+            extraction_done(done_task, error, full_file_path)
+        finally:
+            leases.finish(task)
+
+    extractor.submit(task, full_file_path, output_dir, done, clear_files=clear_files,
+                     remove_archive=task.type == "render", keep=keep)
 
 
 @app.route('/submit_task/<name>/<task_type>', methods=['GET', 'POST'])  # Client event to return finished work
 def submit_task(name, task_type):
-    global df_tasks
-
     if request.method == 'POST':
-        task = task_workers[name]
-        output_dir = os.path.join("output/", str(task.id).zfill(5))
+        task = leased_task(name, request_token())
+        if task is None:  # No task or the lease expired and the task went to someone else
+            return json.dumps({'success': False}), 409, {'ContentType': 'application/json'}
+        if task.type != task_type:  # The lease decides the stage, a result for the other one would be filed wrongly
+            return json.dumps({'success': False, 'error': f"Leased task is {task.type}"}), 400, \
+                {'ContentType': 'application/json'}
 
-        if task_type == "render":
-            if not os.path.exists(output_dir):
-                os.mkdir(output_dir)
-            else:
-                for file_name in glob(os.path.join(output_dir, "*.png")):
-                    os.remove(file_name)
+        output_dir = task_output_dir(task.id)
+        if not os.path.exists(output_dir):
+            os.mkdir(output_dir)
 
         file = request.files['file']
-        full_file_path = os.path.join(output_dir, file.filename)
+        full_file_path = os.path.join(output_dir, upload_name(task, file.filename))
+
+        with stage("file_save"):
+            file.save(full_file_path)
+        start_extraction(name, task, full_file_path, request_token())
+
+    return json.dumps({'success': True}), 200, {'ContentType': 'application/json'}
 
-        file.save(full_file_path)
 
-        # Extract
-        with zipfile.ZipFile(full_file_path, 'r') as zip_ref:
-            zip_ref.extractall(output_dir)
+# Chunked, resumable alternative to submit_task:
+#   GET  /upload/<name>/<type>/<file>                        -> {"offset": bytes already received}
+#   PUT  /upload/<name>/<type>/<file>?offset=N               body is the chunk, X-Chunk-Sha256 header optional
+#   POST /upload/<name>/<type>/<file>/complete?size=N        X-File-Sha256 header optional
+@app.route('/upload/<name>/<task_type>/<file_name>', methods=['GET', 'PUT'])
+def upload_chunk(name, task_type, file_name):
+    task = leased_task(name, request_token())
+    if task is None:
+        return json.dumps({'success': False}), 409, {'ContentType': 'application/json'}
+    if task.type != task_type:
+        return json.dumps({'success': False, 'error': f"Leased task is {task.type}"}), 400, \
+            {'ContentType': 'application/json'}
 
-        df_tasks.iloc[task.id, columns_list.index(task_type + "_end_time")] = datetime.now().strftime(
-            "%m.%d.%Y_%H:%M:%S")
-        df_tasks.iloc[task.id, columns_list.index(task_type + "_status")] = "completed"
+    output_dir = task_output_dir(task.id)
+    file_name = upload_name(task, file_name)
+    if request.method == 'GET':
+        return json.dumps({'success': True, 'offset': received_bytes(output_dir, file_name)}), 200, \
+            {'ContentType': 'application/json'}
 
-        df_tasks.to_csv("tasks.csv", index=False)
-        task_workers.pop(name, None)
-        print(task_workers)
+    try:
+        with stage("upload_chunk"):
+            offset = append_chunk(output_dir, file_name, request.args.get("offset", 0, type=int), request.stream,
+                                  request.headers.get("X-Chunk-Sha256"))
+    except UploadError as e:
+        return json.dumps({'success': False, 'error': str(e), 'offset': e.offset}), e.status, \
+            {'ContentType': 'application/json'}
 
-    return json.dumps({'success': True}), 200, {'ContentType': 'application/json'}
+    return json.dumps({'success': True, 'offset': offset}), 200, {'ContentType': 'application/json'}
+
+
+@app.route('/upload/<name>/<task_type>/<file_name>/complete', methods=['POST'])
+def upload_complete(name, task_type, file_name):
+    task = leased_task(name, request_token())
+    if task is None:
+        return json.dumps({'success': False}), 409, {'ContentType': 'application/json'}
+    if task.type != task_type:
+        return json.dumps({'success': False, 'error': f"Leased task is {task.type}"}), 400, \
+            {'ContentType': 'application/json'}
+
+    try:
+        full_file_path = finish_part(task_output_dir(task.id), upload_name(task, file_name),
+                                     request.args.get("size", type=int), request.headers.get("X-File-Sha256"))
+    except UploadError as e:
+        return json.dumps({'success': False, 'error': str(e), 'offset': e.offset}), e.status, \
+            {'ContentType': 'application/json'}
+
+    start_extraction(name, task, full_file_path, request_token())
+
+    return json.dumps({'success': True}), 202, {'ContentType': 'application/json'}
+
+
+# Metrics, recorded only when something happens, gauges are computed when /metrics is scraped
+profiler = RequestProfiler(profile_dir)
+registry.add(Gauge("dispatch_tasks", "Tasks per type and status",
+                   lambda: {(task_type, status): count for task_type, by_status in store.status_counts().items()
+                            for status, count in by_status.items()}, ("type", "status")))
+registry.add(Gauge("dispatch_active_leases", "Workers holding a task", lambda: len(leases.workers())))
+
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    start_spans()
+    if profile_requests and request.args.get("profile"):  # ?profile=1
+        g.profile = profiler.start()
+
+
+@app.after_request
+def finish_request(response):
+    request_start, send_file_start = g.request_start, g.get("send_file_start")
+    endpoint, path = request.endpoint or "unknown", request.path
+
+    worker = (request.view_args or {}).get("name")
+    if worker is not None:
+        if request.content_length:
+            bytes_in.inc(request.content_length, worker)
+        if response.content_length is not None:
+            bytes_out.inc(response.content_length, worker)
+        elif response.is_streamed:
+            response.response = counted(response.response, bytes_out, worker)
+
+    stages = take_spans()
+
+    def finish():  # Runs once the body is sent, so file transfers count in the request time
+        end = time.perf_counter()
+        if send_file_start is not None:
+            stage_seconds.observe(end - send_file_start, "send_file")
+            stages.append(("send_file", send_file_start - request_start, end - send_file_start))
+
+        seconds = end - request_start
+        request_seconds.observe(seconds, endpoint)
+        if seconds > slow_request_seconds:
+            log(f"[{datetime.now().strftime('%m.%d.%Y_%H:%M:%S')}] Slow request {path}: {seconds:.2f}s "
+                f"({format_spans(stages) or 'no stages'})")
+
+    call_when_sent(response, finish)
+    return response
+
+
+@app.teardown_request
+def stop_profile(error):  # Also when the view raised
+    if g.get("profile") is not None:
+        log(f"Profile of {request.path} written to {profiler.stop(g.profile, request.endpoint or 'unknown')}")
+        g.profile = None
+
+
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
 
 
 # Get files from server (e.g libs)
@@ -289,14 +768,26 @@ def send_js(path):
     return send_from_directory('js', path)
 
 
+def parse_args():  # Port and node name, to run several servers on one host with the same config.py
+    parser = argparse.ArgumentParser(description="Dispatch server for render and scan workers")
+    parser.add_argument("--port", type=int, default=port)
+    parser.add_argument("--node", default=None, help="Name in leases and logs, defaults to node_name or host:port")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+
     # Create needed directories
     needed_dirs = ["done/", "input/", "output/", "temp/"]
     for needed_dir in needed_dirs:
         if not os.path.exists(needed_dir):
-            os.mkdir(needed_dir)
+            os.makedirs(needed_dir, exist_ok=True)  # Another server may create it at the same time
+
+    load_tasks(args.node, args.port)
 
     app.secret_key = 'token'
+    app.config['USE_X_SENDFILE'] = use_x_sendfile
     app.config['SESSION_TYPE'] = 'filesystem'
 
-    app.run(host=ip_address, port=port)
+    app.run(host=ip_address, port=args.port)
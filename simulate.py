@@ -0,0 +1,110 @@
+import sys
+import json
+import heapq
+import random
+from collections import defaultdict
+
+from task_store import TASK_TYPES, SqliteTaskStore
+from scheduler import WorkerStats, OldestFirstPolicy, BalancedPolicy, PipelineState, task_seconds
+
+# Offline comparison of scheduling policies. Replays task timings recorded in tasks.db: every worker
+# keeps the speed (seconds per weight per task type) it had there and every model keeps its weight.
+# Without a database a synthetic farm is simulated.
+#   python simulate.py [tasks.db] [models]
+
+
+class SimQueues:
+    # Stands in for the task store: claimable tasks per stage, ordered like claim() orders them
+    def __init__(self, weights):
+        self.queues = {"render": list(range(len(weights))), "scan": []}
+        self.unfinished = {task_type: set(range(len(weights))) for task_type in TASK_TYPES}
+
+    def min_unfinished_id(self, task_type):
+        return min(self.unfinished[task_type]) if self.unfinished[task_type] else None
+
+    def state(self, processing):
+        return PipelineState(backlog={task_type: len(queue) for task_type, queue in self.queues.items()},
+                             processing=dict(processing))
+
+
+def recorded_farm(db_path):  # ({worker: {task type: seconds per weight}}, [model weights]) from a tasks.db
+    store = SqliteTaskStore(db_path)
+    speeds = defaultdict(lambda: defaultdict(list))
+    weights = []
+    for task_type in TASK_TYPES:
+        for timing in store.timings(task_type, limit=100000):
+            seconds = task_seconds(timing["start_time"], timing["end_time"])
+            speeds[timing["worker"]][task_type].append(seconds / max(timing["weight"], 1e-6))
+            if task_type == "render":
+                weights.append(timing["weight"])
+
+    farm = {worker: {task_type: sum(values) / len(values) for task_type, values in by_type.items()}
+            for worker, by_type in speeds.items()}
+    return farm, weights
+
+
+def synthetic_farm(models, rng):
+    farm = {"render_fast": {"render": 60}, "render_slow": {"render": 150},
+            "scan_1": {"scan": 40}, "scan_2": {"scan": 55},
+            "both_1": {"render": 90, "scan": 30}, "both_2": {"render": 70, "scan": 80}}
+    weights = [rng.lognormvariate(0, 0.5) for _ in range(models)]
+    return farm, weights
+
+
+def simulate(make_policy, farm, weights):
+    queues = SimQueues(weights)
+    policy = make_policy(queues)
+    stats = WorkerStats()
+    processing = defaultdict(int)
+    events = []  # (finish time, worker, task type, model)
+    idle = set(farm)
+    busy_seconds = defaultdict(float)
+    scan_backlog_samples = []
+    now = 0.0
+
+    def dispatch():
+        for worker in sorted(idle):
+            task_types = [task_type for task_type in TASK_TYPES if task_type in farm[worker]]
+            state = queues.state(processing)
+            for task_type in policy.order(worker, task_types, state, stats):
+                if queues.queues[task_type]:
+                    model = queues.queues[task_type].pop(0)
+                    seconds = farm[worker][task_type] * weights[model]
+                    heapq.heappush(events, (now + seconds, worker, task_type, model))
+                    processing[task_type] += 1
+                    busy_seconds[worker] += seconds
+                    idle.discard(worker)
+                    break
+
+    dispatch()
+    while events:
+        now, worker, task_type, model = heapq.heappop(events)
+        processing[task_type] -= 1
+        stats.record(worker, task_type, farm[worker][task_type] * weights[model], weights[model])
+        queues.unfinished[task_type].discard(model)
+        if task_type == "render":
+            queues.queues["scan"].append(model)
+        idle.add(worker)
+        scan_backlog_samples.append(len(queues.queues["scan"]))
+        dispatch()
+
+    return {"makespan_hours": now / 3600, "models_per_hour": len(weights) / now * 3600 if now else 0.0,
+            "mean_scan_backlog": sum(scan_backlog_samples) / max(len(scan_backlog_samples), 1),
+            "max_scan_backlog": max(scan_backlog_samples, default=0),
+            "utilisation": {worker: busy_seconds[worker] / now if now else 0.0 for worker in sorted(farm)}}
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    if len(sys.argv) > 1:
+        farm, weights = recorded_farm(sys.argv[1])
+        if len(sys.argv) > 2:  # Replay a bigger queue with the same weight distribution
+            weights = [rng.choice(weights) for _ in range(int(sys.argv[2]))]
+    else:
+        farm, weights = synthetic_farm(500, rng)
+
+    results = {"workers": farm, "models": len(weights)}
+    for name, make_policy in [("oldest", OldestFirstPolicy), ("balanced", lambda queues: BalancedPolicy())]:
+        results[name] = simulate(make_policy, farm, weights)
+
+    print(json.dumps(results, indent=4))
@@ -0,0 +1,62 @@
+import time
+import threading
+from collections import deque
+
+from task_store import TASK_TYPES, UNFINISHED_STATUSES
+
+
+class Throughput:
+    # Completed tasks per type over the last window seconds
+
+    def __init__(self, window=3600):
+        self.window = window
+        self.started = time.time()
+        self.completions = {task_type: deque() for task_type in TASK_TYPES}  # Completion timestamps
+        self.lock = threading.Lock()
+
+    def record(self, task_type):
+        with self.lock:
+            self.completions[task_type].append(time.time())
+
+    def per_hour(self, task_type):
+        now = time.time()
+        with self.lock:
+            completions = self.completions[task_type]
+            while completions and completions[0] < now - self.window:
+                completions.popleft()
+            count = len(completions)
+
+        elapsed = min(self.window, now - self.started)  # Rate of the first hour after a start isn't diluted
+        return count / elapsed * 3600 if elapsed > 0 else 0.0
+
+
+class StatsCache:
+    # Status counts, throughput and ETA. Counts come from the store's trigger maintained table,
+    # the result is reused for max_age seconds, so a busy dashboard doesn't turn into database load
+
+    def __init__(self, store, throughput, max_age=2):
+        self.store = store
+        self.throughput = throughput
+        self.max_age = max_age
+        self.cached = None
+        self.cached_at = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        with self.lock:
+            if self.cached is None or time.monotonic() - self.cached_at > self.max_age:
+                self.cached = self.compute()
+                self.cached_at = time.monotonic()
+
+            return self.cached
+
+    def compute(self):
+        counts = self.store.status_counts()
+        result = {"total": sum(counts[TASK_TYPES[0]].values()), "generated_at": time.time()}
+        for task_type in TASK_TYPES:
+            remaining = sum(counts[task_type].get(status, 0) for status in UNFINISHED_STATUSES)
+            per_hour = self.throughput.per_hour(task_type)
+            result[task_type] = {"counts": counts[task_type], "remaining": remaining, "per_hour": per_hour,
+                                 "eta_seconds": remaining / per_hour * 3600 if per_hour > 0 else None}
+
+        return result
@@ -0,0 +1,561 @@
+import os
+import csv
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+DATETIME_FORMAT = "%m.%d.%Y_%H:%M:%S"
+TASK_TYPES = ["render", "scan"]
+UNFINISHED_STATUSES = ["none", "processing"]  # Skipped tasks are never handed out again
+
+columns_list = ["id", "filename", "import_datetime", "render_status", "render_start_time", "render_end_time", "render_servername",
+                "scan_status", "scan_start_time", "scan_end_time", "scan_servername"]
+
+
+def now_str():
+    return datetime.now().strftime(DATETIME_FORMAT)
+
+
+@dataclass
+class Task:
+    id: int
+    name: str
+    type: str
+    start_time: str
+    shard: int = None  # Set for render tasks split into frame ranges
+    frame_start: int = None
+    frame_end: int = None
+    weight: float = 1.0  # Expected amount of work, input archive size in MB once hashed
+
+
+def shard_ranges(frames, shards):  # [(first frame, last frame)] for every shard, frames are numbered from 1
+    bounds = [1 + i * frames // shards for i in range(shards + 1)]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(shards) if bounds[i] < bounds[i + 1]]
+
+
+def claim_condition(task_type):
+    assert task_type in TASK_TYPES
+
+    # Scan needs finished renders, so only hand out models that went through the render stage
+    condition = f"{task_type}_status = 'none'"
+    if task_type == "scan":
+        condition += " AND render_status = 'completed'"
+
+    return condition
+
+
+class TaskStore:
+    # Interface between the dispatch server and the place tasks are kept.
+    # Every status change must touch exactly one row, so implementations never rewrite the whole table
+
+    def add_tasks(self, filenames):  # Returns number of newly registered models
+        raise NotImplementedError
+
+    def filenames(self):
+        raise NotImplementedError
+
+    def claim(self, task_type, server_name):  # Atomically move next "none" task to "processing", None if queue is empty
+        raise NotImplementedError
+
+    def pending(self, task_type, limit):  # Next tasks claim() would return, without claiming them
+        raise NotImplementedError
+
+    def set_status(self, task_id, task_type, new_status, shard=None):
+        raise NotImplementedError
+
+    def complete(self, task_id, task_type):
+        raise NotImplementedError
+
+    def complete_shard(self, task_id, shard):  # Returns how many shards of the task are still not completed
+        raise NotImplementedError
+
+    def reopen_frames(self, task_id, frames):  # Requeue shards covering the given frames
+        raise NotImplementedError
+
+    def retry(self, task_id, task_type, shard, max_retries):  # Requeue after a lost lease, "failed" after max_retries
+        raise NotImplementedError
+
+    def requeue_orphans(self, max_age):  # Requeue "processing" tasks without lease claimed over max_age seconds ago
+        raise NotImplementedError
+
+    def claim_preparation(self, task_id, node, stale_after):  # True when node may prepare the task, one node at a time
+        raise NotImplementedError
+
+    def release_preparation(self, task_id, node):
+        raise NotImplementedError
+
+    def preparation_node(self, task_id):  # Node preparing the task right now, None if nobody does
+        raise NotImplementedError
+
+    def unhashed(self, limit):  # Tasks whose input archive wasn't hashed yet, oldest first
+        raise NotImplementedError
+
+    def set_content_hash(self, task_id, content_hash, weight=None):
+        raise NotImplementedError
+
+    def set_priority(self, task_id, priority):  # Higher priority tasks are claimed first, ties by id
+        raise NotImplementedError
+
+    def content_hash(self, task_id):
+        raise NotImplementedError
+
+    def complete_unclaimed(self, task_id, task_type):  # Completes a task nobody took yet, False if it was claimed
+        raise NotImplementedError
+
+    def unclaimed_with_hash(self, content_hash, task_type):  # Claimable tasks with identical input archives
+        raise NotImplementedError
+
+    def min_unfinished_id(self, task_type):
+        raise NotImplementedError
+
+    def rows(self):
+        raise NotImplementedError
+
+    def page(self, after_id=None, limit=100, render_status=None, scan_status=None):  # Rows with id > after_id
+        raise NotImplementedError
+
+    def status_counts(self):  # {task type: {status: tasks}}
+        raise NotImplementedError
+
+    def timings(self, task_type, limit=10000):  # Most recent finished tasks with worker, start and end time
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+
+class SqliteTaskStore(TaskStore):
+    def __init__(self, db_path="tasks.db", frames=300, shards=1, journal_mode="WAL"):
+        self.db_path = db_path
+        self.frames = frames
+        self.shards = shards  # Render tasks are handed out as this many frame ranges, 1 keeps whole models
+        self.local = threading.local()  # sqlite connections can't be shared between threads
+
+        conn = self.connection()
+        conn.execute(f"PRAGMA journal_mode={journal_mode}")  # WAL needs all processes on one host
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id INTEGER PRIMARY KEY,
+                filename TEXT NOT NULL,
+                import_datetime TEXT,
+                render_status TEXT NOT NULL DEFAULT 'none',
+                render_start_time TEXT,
+                render_end_time TEXT,
+                render_servername TEXT,
+                scan_status TEXT NOT NULL DEFAULT 'none',
+                scan_start_time TEXT,
+                scan_end_time TEXT,
+                scan_servername TEXT,
+                render_retries INTEGER NOT NULL DEFAULT 0,
+                scan_retries INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS tasks_render_status ON tasks (render_status, id);
+            CREATE INDEX IF NOT EXISTS tasks_scan_status ON tasks (scan_status, id);
+            CREATE INDEX IF NOT EXISTS tasks_filename ON tasks (filename);
+
+            CREATE TABLE IF NOT EXISTS render_shards (
+                task_id INTEGER NOT NULL,
+                shard INTEGER NOT NULL,
+                frame_start INTEGER NOT NULL,
+                frame_end INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'none',
+                servername TEXT,
+                start_time TEXT,
+                end_time TEXT,
+                PRIMARY KEY (task_id, shard)
+            );
+            CREATE INDEX IF NOT EXISTS render_shards_status ON render_shards (status, task_id, shard);
+
+            -- Worker leases, shared by every server using this database (see leases.py). shard is -1 for
+            -- whole tasks, worker is NULL while an uploaded result is being extracted
+            CREATE TABLE IF NOT EXISTS leases (
+                worker TEXT,
+                task_id INTEGER NOT NULL,
+                type TEXT NOT NULL,
+                shard INTEGER NOT NULL,
+                filename TEXT NOT NULL,
+                start_time TEXT,
+                frame_start INTEGER,
+                frame_end INTEGER,
+                weight REAL NOT NULL DEFAULT 1,
+                token TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                node TEXT,
+                PRIMARY KEY (task_id, type, shard)
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS leases_worker ON leases (worker);
+            CREATE INDEX IF NOT EXISTS leases_expires_at ON leases (expires_at);
+
+            -- Server preparing project.blend of a task, so two servers never write the same output directory
+            CREATE TABLE IF NOT EXISTS preparations (
+                task_id INTEGER PRIMARY KEY,
+                node TEXT NOT NULL,
+                claimed_at REAL NOT NULL
+            );
+        """)
+
+        # Columns added after the first release of tasks.db. In a transaction, servers sharing the database
+        # may start at the same time
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing_columns = set(row["name"] for row in conn.execute("PRAGMA table_info(tasks)"))
+            for column, definition in [("render_retries", "INTEGER NOT NULL DEFAULT 0"),
+                                       ("scan_retries", "INTEGER NOT NULL DEFAULT 0"),
+                                       ("content_hash", "TEXT"),
+                                       ("priority", "INTEGER NOT NULL DEFAULT 0"),
+                                       ("weight", "REAL NOT NULL DEFAULT 1")]:
+                if column not in existing_columns:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_content_hash ON tasks (content_hash)")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_render_claim ON tasks (render_status, priority DESC, id)")
+            # Scan claims also filter on render_status, without it in the index an empty claim walks every
+            # model waiting for its render while holding the write lock. Replaces the older tasks_scan_claim
+            conn.execute("DROP INDEX IF EXISTS tasks_scan_claim")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_scan_claim_rendered "
+                         "ON tasks (scan_status, render_status, priority DESC, id)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self.create_status_counts(conn)
+
+    def create_status_counts(self, conn):
+        # Tasks per type and status, kept up to date by triggers, so stats never have to scan the tasks table
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TABLE IF NOT EXISTS status_counts (task_type TEXT NOT NULL, status TEXT NOT NULL, "
+                         "count INTEGER NOT NULL, PRIMARY KEY (task_type, status)) WITHOUT ROWID")
+            for task_type in TASK_TYPES:
+                increment = f"INSERT INTO status_counts VALUES ('{task_type}', NEW.{task_type}_status, 1) " \
+                            f"ON CONFLICT (task_type, status) DO UPDATE SET count = count + 1;"
+                decrement = f"UPDATE status_counts SET count = count - 1 " \
+                            f"WHERE task_type = '{task_type}' AND status = OLD.{task_type}_status;"
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS {task_type}_count_insert AFTER INSERT ON tasks "
+                             f"BEGIN {increment} END")
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS {task_type}_count_delete AFTER DELETE ON tasks "
+                             f"BEGIN {decrement} END")
+                conn.execute(f"CREATE TRIGGER IF NOT EXISTS {task_type}_count_update AFTER UPDATE OF {task_type}_status "
+                             f"ON tasks WHEN OLD.{task_type}_status IS NOT NEW.{task_type}_status "
+                             f"BEGIN {decrement} {increment} END")
+
+            if conn.execute("SELECT COUNT(*) FROM status_counts").fetchone()[0] == 0:  # New table, count existing tasks
+                for task_type in TASK_TYPES:
+                    conn.execute(f"INSERT INTO status_counts SELECT '{task_type}', {task_type}_status, COUNT(*) "
+                                 f"FROM tasks GROUP BY {task_type}_status")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE where needed
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+
+        return conn
+
+    def import_csv(self, csv_path):  # One time migration from the old pandas tasks.csv
+        with open(csv_path, newline='') as csv_file:
+            records = []
+            for row in csv.DictReader(csv_file):
+                records.append(tuple(row.get(column) or None for column in columns_list))
+
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(f"INSERT OR IGNORE INTO tasks ({', '.join(columns_list)}) "
+                             f"VALUES ({', '.join('?' * len(columns_list))})",
+                             [(int(float(record[0])), *record[1:]) for record in records])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return len(records)
+
+    def add_tasks(self, filenames):
+        # Names go through a temp table, so dedup against tasks is one indexed INSERT ... SELECT
+        # instead of loading every known filename into Python first
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS new_filenames (filename TEXT PRIMARY KEY) WITHOUT ROWID")
+            conn.executemany("INSERT OR IGNORE INTO new_filenames (filename) VALUES (?)",
+                             ((filename,) for filename in filenames))
+            added = conn.execute("INSERT INTO tasks (filename, import_datetime) SELECT filename, ? FROM new_filenames "
+                                 "WHERE filename NOT IN (SELECT filename FROM tasks) ORDER BY filename",
+                                 (now_str(),)).rowcount
+            conn.execute("DELETE FROM new_filenames")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return added
+
+    def filenames(self):
+        return set(row[0] for row in self.connection().execute("SELECT filename FROM tasks"))
+
+    def claim(self, task_type, server_name):
+        condition = claim_condition(task_type)
+        sharded = task_type == "render" and self.shards > 1
+
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")  # Takes the write lock, no other thread or process can claim the same row
+        try:
+            start_time = now_str()
+            task = self.claim_shard(conn, server_name, start_time) if sharded else None  # Finish started models first
+
+            if task is None:
+                row = conn.execute(f"SELECT id, filename, weight FROM tasks WHERE {condition} "
+                                   f"ORDER BY priority DESC, id LIMIT 1").fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                conn.execute(f"UPDATE tasks SET {task_type}_status = 'processing', {task_type}_start_time = ?, "
+                             f"{task_type}_servername = ? WHERE id = ?", (start_time, server_name, row["id"]))
+                task = Task(int(row["id"]), row["filename"], task_type, start_time, weight=row["weight"])
+
+                if sharded:
+                    conn.executemany("INSERT OR REPLACE INTO render_shards (task_id, shard, frame_start, frame_end) "
+                                     "VALUES (?, ?, ?, ?)", [(task.id, shard, frame_start, frame_end) for shard, (
+                                         frame_start, frame_end) in enumerate(shard_ranges(self.frames, self.shards))])
+                    task = self.claim_shard(conn, server_name, start_time)
+
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return task
+
+    def claim_shard(self, conn, server_name, start_time):  # Next free frame range of a model already being rendered
+        row = conn.execute("SELECT s.task_id, s.shard, s.frame_start, s.frame_end, t.filename, t.weight "
+                           "FROM render_shards s JOIN tasks t ON t.id = s.task_id "
+                           "WHERE s.status = 'none' AND t.render_status = 'processing' "
+                           "ORDER BY t.priority DESC, s.task_id, s.shard LIMIT 1").fetchone()
+        if row is None:
+            return None
+
+        conn.execute("UPDATE render_shards SET status = 'processing', servername = ?, start_time = ? "
+                     "WHERE task_id = ? AND shard = ?", (server_name, start_time, row["task_id"], row["shard"]))
+        frames = row["frame_end"] - row["frame_start"] + 1
+        return Task(int(row["task_id"]), row["filename"], "render", start_time, int(row["shard"]),
+                    int(row["frame_start"]), int(row["frame_end"]), row["weight"] * frames / self.frames)
+
+    def pending(self, task_type, limit):
+        condition = claim_condition(task_type)
+        return [Task(int(row["id"]), row["filename"], task_type, None, weight=row["weight"]) for row in
+                self.connection().execute(f"SELECT id, filename, weight FROM tasks WHERE {condition} "
+                                          f"ORDER BY priority DESC, id LIMIT ?", (limit,))]
+
+    def set_status(self, task_id, task_type, new_status, shard=None):
+        assert task_type in TASK_TYPES
+        if shard is not None and new_status != "skip":
+            self.connection().execute("UPDATE render_shards SET status = ? WHERE task_id = ? AND shard = ?",
+                                      (new_status, task_id, shard))
+            return
+
+        # Skipping a frame range skips the whole model
+        self.connection().execute(f"UPDATE tasks SET {task_type}_status = ? WHERE id = ?", (new_status, task_id))
+        if new_status == "skip" and task_type == "render":
+            self.connection().execute("UPDATE render_shards SET status = 'skip' WHERE task_id = ? AND status != 'completed'",
+                                      (task_id,))
+
+    def complete(self, task_id, task_type):
+        assert task_type in TASK_TYPES
+        self.connection().execute(f"UPDATE tasks SET {task_type}_status = 'completed', {task_type}_end_time = ? "
+                                  f"WHERE id = ?", (now_str(), task_id))
+
+    def complete_shard(self, task_id, shard):
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")  # Exactly one of the shards finishing at the same time sees 0 left
+        try:
+            conn.execute("UPDATE render_shards SET status = 'completed', end_time = ? WHERE task_id = ? AND shard = ?",
+                         (now_str(), task_id, shard))
+            remaining = conn.execute("SELECT COUNT(*) FROM render_shards WHERE task_id = ? AND status != 'completed'",
+                                     (task_id,)).fetchone()[0]
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return remaining
+
+    def reopen_frames(self, task_id, frames):
+        reopened = 0
+        for frame in frames:
+            reopened += self.connection().execute(
+                "UPDATE render_shards SET status = 'none' WHERE task_id = ? AND frame_start <= ? AND frame_end >= ? "
+                "AND status = 'completed'", (task_id, frame, frame)).rowcount
+
+        return reopened
+
+    def retry(self, task_id, task_type, shard, max_retries):
+        assert task_type in TASK_TYPES
+
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"UPDATE tasks SET {task_type}_retries = {task_type}_retries + 1 WHERE id = ?", (task_id,))
+            retries = conn.execute(f"SELECT {task_type}_retries FROM tasks WHERE id = ?", (task_id,)).fetchone()[0]
+            if retries > max_retries:
+                new_status = "failed"
+                conn.execute(f"UPDATE tasks SET {task_type}_status = 'failed' WHERE id = ?", (task_id,))
+                if task_type == "render":
+                    conn.execute("UPDATE render_shards SET status = 'failed' WHERE task_id = ? AND status != 'completed'",
+                                 (task_id,))
+            elif shard is not None:
+                new_status = "none"
+                conn.execute("UPDATE render_shards SET status = 'none' WHERE task_id = ? AND shard = ?", (task_id, shard))
+            else:
+                new_status = "none"
+                conn.execute(f"UPDATE tasks SET {task_type}_status = 'none' WHERE id = ?", (task_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return new_status
+
+    def requeue_orphans(self, max_age):
+        # Tasks left in "processing" by a server that stopped between claim and lease, or by versions that kept
+        # leases in memory. Other servers may be running, so recent claims whose lease isn't written yet stay
+        cutoff = datetime.now() - timedelta(seconds=max_age)
+
+        def orphaned(start_time):
+            return start_time is None or datetime.strptime(start_time, DATETIME_FORMAT) < cutoff
+
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT task_id, shard, start_time FROM render_shards s WHERE status = 'processing' "
+                                "AND NOT EXISTS (SELECT 1 FROM leases l WHERE l.task_id = s.task_id "
+                                "AND l.type = 'render' AND l.shard = s.shard)").fetchall()
+            shards = [(row["task_id"], row["shard"]) for row in rows if orphaned(row["start_time"])]
+            conn.executemany("UPDATE render_shards SET status = 'none' WHERE task_id = ? AND shard = ?", shards)
+            requeued = len(shards)
+
+            for task_type in TASK_TYPES:
+                condition = f"{task_type}_status = 'processing' AND NOT EXISTS " \
+                            f"(SELECT 1 FROM leases l WHERE l.task_id = tasks.id AND l.type = '{task_type}')"
+                if task_type == "render" and self.shards > 1:
+                    # Partly rendered models keep their finished frame ranges, only the open ones are handed out again
+                    condition += " AND id NOT IN (SELECT task_id FROM render_shards)"
+                rows = conn.execute(f"SELECT id, {task_type}_start_time AS start_time FROM tasks WHERE {condition}").fetchall()
+                ids = [(row["id"],) for row in rows if orphaned(row["start_time"])]
+                conn.executemany(f"UPDATE tasks SET {task_type}_status = 'none' WHERE id = ?", ids)
+                requeued += len(ids)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return requeued
+
+    def claim_preparation(self, task_id, node, stale_after):
+        # Taken over when the claim is older than stale_after seconds, the server holding it probably stopped
+        now = time.time()
+        return self.connection().execute(
+            "INSERT INTO preparations (task_id, node, claimed_at) VALUES (?, ?, ?) ON CONFLICT (task_id) DO UPDATE "
+            "SET node = excluded.node, claimed_at = excluded.claimed_at "
+            "WHERE preparations.node = excluded.node OR preparations.claimed_at < ?",
+            (task_id, node, now, now - stale_after)).rowcount == 1
+
+    def release_preparation(self, task_id, node):
+        self.connection().execute("DELETE FROM preparations WHERE task_id = ? AND node = ?", (task_id, node))
+
+    def preparation_node(self, task_id):
+        row = self.connection().execute("SELECT node FROM preparations WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def unhashed(self, limit):
+        return [Task(int(row["id"]), row["filename"], None, None) for row in self.connection().execute(
+            "SELECT id, filename FROM tasks WHERE content_hash IS NULL ORDER BY id LIMIT ?", (limit,))]
+
+    def set_content_hash(self, task_id, content_hash, weight=None):
+        self.connection().execute("UPDATE tasks SET content_hash = ?, weight = COALESCE(?, weight) WHERE id = ?",
+                                  (content_hash, weight, task_id))
+
+    def set_priority(self, task_id, priority):
+        self.connection().execute("UPDATE tasks SET priority = ? WHERE id = ?", (priority, task_id))
+
+    def content_hash(self, task_id):
+        row = self.connection().execute("SELECT content_hash FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def complete_unclaimed(self, task_id, task_type):
+        assert task_type in TASK_TYPES
+        return self.connection().execute(
+            f"UPDATE tasks SET {task_type}_status = 'completed', {task_type}_end_time = ? "
+            f"WHERE id = ? AND {task_type}_status = 'none'", (now_str(), task_id)).rowcount == 1
+
+    def unclaimed_with_hash(self, content_hash, task_type):
+        condition = claim_condition(task_type)
+        return [Task(int(row["id"]), row["filename"], task_type, None) for row in self.connection().execute(
+            f"SELECT id, filename FROM tasks WHERE content_hash = ? AND {condition} ORDER BY id", (content_hash,))]
+
+    def min_unfinished_id(self, task_type):
+        assert task_type in TASK_TYPES
+
+        # One index lookup per status, cost doesn't depend on the amount of finished tasks
+        min_id = None
+        for status in UNFINISHED_STATUSES:
+            row = self.connection().execute(f"SELECT MIN(id) FROM tasks WHERE {task_type}_status = ?", (status,)).fetchone()
+            if row[0] is not None and (min_id is None or row[0] < min_id):
+                min_id = row[0]
+
+        return min_id
+
+    def rows(self):
+        return [dict(row) for row in self.connection().execute(f"SELECT {', '.join(columns_list)} FROM tasks ORDER BY id")]
+
+    def count(self):
+        return self.connection().execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def page(self, after_id=None, limit=100, render_status=None, scan_status=None):
+        conditions, params = ["1"], []  # Task ids start at 0, so the first page has no id condition
+        if after_id is not None:
+            conditions.append("id > ?")
+            params.append(after_id)
+        for column, status in [("render_status", render_status), ("scan_status", scan_status)]:
+            if status is not None:  # Served by the (status, id) indexes
+                conditions.append(f"{column} = ?")
+                params.append(status)
+
+        return [dict(row) for row in self.connection().execute(
+            f"SELECT {', '.join(columns_list)} FROM tasks WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+            (*params, limit))]
+
+    def timings(self, task_type, limit=10000):
+        assert task_type in TASK_TYPES
+        return [dict(row) for row in self.connection().execute(
+            f"SELECT id, {task_type}_servername AS worker, {task_type}_start_time AS start_time, "
+            f"{task_type}_end_time AS end_time, weight FROM tasks WHERE {task_type}_status = 'completed' "
+            f"AND {task_type}_start_time IS NOT NULL AND {task_type}_end_time IS NOT NULL ORDER BY id DESC LIMIT ?",
+            (limit,))][::-1]
+
+    def status_counts(self):
+        counts = {task_type: dict() for task_type in TASK_TYPES}
+        for row in self.connection().execute("SELECT task_type, status, count FROM status_counts WHERE count > 0"):
+            counts[row["task_type"]][row["status"]] = row["count"]
+
+        return counts
+
+
+def open_task_store(db_path="tasks.db", csv_path="tasks.csv", frames=300, shards=1, journal_mode="WAL"):
+    new_database = not os.path.isfile(db_path)
+    store = SqliteTaskStore(db_path, frames, shards, journal_mode)
+
+    if new_database and os.path.isfile(csv_path):
+        imported = store.import_csv(csv_path)
+        print(f"Imported {imported} tasks from {csv_path}")
+
+    return store
@@ -0,0 +1,83 @@
+import os
+import threading
+
+from flask import send_file
+
+from cache import file_sha256
+
+etag_cache = dict()  # {absolute path: (size, mtime_ns, etag)}
+etag_lock = threading.Lock()
+
+
+def etag_path(path):
+    return path + ".etag"
+
+
+def file_etag(path):
+    # Strong ETag (sha256 of the content). Computed once per file version and kept in memory
+    # and next to the file, so a restart or another server doesn't have to hash multi GB archives again
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    with etag_lock:
+        cached = etag_cache.get(path)
+    if cached is not None and cached[:2] == key:
+        return cached[2]
+
+    try:
+        with open(etag_path(path)) as etag_file:
+            size, mtime_ns, etag = etag_file.read().split()
+        if (int(size), int(mtime_ns)) != key:
+            etag = None
+    except (OSError, ValueError):
+        etag = None
+
+    if etag is None:
+        etag = file_sha256(path)
+
+        try:
+            with open(etag_path(path), "w") as etag_file:
+                etag_file.write(f"{key[0]} {key[1]} {etag}")
+        except OSError:
+            pass
+
+    with etag_lock:
+        etag_cache[path] = (*key, etag)
+
+    return etag
+
+
+def remember_etag(path, etag):  # For files whose hash was computed while writing them
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+
+    with open(etag_path(path), "w") as etag_file:
+        etag_file.write(f"{key[0]} {key[1]} {etag}")
+    with etag_lock:
+        etag_cache[path] = (*key, etag)
+
+
+def send_task_file(path, mimetype=None):
+    # Range, If-Range and If-None-Match are handled by werkzeug once the response is conditional.
+    # Body goes through wsgi.file_wrapper (sendfile under gunicorn/uwsgi) or X-Sendfile when USE_X_SENDFILE is on
+    return send_file(os.path.abspath(path), as_attachment=True, mimetype=mimetype, conditional=True,
+                     etag=file_etag(path), max_age=0)
+
+
+def call_when_sent(response, callback):
+    # werkzeug hands file wrappers (sendfile) to the server as they are and skips call_on_close for them,
+    # so their close() is extended instead. Wrapping the body would lose sendfile
+    if response.direct_passthrough and hasattr(response.response, "close"):
+        close = response.response.close
+
+        def close_and_call():
+            try:
+                close()
+            finally:
+                callback()
+
+        response.response.close = close_and_call
+    else:
+        response.call_on_close(callback)
@@ -0,0 +1,128 @@
+import os
+import hashlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import stage
+from frame_pack import PACK_EXTENSION, unpack_file
+
+CHUNK_READ_SIZE = 2 ** 20
+
+
+class UploadError(Exception):
+    def __init__(self, status, message, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def part_path(output_dir, file_name):
+    return os.path.join(output_dir, os.path.basename(file_name) + ".part")
+
+
+def received_bytes(output_dir, file_name):  # Offset to resume from, the .part file itself is the upload state
+    try:
+        return os.path.getsize(part_path(output_dir, file_name))
+    except FileNotFoundError:
+        return 0
+
+
+def append_chunk(output_dir, file_name, offset, stream, expected_sha256=None):
+    # Appends one chunk read from stream at the given offset. A chunk with a wrong checksum is cut off again,
+    # so the worker can resend it from the same offset. Returns the new offset
+    os.makedirs(output_dir, exist_ok=True)
+    path = part_path(output_dir, file_name)
+    current = received_bytes(output_dir, file_name)
+    if offset != current:
+        raise UploadError(409, f"Expected offset {current}, got {offset}", current)
+
+    sha256 = hashlib.sha256()
+    with open(path, "ab") as part_file:
+        while True:
+            data = stream.read(CHUNK_READ_SIZE)
+            if not data:
+                break
+            sha256.update(data)
+            part_file.write(data)
+
+    if expected_sha256 is not None and sha256.hexdigest() != expected_sha256.lower():
+        os.truncate(path, current)
+        raise UploadError(422, "Chunk checksum mismatch", current)
+
+    return received_bytes(output_dir, file_name)
+
+
+def finish_part(output_dir, file_name, expected_size=None, expected_sha256=None):  # Turns .part into the final file
+    path = part_path(output_dir, file_name)
+    if not os.path.exists(path):
+        raise UploadError(404, "Nothing uploaded")
+
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise UploadError(409, f"Expected {expected_size} bytes, got {size}", size)
+
+    if expected_sha256 is not None:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as part_file:
+            for data in iter(lambda: part_file.read(CHUNK_READ_SIZE), b""):
+                sha256.update(data)
+        if sha256.hexdigest() != expected_sha256.lower():
+            os.remove(path)
+            raise UploadError(422, "File checksum mismatch", 0)
+
+    full_file_path = os.path.join(output_dir, os.path.basename(file_name))
+    os.replace(path, full_file_path)
+    return full_file_path
+
+
+def extract_verified(archive_path, output_dir, clear_files=None, keep=None):
+    # keep(member name) limits what is extracted, e.g. to the frames of a frame range, other members are skipped
+    if archive_path.endswith(PACK_EXTENSION):  # Frames as frame_pack, every record is checked while unpacking
+        for file_name in clear_files or []:
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        unpack_file(archive_path, output_dir, keep)
+        return
+
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        bad_member = zip_ref.testzip()  # Checks CRC of every member before touching the output directory
+        if bad_member is not None:
+            raise ValueError(f"Corrupted member {bad_member} in {archive_path}")
+
+        for file_name in clear_files or []:  # Results of an earlier attempt that the archive replaces
+            if os.path.exists(file_name):
+                os.remove(file_name)
+
+        members = [info for info in zip_ref.infolist() if keep is None or keep(info.filename)]
+        zip_ref.extractall(output_dir, members)
+
+        for info in members:
+            if info.is_dir():
+                continue
+            extracted_path = os.path.join(output_dir, info.filename)
+            if not os.path.isfile(extracted_path) or os.path.getsize(extracted_path) != info.file_size:
+                raise ValueError(f"{info.filename} from {archive_path} was not extracted completely")
+
+
+class Extractor:
+    # Background extraction of submitted archives. on_done(task, error) runs in the pool thread
+    # once the archive is extracted and verified, error is None on success
+
+    def __init__(self, workers=2):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="extract")
+
+    def submit(self, task, archive_path, output_dir, on_done, clear_files=None, remove_archive=False, keep=None):
+        return self.executor.submit(self.run, task, archive_path, output_dir, on_done, clear_files, remove_archive,
+                                    keep)
+
+    def run(self, task, archive_path, output_dir, on_done, clear_files, remove_archive, keep):
+        try:
+            with stage("extract"):
+                extract_verified(archive_path, output_dir, clear_files, keep)
+            if remove_archive:
+                os.remove(archive_path)
+        except Exception as e:
+            on_done(task, e)
+            return
+
+        on_done(task, None)
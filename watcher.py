@@ -0,0 +1,129 @@
+import os
+import sys
+import time
+import threading
+
+try:
+    import inotify_simple
+except ImportError:  # Optional, ./input is polled instead
+    inotify_simple = None
+
+BULK_BATCH_SIZE = 50000
+
+
+def archive_name(file_name):  # Task name of a file in ./input, None for files that aren't archives (yet)
+    if file_name.startswith('.') or file_name.endswith(".part"):  # Hidden or still being copied
+        return None
+
+    return '.'.join(file_name.split('.')[:-1]) or None
+
+
+def scan_input(input_dir):
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            name = archive_name(entry.name)
+            if name is not None and entry.is_file():
+                yield name
+
+
+def bulk_import(store, input_dir, batch_size=BULK_BATCH_SIZE):
+    # Registers every archive of input_dir, batch_size names per transaction. Returns number of new tasks
+    added = 0
+    batch = []
+    for name in scan_input(input_dir):
+        batch.append(name)
+        if len(batch) >= batch_size:
+            added += store.add_tasks(batch)
+            batch = []
+
+    if batch:
+        added += store.add_tasks(batch)
+
+    return added
+
+
+class InputWatcher:
+    # Registers archives dropped into input_dir while the server runs. inotify reports a file once it's
+    # closed after writing or moved in, the polling fallback waits until a file's size stopped changing.
+    # on_added(count) is called from the watcher thread after new tasks were stored
+
+    def __init__(self, store, input_dir, on_added=None, poll_interval=5):
+        self.store = store
+        self.input_dir = input_dir
+        self.on_added = on_added
+        self.poll_interval = poll_interval
+        self.known = set()  # File names already handed to the store, so a poll only touches new files
+        self.sizes = dict()  # {file name: size at last poll} for files that may still be growing
+        self.inotify = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        # Start before the startup import: files that exist now are left to bulk_import,
+        # anything created from here on is reported by inotify or seen by the next poll
+        if inotify_simple is not None:
+            self.inotify = inotify_simple.INotify()
+            self.inotify.add_watch(self.input_dir, inotify_simple.flags.CLOSE_WRITE | inotify_simple.flags.MOVED_TO)
+        self.known = set(os.listdir(self.input_dir))
+
+        target = self.watch if self.inotify is not None else self.poll
+        threading.Thread(target=target, name="input-watcher", daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def register(self, file_names):
+        names = [name for name in map(archive_name, file_names) if name is not None]
+        if not names:
+            return
+
+        added = self.store.add_tasks(names)
+        if added > 0:
+            print(f"Imported {added} new 3D models from {self.input_dir}")
+            if self.on_added is not None:
+                self.on_added(added)
+
+    def watch(self):
+        while not self.stopped.is_set():
+            file_names = set(event.name for event in self.inotify.read(timeout=1000, read_delay=100))  # Coalesces bursts
+            try:
+                self.register(file_names - self.known)
+                self.known.update(file_names)
+            except Exception as e:
+                print(f"Failed to import new models: {e}")
+
+    def poll(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.register(self.poll_once())
+            except Exception as e:
+                print(f"Failed to import new models: {e}")
+
+    def poll_once(self):  # Names of new files whose size is the same as on the previous poll
+        ready = []
+        sizes = dict()
+        with os.scandir(self.input_dir) as entries:
+            for entry in entries:
+                if entry.name in self.known or not entry.is_file():
+                    continue
+
+                size = entry.stat().st_size
+                if self.sizes.get(entry.name) == size:
+                    ready.append(entry.name)
+                    self.known.add(entry.name)
+                else:
+                    sizes[entry.name] = size
+
+        self.sizes = sizes
+        return ready
+
+
+if __name__ == "__main__":
+    # Bulk import mode: python watcher.py [input dir] [tasks.db], registers all archives without starting the server
+    from task_store import open_task_store
+
+    input_dir = sys.argv[1] if len(sys.argv) > 1 else "./input/"
+    db_path = sys.argv[2] if len(sys.argv) > 2 else "tasks.db"
+
+    start = time.perf_counter()
+    added = bulk_import(open_task_store(db_path), input_dir)
+    print(f"Imported {added} new 3D models in {time.perf_counter() - start:.2f}s")